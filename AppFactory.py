@@ -0,0 +1,185 @@
+"""
+Application factory for the CBR, chat and image search web app.
+
+create_app() builds one Flask app with a blueprint per subsystem: `cbr`
+(the case-based reasoning forms), `chat` (the LLM and RAG chatbot) and
+`images` (image upload and annotation). Only the blueprints that are
+enabled are imported, and the heavy state behind them - the case base,
+the models, the Vision clients, the upload store and the gallery index -
+is loaded once per process, the first time a request needs it, and then
+shared by every request.
+
+Usage:
+    APP_SUBSYSTEMS=cbr,images flask --app AppFactory:create_app run
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+
+from flask import Flask, current_app, render_template
+
+import Instrumentation
+
+BLUEPRINTS = {
+    'cbr': 'CBRRoutes',
+    'chat': 'ChatRoutes',
+    'images': 'ImageRoutes'
+}
+
+logger = logging.getLogger(__name__)
+
+
+class Subsystems:
+    """
+    Registry of the lazily loaded, process-wide state of an app.
+
+    Blueprints register a loader for each piece of state they need; get()
+    runs a loader at most once, on first use, and hands every later caller
+    the same object.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._loaders = {}
+        self._instances = {}
+        self._load_seconds = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        """
+        Register the loader of a subsystem.
+
+        Args:
+            name (str): The subsystem name, e.g. 'case_base'.
+            loader (callable): Called with the app to build the subsystem.
+        """
+        self._loaders[name] = loader
+
+    def get(self, name):
+        """
+        Return a subsystem, loading it on first use.
+
+        Args:
+            name (str): The subsystem name.
+
+        Returns:
+            The object built by the subsystem's loader.
+        """
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._loaders[name](self.app)
+                self._load_seconds[name] = time.perf_counter() - start
+                Instrumentation.log_event(
+                    logger, logging.INFO, 'subsystem.loaded', name=name,
+                    seconds=self._load_seconds[name])
+            return self._instances[name]
+
+    def preload(self, names=None):
+        """
+        Load subsystems up front instead of on their first request.
+
+        Args:
+            names (iterable): The subsystems to load. Names that no enabled
+            blueprint registered are skipped. Defaults to all of the
+            registered ones.
+        """
+        for name in names or list(self._loaders):
+            if name in self._loaders:
+                self.get(name)
+
+    def stats(self):
+        return {f"{name}_load_seconds": seconds
+                for name, seconds in self._load_seconds.items()}
+
+
+def subsystem(name):
+    """
+    Return a subsystem of the current app, loading it on first use.
+
+    Args:
+        name (str): The subsystem name.
+    """
+    return current_app.extensions['subsystems'].get(name)
+
+
+def _enabled_subsystems(subsystems):
+    if subsystems is None:
+        subsystems = os.environ.get('APP_SUBSYSTEMS', ','.join(BLUEPRINTS))
+    if isinstance(subsystems, str):
+        subsystems = [name.strip() for name in subsystems.split(',')]
+    unknown = set(subsystems) - set(BLUEPRINTS)
+    if unknown:
+        raise ValueError(f"Unknown subsystems: {', '.join(sorted(unknown))}")
+    return [name for name in BLUEPRINTS if name in subsystems]
+
+
+def create_app(subsystems=None, config=None):
+    """
+    Create the web app with the given subsystems enabled.
+
+    Args:
+        subsystems (iterable or str): The blueprints to enable, out of
+        'cbr', 'chat' and 'images', as a list or a comma-separated string.
+        Defaults to the APP_SUBSYSTEMS environment variable, or all of them.
+        config (dict): Overrides for the default configuration.
+
+    Returns:
+        flask.Flask: The application.
+    """
+    enabled = _enabled_subsystems(subsystems)
+
+    app = Flask(__name__)
+    app.config['CASE_DATABASE'] = 'FMD cases.csv'
+    # MinHashLSH arguments for approximate retrieval on very large case
+    # bases, e.g. {'bands': 16, 'rows_per_band': 2}; None retrieves exactly
+    app.config['CBR_LSH'] = None
+    # Or CaseClusters arguments for coarse-to-fine retrieval, e.g.
+    # {'clusters': 256, 'probes': 16}
+    app.config['CBR_CLUSTERS'] = None
+    # Retrieval pre-filters, e.g. {'same_sex': True, 'age_window': 0.5};
+    # None keeps every case a candidate
+    app.config['CBR_FILTERS'] = None
+    # The retrieval weights and threshold written by WeightTuning.py; the
+    # CaseBasedSystem defaults apply while the file does not exist
+    app.config['CBR_CONFIG'] = 'cbr_config.json'
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['UPLOAD_MAX_BYTES'] = 512 * 1024 * 1024
+    app.config['UPLOAD_MAX_AGE'] = 7 * 24 * 3600
+    app.config['UPLOAD_SWEEP_INTERVAL'] = 300
+    app.config['LOCAL_MATCH_THRESHOLD'] = 0.85
+    app.config['WEB_ENTITY_MIN_SCORE'] = 0.7
+    app.config['GOOGLE_APPLICATION_CREDENTIALS'] = os.environ.get(
+        'GOOGLE_APPLICATION_CREDENTIALS',
+        'vision-application-426219-627c55c923bb.json')
+    app.config['QUOTA_PROJECT_ID'] = os.environ.get(
+        'QUOTA_PROJECT_ID', 'vision-application-426219')
+    app.config.update(config or {})
+
+    registry = Subsystems(app)
+    app.extensions['subsystems'] = registry
+    Instrumentation.init_app(app)
+    Instrumentation.register_stats('subsystem', registry.stats)
+
+    for name in enabled:
+        module = importlib.import_module(BLUEPRINTS[name])
+        module.init_subsystems(registry)
+        app.register_blueprint(module.blueprint)
+
+    @app.context_processor
+    def enabled_blueprints():
+        return {'enabled_blueprints': set(app.blueprints)}
+
+    @app.route('/')
+    def home():
+        return render_template('home.html')
+
+    return app
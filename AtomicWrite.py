@@ -0,0 +1,73 @@
+"""
+Atomic replacement of files that other processes read.
+
+The new contents are written to a uniquely named temporary file next to
+the target, which then replaces it with os.replace, so readers see either
+the old file or the new one, never a partial file, and concurrent writers
+never share a temporary file.
+
+Unlike tempfile.mkstemp, which makes files private (0600), the temporary
+file takes the mode of the file it replaces, or, for a new file, the mode
+open() would give it: it is created with os.open(..., 0o666), and the
+kernel applies the process umask. App workers running as another user can
+therefore still read what a command-line tool rewrote.
+
+    with AtomicWrite.replacing('FMD cases.csv') as temp_path:
+        save_case_database(case_database, temp_path)
+
+A read-modify-write of a file that several processes change, such as the
+app's gunicorn workers, also needs locked(), which serializes it with the
+other processes through an flock on a lock file next to it.
+"""
+
+import contextlib
+import fcntl
+import os
+import shutil
+import uuid
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """
+    Replace a file with the one written to a temporary path.
+
+    Args:
+        path (str): The file to replace; it need not exist yet.
+
+    Yields:
+        str: The path of an empty temporary file in the same directory.
+        When the block completes, it replaces `path`; when it raises, it
+        is deleted and `path` is left as it was.
+    """
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    os.close(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                     0o666))
+    try:
+        try:
+            shutil.copymode(path, temp_path)
+        except FileNotFoundError:
+            pass
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+@contextlib.contextmanager
+def locked(path):
+    """
+    Hold an exclusive lock on a file across processes.
+
+    The lock is an flock on `path` + '.lock', which is created if needed
+    and kept afterwards, so the file itself can be replaced while locked.
+
+    Args:
+        path (str): The file to lock.
+    """
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Released when the lock file is closed
+        yield
@@ -0,0 +1,271 @@
+"""
+Local BM25 retrieval over the chunks of the RAG knowledge base.
+
+Raw_Text_Data.txt is split into chunks, one per non-empty line (mostly a
+question and its answer), with long lines split at sentence boundaries;
+the RAG document store embeds the same chunks. They are indexed as an
+inverted index from term to the chunks containing it, with term
+frequencies, and stored in a single .npz file next to the text. The
+index records the text's SHA-256, and open_index rebuilds it when the text
+changes.
+
+search() scores the chunks sharing a term with the query with Okapi BM25,
+on the machine, so a RAG query can retrieve without the remote embedding
+call (RAG_RETRIEVER=bm25). reciprocal_rank_fusion() merges its ranking
+with the embedding retriever's (RAG_RETRIEVER=hybrid). See
+RetreivalAugmentedGeneration.py and benchmarks/bench_rag_retrieval.py.
+
+Usage:
+    python BM25Retriever.py build Raw_Text_Data.txt
+    python BM25Retriever.py query "Do bulls show signs of Trichomoniasis?"
+"""
+
+import argparse
+import hashlib
+import os
+import re
+
+import numpy as np
+
+import AtomicWrite
+
+DEFAULT_TEXT_PATH = 'Raw_Text_Data.txt'
+DEFAULT_INDEX_PATH = 'rag_bm25_index.npz'
+MAX_CHUNK_WORDS = 120
+# The usual Okapi BM25 parameters: term frequency saturation and length
+# normalisation
+K1 = 1.2
+B = 0.75
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how if in into is it
+its of on or should such that the their them these they this to was what
+when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    """
+    Split text into index terms: lowercase words without stopwords, with
+    plurals reduced to the singular ("bulls" -> "bull", "flies" -> "fly").
+
+    Returns:
+        list: The terms, in text order.
+    """
+    terms = []
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith('ies'):
+            word = word[:-3] + 'y'
+        elif len(word) > 3 and word.endswith('s') and \
+                not word.endswith(('ss', 'us', 'is')):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def chunk_text(text, max_words=MAX_CHUNK_WORDS):
+    """
+    Split the knowledge base into retrieval chunks.
+
+    Args:
+        text (str): The text, e.g. the contents of Raw_Text_Data.txt.
+        max_words (int): The size above which a line is split into groups
+        of whole sentences.
+
+    Returns:
+        list: The chunks, in text order; a repeated chunk is kept once.
+    """
+    chunks = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line.split()) <= max_words:
+            chunks.append(line)
+            continue
+        chunk = []
+        for sentence in re.split(r'(?<=[.!?])\s+', line):
+            words = len(sentence.split())
+            if chunk and len(' '.join(chunk).split()) + words > max_words:
+                chunks.append(' '.join(chunk))
+                chunk = []
+            chunk.append(sentence)
+        if chunk:
+            chunks.append(' '.join(chunk))
+    # The document store rejects duplicate documents
+    return list(dict.fromkeys(chunks))
+
+
+def _text_sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def build_index(text_path=DEFAULT_TEXT_PATH, index_path=DEFAULT_INDEX_PATH):
+    """
+    Chunk a text file and write its inverted index.
+
+    Args:
+        text_path (str): The knowledge base text.
+        index_path (str): Where to write the .npz index.
+
+    Returns:
+        int: The number of chunks indexed.
+    """
+    with open(text_path, encoding='utf-8') as file:
+        text = file.read()
+    chunks = chunk_text(text)
+
+    postings = {}
+    lengths = []
+    for position, chunk in enumerate(chunks):
+        terms = tokenize(chunk)
+        lengths.append(len(terms))
+        for term in terms:
+            frequencies = postings.setdefault(term, {})
+            frequencies[position] = frequencies.get(position, 0) + 1
+
+    terms = sorted(postings)
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(postings[term]) for term in terms])
+    chunk_ids = np.array([position for term in terms
+                          for position in postings[term]], dtype=np.int32)
+    frequencies = np.array([count for term in terms
+                            for count in postings[term].values()],
+                           dtype=np.int32)
+
+    # Swapped in whole, so readers never load a partial index
+    with AtomicWrite.replacing(index_path) as temp_path:
+        with open(temp_path, 'wb') as file:
+            np.savez(
+                file,
+                chunks=np.array(chunks, dtype=str),
+                terms=np.array(terms, dtype=str),
+                indptr=indptr,
+                chunk_ids=chunk_ids,
+                frequencies=frequencies,
+                lengths=np.array(lengths, dtype=np.int32),
+                sha256=np.array(_text_sha256(text)))
+    return len(chunks)
+
+
+def load_index(index_path=DEFAULT_INDEX_PATH, text_path=None):
+    """
+    Load an index written by build_index.
+
+    Args:
+        index_path (str): The path to the .npz index.
+        text_path (str): The text the index must match. Defaults to None,
+        no check.
+
+    Returns:
+        dict: The index arrays, plus the 'term_ids' lookup and the BM25
+        length 'norms' of the chunks; None if the index does not exist or
+        was built from another version of the text.
+    """
+    if not os.path.exists(index_path):
+        return None
+    with np.load(index_path) as data:
+        index = {key: data[key] for key in data.files}
+    if text_path is not None:
+        with open(text_path, encoding='utf-8') as file:
+            if _text_sha256(file.read()) != str(index['sha256']):
+                return None
+
+    index['term_ids'] = {str(term): term_id
+                         for term_id, term in enumerate(index['terms'])}
+    lengths = index['lengths']
+    average = max(lengths.mean(), 1) if len(lengths) else 1
+    index['norms'] = K1 * (1 - B + B * lengths / average)
+    return index
+
+
+def open_index(text_path=DEFAULT_TEXT_PATH, index_path=DEFAULT_INDEX_PATH):
+    """Load the index of a text, rebuilding it if it is missing or stale."""
+    index = load_index(index_path, text_path)
+    if index is None:
+        build_index(text_path, index_path)
+        index = load_index(index_path)
+    return index
+
+
+def search(index, query, top_k=5):
+    """
+    Rank the chunks of an index against a query with BM25.
+
+    Args:
+        index (dict): An index from load_index.
+        query (str): The question.
+        top_k (int): The maximum number of chunks to return.
+
+    Returns:
+        list: (chunk position, score) tuples, best first; chunks sharing no
+        term with the query are left out.
+    """
+    indptr = index['indptr']
+    chunk_ids = index['chunk_ids']
+    frequencies = index['frequencies']
+    norms = index['norms']
+    count = len(norms)
+    scores = np.zeros(count)
+    for term in set(tokenize(query)):
+        term_id = index['term_ids'].get(term)
+        if term_id is None:
+            continue
+        start, end = indptr[term_id], indptr[term_id + 1]
+        chunks = chunk_ids[start:end]
+        tf = frequencies[start:end]
+        idf = np.log(1 + (count - (end - start) + 0.5) / (end - start + 0.5))
+        scores[chunks] += idf * tf * (K1 + 1) / (tf + norms[chunks])
+
+    matched = np.flatnonzero(scores)
+    best = matched[np.argsort(-scores[matched], kind='stable')][:top_k]
+    return [(int(position), float(scores[position])) for position in best]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Merge rankings of the same items by reciprocal rank fusion: an item
+    scores the sum of 1 / (k + rank) over the rankings that contain it.
+
+    Args:
+        rankings (list): Lists of items (any hashable keys), best first.
+        k (int): Damps the weight of the top ranks.
+
+    Returns:
+        list: Every item, best fused score first; ties keep the order in
+        which the items were first seen.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0) + 1 / (k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='index the knowledge base')
+    build.add_argument('text_path', nargs='?', default=DEFAULT_TEXT_PATH)
+    build.add_argument('--index', default=DEFAULT_INDEX_PATH)
+
+    query = commands.add_parser('query', help='search the knowledge base')
+    query.add_argument('question')
+    query.add_argument('--text', default=DEFAULT_TEXT_PATH)
+    query.add_argument('--index', default=DEFAULT_INDEX_PATH)
+    query.add_argument('--top-k', type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        count = build_index(args.text_path, args.index)
+        print(f"Indexed {count} chunks to {args.index}")
+    else:
+        index = open_index(args.text, args.index)
+        for position, score in search(index, args.question, args.top_k):
+            print(f"{score:6.2f}  {index['chunks'][position][:100]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Case-based reasoning blueprint: the case entry form, diagnosis, the
+review of cases that could not be diagnosed, and per-diagnosis statistics
+as JSON (/api/stats).
+"""
+
+import json
+import logging
+import os
+import threading
+
+from flask import (Blueprint, jsonify, redirect, render_template, request,
+                   url_for)
+
+import AtomicWrite
+import CaseClusters
+import CaseIndex
+import CaseSnapshot
+import Instrumentation
+import MinHashLSH
+import SymptomNormalizer
+from AppFactory import subsystem
+from CaseBasedSystem import (
+    diagnose_and_treat, predict_prognosis, save_case_database, append_cases,
+    case_id_number, next_case_id, load_retrieval_config,
+    weights as default_weights
+)
+
+blueprint = Blueprint('cbr', __name__)
+logger = logging.getLogger(__name__)
+
+# The diagnosis recorded for cases that matched nothing
+UNKNOWN_DIAGNOSIS = "No similar cases found."
+
+
+class CaseIdAllocator:
+    """
+    Hands out case IDs that only ever count up, even across restarts.
+
+    The highest number issued is saved in a small JSON file next to the case
+    database before the ID is returned, so the ID of a case that was
+    deleted, or of a case whose write was lost, is never issued again. The
+    file is read and updated under a lock shared with the other processes
+    (see AtomicWrite.locked), so two workers never issue the same ID.
+
+    Args:
+        path (str): The JSON file, e.g. 'FMD cases.ids.json'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last = 0
+
+    def _saved(self):
+        try:
+            with open(self.path, 'r') as file:
+                return int(json.load(file)['last'])
+        except (FileNotFoundError, ValueError, KeyError):
+            return 0
+
+    def observe(self, case_ids):
+        """Make sure later IDs are above every one of case_ids."""
+        with self._lock:
+            self._last = max([self._last] + [
+                case_id_number(case_id) for case_id in case_ids])
+
+    def allocate(self):
+        """Return a new case ID, e.g. 'CASE404'."""
+        with self._lock, AtomicWrite.locked(self.path):
+            # Another process may have issued IDs since our last one
+            case_id = next_case_id((), max(self._last, self._saved()))
+            self._last = case_id_number(case_id)
+            with AtomicWrite.replacing(self.path) as temp_path:
+                with open(temp_path, 'w') as file:
+                    json.dump({'last': self._last}, file)
+            return case_id
+
+
+class CaseBase:
+    """
+    The case database CSV and its in-memory CaseIndex, shared between
+    requests.
+
+    The index is built from the file's binary snapshot (see CaseSnapshot)
+    and rebuilt only when another process changes the file. Changes made
+    here are applied to the index incrementally and written through to the
+    file under a lock shared with the other processes, after reloading the
+    file if one of them changed it: a new case is appended to it, an edited
+    case rewrites it atomically. Readers take a view of the index and never
+    wait for a writer.
+
+    Args:
+        file_path (str): The path of the case database CSV.
+        lsh (dict): MinHashLSH arguments (e.g. {'bands': 16,
+        'rows_per_band': 2}) to retrieve approximately among the LSH
+        candidates only. Defaults to None, exact retrieval.
+        clusters (dict): CaseClusters arguments (e.g. {'clusters': 256,
+        'probes': 16}) to retrieve approximately among the members of the
+        nearest clusters only. Defaults to None, exact retrieval. At most
+        one of lsh and clusters may be given.
+        filters (dict): Pre-filters for every retrieval, the same_sex and
+        age_window arguments of IndexView.retrieve, e.g. {'same_sex':
+        True}. Defaults to None, no filter.
+        weights (dict): The feature weights of retrieval. Defaults to
+        CaseBasedSystem.weights.
+        similarity_threshold (float): The minimum similarity score of a
+        retrieved case. Defaults to 0.5.
+    """
+
+    def __init__(self, file_path, lsh=None, clusters=None, filters=None,
+                 weights=None, similarity_threshold=0.5):
+        if lsh is not None and clusters is not None:
+            raise ValueError("Configure either LSH or clusters, not both")
+        self.file_path = file_path
+        self.lsh = lsh
+        self.clusters = clusters
+        self.filters = filters or {}
+        self.weights = weights or default_weights
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.RLock()
+        self._index = None
+        self._stat = None
+        self._ids = CaseIdAllocator(
+            os.path.splitext(file_path)[0] + '.ids.json')
+
+    def exists(self):
+        return os.path.exists(self.file_path)
+
+    def _file_stat(self):
+        stat = os.stat(self.file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def view(self):
+        """
+        Return a view of the current cases, rebuilding the index if the
+        file was changed by someone else.
+
+        Returns:
+            CaseIndex.IndexView: The view.
+        """
+        stat = self._file_stat()
+        index = self._index
+        hit = index is not None and stat == self._stat
+        Instrumentation.record_cache('case_base', hit)
+        if hit:
+            return index.view()
+
+        with self._lock:
+            stat = self._file_stat()
+            if self._index is None or stat != self._stat:
+                index = CaseIndex.CaseIndex.from_snapshot(
+                    CaseSnapshot.open_snapshot(self.file_path))
+                index.add_index(
+                    'diagnosis', lambda: CaseIndex.FieldIndex('Diagnosis'))
+                index.add_index('stats', CaseIndex.DiagnosisStats)
+                if self.lsh is not None:
+                    index.add_index('minhash', lambda: MinHashLSH.MinHashLSH(
+                        **self.lsh))
+                if self.filters:
+                    index.add_index('age', lambda: CaseIndex.AgeIndex(
+                        partition='Animal Sex'))
+                if self.clusters is not None:
+                    index.add_index(
+                        'clusters', lambda: CaseClusters.CaseClusters(
+                            weights=self.weights, **self.clusters))
+                self._ids.observe(index.view().case_ids())
+                self._index = index
+                self._stat = stat
+            return self._index.view()
+
+    def retrieve(self, view, new_case, similarity_threshold=None, top_n=3):
+        """
+        Retrieve the most similar cases of a view, approximately if the
+        case base was configured with LSH or clusters. The threshold
+        defaults to self.similarity_threshold.
+
+        Returns:
+            list: (case ID, case dictionary, similarity score) tuples.
+        """
+        weights = self.weights
+        if similarity_threshold is None:
+            similarity_threshold = self.similarity_threshold
+        if self.lsh is not None:
+            return view.derived('minhash').retrieve(
+                view, new_case, weights, similarity_threshold, top_n,
+                **self.filters)
+        if self.clusters is not None:
+            return view.derived('clusters').retrieve(
+                view, new_case, weights, similarity_threshold, top_n,
+                **self.filters)
+        return view.retrieve(new_case, weights, similarity_threshold, top_n,
+                             **self.filters)
+
+    def unknown_cases(self):
+        """Return the cases still waiting for a diagnosis, in file order."""
+        view = self.view()
+        return view.derived('diagnosis').cases(view, UNKNOWN_DIAGNOSIS)
+
+    def stats(self, diagnosis=None):
+        """
+        Return the case, treatment and outcome counts per diagnosis (see
+        CaseIndex.DiagnosisStats), without reading the cases.
+
+        Args:
+            diagnosis (str): Only report this diagnosis. Defaults to None,
+            every diagnosis.
+
+        Returns:
+            dict: The number of cases, and the summary of each diagnosis
+            under 'diagnoses', most cases first; or the summary of the
+            given diagnosis, None if no case has it.
+        """
+        view = self.view()
+        stats = view.derived('stats')
+        if diagnosis is not None:
+            return stats.summary(view, diagnosis)
+        return {'cases': len(view), 'diagnoses': stats.summaries(view)}
+
+    def add_case(self, new_case, diagnosis, treatment, outcome,
+                 similarity_threshold=None, similar_cases=None):
+        """
+        Record a new case unless a similar one exists, like
+        update_case_database.
+
+        Args:
+            new_case (dict): The symptoms, age, sex and environment.
+            diagnosis (str): The diagnosis to record.
+            treatment (list): The treatments to record.
+            outcome (str): The outcome to record.
+            similarity_threshold (float): The score above which an existing
+            case counts as similar. Defaults to self.similarity_threshold.
+            similar_cases (list): The similar cases the caller already
+            retrieved for the new case at this threshold. Defaults to None,
+            which retrieves them.
+
+        Returns:
+            str: The new case's ID, or None if a similar case exists.
+        """
+        with self._lock, AtomicWrite.locked(self.file_path):
+            # Another worker may have changed the file; view() reloads it
+            view = self.view()
+            if similar_cases is None:
+                similar_cases = self.retrieve(
+                    view, new_case, similarity_threshold, top_n=1)
+            if similar_cases:
+                return None
+            case_id = self._ids.allocate()
+            case = {
+                'Symptoms': new_case['Symptoms'],
+                'Animal Age (Months)': new_case['Animal Age (Months)'],
+                'Animal Sex': new_case['Animal Sex'],
+                'Environmental Conditions':
+                    new_case['Environmental Conditions'],
+                'Diagnosis': diagnosis,
+                'Treatment': treatment,
+                'Outcome': outcome
+            }
+            self._index.insert(case_id, case)
+            append_cases({case_id: case}, self.file_path)
+            self._stat = self._file_stat()
+            return case_id
+
+    def update_case(self, case_id, diagnosis, treatment, outcome):
+        """
+        Set the diagnosis, treatment and outcome of a case, like
+        CaseBasedSystem.update_case. Unknown case IDs are ignored.
+        """
+        with self._lock, AtomicWrite.locked(self.file_path):
+            case = self.view().get(case_id)
+            if case is None:
+                return
+            self._index.update(case_id, dict(
+                case, Diagnosis=diagnosis, Treatment=treatment,
+                Outcome=outcome))
+            self._rewrite()
+            self._stat = self._file_stat()
+
+    def _rewrite(self):
+        with AtomicWrite.replacing(self.file_path) as temp_path:
+            save_case_database(self._index.view().to_case_database(),
+                               temp_path)
+
+
+def _load_case_base(app):
+    weights, similarity_threshold = load_retrieval_config(
+        app.config['CBR_CONFIG'])
+    case_base = CaseBase(app.config['CASE_DATABASE'],
+                         lsh=app.config['CBR_LSH'],
+                         clusters=app.config['CBR_CLUSTERS'],
+                         filters=app.config['CBR_FILTERS'],
+                         weights=weights,
+                         similarity_threshold=similarity_threshold)
+    if case_base.exists():
+        case_base.view()
+    return case_base
+
+
+def init_subsystems(registry):
+    registry.register('case_base', _load_case_base)
+
+
+@blueprint.route('/CBR system')
+def index():
+    return render_template('index.html')
+
+
+@blueprint.route('/submit', methods=['POST'])
+def submit():
+    symptoms = SymptomNormalizer.split_symptoms(request.form['symptoms'])
+    animal_age = int(request.form['animal_age'])
+    animal_sex = request.form['animal_sex']
+    environmental_conditions = request.form['environmental_conditions']
+
+    new_case = {
+        'Symptoms': symptoms,
+        'Animal Age (Months)': animal_age,
+        'Animal Sex': animal_sex,
+        'Environmental Conditions': environmental_conditions
+    }
+
+    case_base = subsystem('case_base')
+    if not case_base.exists():
+        return render_template(
+            'result.html', diagnosis="Error: Case database not found.",
+            treatment=[], prognosis="N/A", similar_cases=[])
+    view = case_base.view()
+
+    Instrumentation.log_event(
+        logger, logging.DEBUG, 'cbr.submit', new_case=new_case,
+        case_count=len(view))
+
+    similarity_threshold = case_base.similarity_threshold
+    similar_cases = case_base.retrieve(
+        view, new_case, similarity_threshold, top_n=3)
+
+    Instrumentation.record_retrieval(similar_cases)
+    Instrumentation.log_event(
+        logger, logging.DEBUG, 'cbr.retrieved',
+        similar_cases=[(case_id, score)
+                       for case_id, _, score in similar_cases])
+
+    if similar_cases:
+        diagnosis, treatment = diagnose_and_treat(new_case, similar_cases)
+        prognosis = predict_prognosis(new_case, similar_cases)
+    else:
+        # Nothing reaches the threshold: record the case so a vet can
+        # diagnose it from the unknown cases page
+        Instrumentation.log_event(logger, logging.DEBUG, 'cbr.no_match')
+        diagnosis = UNKNOWN_DIAGNOSIS
+        treatment = []
+        prognosis = "N/A"
+        outcome = "Not determined yet"
+        case_base.add_case(new_case, diagnosis, treatment, outcome,
+                           similarity_threshold, similar_cases)
+
+    return render_template('result.html', diagnosis=diagnosis,
+                           treatment=treatment, prognosis=prognosis,
+                           similar_cases=similar_cases)
+
+
+@blueprint.route('/unknown_cases')
+def unknown_cases():
+    case_base = subsystem('case_base')
+    if case_base.exists():
+        return render_template('unknown_cases.html',
+                               cases=case_base.unknown_cases())
+    else:
+        return render_template('unknown_cases.html', cases={})
+
+
+@blueprint.route('/api/stats')
+def stats():
+    case_base = subsystem('case_base')
+    if not case_base.exists():
+        return jsonify({'error': "Case database not found."}), 404
+    diagnosis = request.args.get('diagnosis')
+    result = case_base.stats(diagnosis)
+    if result is None:
+        return jsonify({'error': f"No cases of {diagnosis}."}), 404
+    return jsonify(result)
+
+
+@blueprint.route('/edit_case/<case_id>', methods=['GET', 'POST'])
+def edit_case(case_id):
+    case_base = subsystem('case_base')
+    if case_base.exists():
+        if request.method == 'POST':
+            diagnosis = request.form['diagnosis']
+            treatment = request.form['treatment'].split(',')
+            outcome = request.form['outcome']
+            case_base.update_case(case_id, diagnosis, treatment, outcome)
+            return redirect(url_for('cbr.unknown_cases'))
+
+        case = case_base.view().get(case_id)
+        return render_template('update_case.html', case=case, case_id=case_id)
+    else:
+        return render_template('update_case.html', case=None, case_id=case_id)
@@ -0,0 +1,292 @@
+"""
+Offline maintenance of the case database: a smaller, prototype-based case
+base that diagnoses like the full one.
+
+The case CSV holds many near-identical cases (the same symptoms, diagnosis
+and treatment at slightly different ages). Each one costs retrieval time
+without changing what diagnose_and_treat returns. condense() reduces the
+case base in up to three steps, all using calculate_overall_similarity and
+the app's retrieval:
+
+1. Merge. A case is merged into an earlier prototype with the same
+   diagnosis, treatment, outcome and normalized symptom terms when their
+   overall similarity is at least merge_threshold. The prototype is the
+   first case of the group, with a Count of the cases it stands for;
+   diagnose_and_treat and predict_prognosis weight its votes by that
+   count, so the group still votes as strongly as its cases did, and the
+   counts of each diagnosis, treatment and outcome are unchanged.
+2. Edit (optional, Wilson editing). A single-case prototype whose top_n
+   nearest prototypes agree on another diagnosis is dropped as noise.
+3. Condense (optional, Hart's condensed nearest neighbour). Prototypes
+   that the kept ones already diagnose correctly are absorbed, with their
+   count, into the most similar kept prototype with the same diagnosis.
+
+Editing and condensing keep the diagnoses but not the outcome counts:
+they drop or absorb prototypes whatever their treatment and outcome.
+
+Cases still waiting for a diagnosis ("No similar cases found.") are kept
+as they are. evaluate() diagnoses sample cases of the full base against
+both bases and reports the share of them on which the diagnoses agree.
+
+The result is an ordinary case CSV with an extra Count column; point the
+app's CASE_DATABASE at it to serve it.
+
+Usage:
+    python CaseBaseMaintenance.py "FMD cases.csv" "FMD cases.condensed.csv"
+    python CaseBaseMaintenance.py "FMD cases.csv" out.csv --edit --condense
+"""
+
+import argparse
+import random
+
+import AtomicWrite
+import CaseBasedSystem
+import CaseIndex
+import SymptomNormalizer
+
+
+def _group_key(case):
+    terms, _ = SymptomNormalizer.normalize_symptoms(case['Symptoms'])
+    return (case['Diagnosis'], tuple(case['Treatment']), case['Outcome'],
+            frozenset(terms))
+
+
+def _diagnosis(view, case, weights, similarity_threshold, top_n,
+               exclude=None):
+    similar_cases = view.retrieve(
+        case, weights, similarity_threshold, top_n + (exclude is not None))
+    similar_cases = [
+        similar for similar in similar_cases if similar[0] != exclude][:top_n]
+    diagnosis, _ = CaseBasedSystem.diagnose_and_treat(case, similar_cases)
+    return diagnosis, similar_cases
+
+
+def merge_redundant(case_database, weights, merge_threshold=0.9):
+    """
+    Merge near-identical cases into prototypes with a Count.
+
+    Args:
+        case_database (dict): Case ID -> case; cases may already carry a
+        Count.
+        weights (dict): The weight of each feature.
+        merge_threshold (float): The minimum overall similarity between a
+        case and the prototype it is merged into.
+
+    Returns:
+        dict: Case ID -> prototype, in database order.
+    """
+    prototypes = {}
+    groups = {}
+    for case_id, case in case_database.items():
+        group = groups.setdefault(_group_key(case), [])
+        for prototype_id in group:
+            prototype = prototypes[prototype_id]
+            if CaseBasedSystem.calculate_overall_similarity(
+                    case, prototype, weights) >= merge_threshold:
+                prototype['Count'] = (
+                    CaseBasedSystem.case_weight(prototype) +
+                    CaseBasedSystem.case_weight(case))
+                break
+        else:
+            prototypes[case_id] = dict(case)
+            group.append(case_id)
+    return prototypes
+
+
+def edit_noise(prototypes, weights, similarity_threshold=0.5, top_n=3):
+    """
+    Drop single-case prototypes that their neighbours diagnose differently.
+
+    Returns:
+        dict: The remaining prototypes.
+    """
+    view = CaseIndex.CaseIndex.from_case_database(prototypes).view()
+    edited = {}
+    for case_id, case in prototypes.items():
+        if CaseBasedSystem.case_weight(case) == 1:
+            diagnosis, _ = _diagnosis(view, case, weights,
+                                      similarity_threshold, top_n, case_id)
+            if diagnosis not in ("Unknown", case['Diagnosis']):
+                continue
+        edited[case_id] = case
+    return edited
+
+
+def condense_nearest(prototypes, weights, similarity_threshold=0.5,
+                     top_n=3):
+    """
+    Keep a subset of the prototypes that diagnoses all of them correctly.
+
+    Prototypes are visited largest count first; one that the kept ones
+    misdiagnose is kept, until a pass keeps none. The others are then
+    absorbed into a kept prototype.
+
+    Returns:
+        dict: The kept prototypes, in database order, with the absorbed
+        counts added to theirs.
+    """
+    visit = sorted(prototypes, key=lambda case_id: -CaseBasedSystem.
+                   case_weight(prototypes[case_id]))
+    index = CaseIndex.CaseIndex()
+    kept = set()
+    for case_id in visit:
+        if prototypes[case_id]['Diagnosis'] not in {
+                prototypes[other]['Diagnosis'] for other in kept}:
+            kept.add(case_id)
+            index.insert(case_id, prototypes[case_id])
+
+    changed = True
+    while changed:
+        changed = False
+        for case_id in visit:
+            if case_id in kept:
+                continue
+            case = prototypes[case_id]
+            diagnosis, _ = _diagnosis(index.view(), case, weights,
+                                      similarity_threshold, top_n)
+            if diagnosis != case['Diagnosis']:
+                kept.add(case_id)
+                index.insert(case_id, case)
+                changed = True
+
+    condensed = {case_id: dict(prototypes[case_id])
+                 for case_id in prototypes if case_id in kept}
+    view = index.view()
+    for case_id in visit:
+        if case_id in kept:
+            continue
+        case = prototypes[case_id]
+        _, similar_cases = _diagnosis(view, case, weights,
+                                      similarity_threshold, top_n)
+        # The diagnosis is right, so some retrieved case shares it
+        target = next(similar_id for similar_id, similar, _ in similar_cases
+                      if similar['Diagnosis'] == case['Diagnosis'])
+        condensed[target]['Count'] = (
+            CaseBasedSystem.case_weight(condensed[target]) +
+            CaseBasedSystem.case_weight(case))
+    return condensed
+
+
+def condense(case_database, weights, merge_threshold=0.9, edit=False,
+             condense_prototypes=False, similarity_threshold=0.5, top_n=3):
+    """
+    Reduce a case database to prototypes; see the module docstring.
+
+    Args:
+        case_database (dict): Case ID -> case.
+        weights (dict): The weight of each feature.
+        merge_threshold (float): See merge_redundant.
+        edit (bool): Whether to apply edit_noise.
+        condense_prototypes (bool): Whether to apply condense_nearest.
+        similarity_threshold (float): The retrieval threshold of the app.
+        top_n (int): The number of cases the app retrieves.
+
+    Returns:
+        tuple: The condensed case database, and a dictionary with the
+        number of cases at each step.
+    """
+    pending = CaseBasedSystem.fetch_unknown_diagnosis_cases(case_database)
+    cases = {case_id: case for case_id, case in case_database.items()
+             if case_id not in pending}
+    report = {'cases': len(case_database), 'pending': len(pending)}
+
+    prototypes = merge_redundant(cases, weights, merge_threshold)
+    report['merged'] = len(prototypes)
+    if edit:
+        prototypes = edit_noise(
+            prototypes, weights, similarity_threshold, top_n)
+        report['edited'] = len(prototypes)
+    if condense_prototypes:
+        prototypes = condense_nearest(
+            prototypes, weights, similarity_threshold, top_n)
+        report['condensed'] = len(prototypes)
+
+    condensed = {case_id: prototypes.get(case_id, case)
+                 for case_id, case in case_database.items()
+                 if case_id in prototypes or case_id in pending}
+    report['kept'] = len(condensed)
+    report['removed'] = len(case_database) - len(condensed)
+    return condensed, report
+
+
+def evaluate(case_database, condensed, weights, similarity_threshold=0.5,
+             top_n=3, sample=1000, seed=0):
+    """
+    Compare the diagnoses of the full and the condensed case base.
+
+    Each query is a case of the full base, retrieved against each base as
+    the app would. Diagnoses that only differ in surrounding spaces agree.
+
+    Args:
+        sample (int): The number of cases to query with, or None for all.
+        seed (int): The seed of the sample.
+
+    Returns:
+        float: The share of the queries with the same diagnosis.
+    """
+    pending = CaseBasedSystem.fetch_unknown_diagnosis_cases(case_database)
+    case_ids = [case_id for case_id in case_database
+                if case_id not in pending]
+    if sample is not None and sample < len(case_ids):
+        case_ids = random.Random(seed).sample(case_ids, sample)
+    if not case_ids:
+        return 1.0
+
+    full = CaseIndex.CaseIndex.from_case_database(case_database).view()
+    reduced = CaseIndex.CaseIndex.from_case_database(condensed).view()
+    agree = 0
+    for case_id in case_ids:
+        case = case_database[case_id]
+        expected, _ = _diagnosis(full, case, weights, similarity_threshold,
+                                 top_n)
+        diagnosis, _ = _diagnosis(reduced, case, weights,
+                                  similarity_threshold, top_n)
+        # The CSV spells some diagnoses with stray spaces (' Mastitis')
+        agree += diagnosis.strip() == expected.strip()
+    return agree / len(case_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('csv_path', nargs='?', default='FMD cases.csv')
+    parser.add_argument('output_path', nargs='?',
+                        default='FMD cases.condensed.csv')
+    parser.add_argument('--merge-threshold', type=float, default=0.9)
+    parser.add_argument('--edit', action='store_true',
+                        help='drop single cases their neighbours '
+                        'diagnose differently')
+    parser.add_argument('--condense', action='store_true',
+                        help="absorb the prototypes the others diagnose "
+                        "correctly (Hart's CNN)")
+    parser.add_argument('--sample', type=int, default=1000,
+                        help='cases to measure the agreement on')
+    parser.add_argument('--config', default='cbr_config.json',
+                        help="the weights and threshold (WeightTuning.py)")
+    args = parser.parse_args()
+
+    # The app's weights and threshold, so prototypes are chosen by the
+    # similarity the app retrieves with
+    weights, similarity_threshold = CaseBasedSystem.load_retrieval_config(
+        args.config)
+    case_database = CaseBasedSystem.load_case_database(args.csv_path)
+    condensed, report = condense(
+        case_database, weights, args.merge_threshold, args.edit,
+        args.condense, similarity_threshold)
+    # save_case_database writes the header to the empty temporary file
+    with AtomicWrite.replacing(args.output_path) as temp_path:
+        CaseBasedSystem.save_case_database(condensed, temp_path)
+    agreement = evaluate(case_database, condensed, weights,
+                         similarity_threshold, sample=args.sample)
+
+    steps = ', '.join(f"{step} {report[step]}" for step in
+                      ('merged', 'edited', 'condensed') if step in report)
+    print(f"{report['cases']} cases ({report['pending']} awaiting a "
+          f"diagnosis); prototypes after each step: {steps}")
+    print(f"Wrote {report['kept']} cases to {args.output_path}, "
+          f"{report['removed']} removed "
+          f"({report['removed'] / max(report['cases'], 1):.1%})")
+    print(f"Diagnosis agreement with the full case base: {agreement:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,16 @@
 #!/usr/bin/env python
 # coding: utf-8
+"""
+Case-based reasoning over the FMD case database: loading and saving the
+cases, similarity measures, retrieval, diagnosis, treatment and prognosis,
+and case base updates.
+
+Importing the module only defines these; it reads no file. Run it to
+diagnose a case typed in at the prompt:
+
+    python CaseBasedSystem.py "FMD cases.csv"
+    python CaseBasedSystem.py --show-cases
+"""
 
 # # **1.DATA PRE-PROCESSING.**
 #
@@ -7,77 +18,68 @@
 # In[1]:
 
 
+import argparse
 import csv
 import difflib
+import io
+import json
+import math
+import re
 from collections import Counter, defaultdict
 import os
+import SymptomNormalizer
 # import sys
 # from datetime import datetime
 
 
-file_path = 'FMD cases.csv'
-
-
-def preprocess_dataset(file_path):
+def load_case_database(file_path):
     """
-    Preprocess the dataset by converting it into a dictionary format.
+    Load the case database from a CSV file.
 
     Args:
-        file_path (str): The path to the CSV file containing the dataset.
+        file_path (str): The path to the CSV file containing the case database.
 
     Returns:
-        dict: A dictionary representing the dataset, where each case is a
-        dictionary containing the input parameters,
-              diagnosis, treatment, and outcome.
+        dict: A dictionary representing the case database.
     """
     case_database = {}
 
-    # Open the CSV file
-    with open(file_path, 'r') as file:
-        reader = csv.DictReader(file)
-
-        # Iterate over each row (case) in the CSV file
-        for row in reader:
-            case_id = row['Case ID']
-            symptoms = row['Symptoms'].split(', ')
-            # Split the symptoms into a list
-            age = int(row['Animal Age (Months)'])
-            sex = row['Animal Sex']
-            environmental_conditions = row['Environmental Conditions']
-            diagnosis = row['Diagnosis']
-            treatment = row['Treatment'].split(', ')
-            # Split the treatment into a list
-            outcome = row['Outcome']
-
-            # Create a dictionary for the current case
-            case = {
-                'Symptoms': symptoms,
-                'Animal Age (Months)': age,
-                'Animal Sex': sex,
-                'Environmental Conditions': environmental_conditions,
-                'Diagnosis': diagnosis,
-                'Treatment': treatment,
-                'Outcome': outcome
-            }
-
-            # Add the case to the case database
-            case_database[case_id] = case
+    try:
+        with open(file_path, 'r') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                case_id = row['Case ID']
+                symptoms = row['Symptoms'].split(', ')
+                age = int(row['Animal Age (Months)'])
+                sex = row['Animal Sex']
+                environmental_conditions = row['Environmental Conditions']
+                diagnosis = row['Diagnosis']
+                treatment = row['Treatment'].split(', ')
+                outcome = row['Outcome']
 
-    return case_database
+                case = {
+                    'Symptoms': symptoms,
+                    'Animal Age (Months)': age,
+                    'Animal Sex': sex,
+                    'Environmental Conditions': environmental_conditions,
+                    'Diagnosis': diagnosis,
+                    'Treatment': treatment,
+                    'Outcome': outcome
+                }
+                # Prototypes written by CaseBaseMaintenance stand for
+                # several merged cases
+                if row.get('Count'):
+                    case['Count'] = int(row['Count'])
 
+                case_database[case_id] = case
+    except FileNotFoundError:
+        print(f"Error: The file '{file_path}' does not exist.")
 
-# Example usage
-case_database = preprocess_dataset(file_path)
+    return case_database
 
-print("Case Database:")
-print(case_database)
 
-# Print each case individually
-print("\nIndividual Cases:")
-for case_id, case in case_database.items():
-    print(f"\nCase ID: {case_id}")
-    for key, value in case.items():
-        print(f"{key}: {value}")
+# The notebook's name for the loader
+preprocess_dataset = load_case_database
 
 
 # # **2.CALCULATE SIMILARITY MEASURES.**
@@ -89,6 +91,10 @@ def calculate_symptom_similarity(new_symptoms, existing_symptoms):
     Calculate the similarity between the symptoms of a
     new case and an existing case.
 
+    Symptoms are compared as normalized terms (see SymptomNormalizer), so
+    "Fever (104°F)" matches "fever of 103°F" and "Mouth blisters" matches
+    "Blisters on mouth".
+
     Args:
         new_symptoms (list): A list of symptoms for the new case.
         existing_symptoms (list): A list of symptoms for an existing case.
@@ -97,8 +103,11 @@ def calculate_symptom_similarity(new_symptoms, existing_symptoms):
         float: A similarity score between 0 and 1, where 1
         indicates an exact match.
     """
-    new_symptom_set = set(new_symptoms)
-    existing_symptom_set = set(existing_symptoms)
+    # Plain term sets: interning a query's terms would grow a vocabulary
+    # with every distinct text the process ever sees
+    new_symptom_set, _ = SymptomNormalizer.normalize_symptoms(new_symptoms)
+    existing_symptom_set, _ = SymptomNormalizer.normalize_symptoms(
+        existing_symptoms)
 
     # Calculate the ratio of common symptoms
     common_symptoms = new_symptom_set.intersection(existing_symptom_set)
@@ -128,6 +137,78 @@ def calculate_age_similarity(new_age, existing_age):
     return age_similarity
 
 
+def age_bounds(new_age, min_age_similarity):
+    """
+    Find the ages whose similarity to a new case's age is high enough.
+
+    Args:
+        new_age (int): The age (in months) of the new case.
+        min_age_similarity (float): The lowest acceptable
+        calculate_age_similarity score.
+
+    Returns:
+        tuple: The lowest and highest qualifying age (inclusive; empty when
+        the lowest is above the highest), or None if every age qualifies.
+    """
+    if min_age_similarity <= 0:
+        return None
+    if min_age_similarity > 1:
+        return new_age + 1, new_age
+
+    # 1 - |new - existing| / max(new, existing) >= m gives
+    # new * m <= existing <= new / (1 - m); the estimates are then moved
+    # to the exact bounds, whatever the rounding
+    low = math.ceil(new_age * min_age_similarity)
+    high = new_age if min_age_similarity == 1 else math.floor(
+        new_age / (1 - min_age_similarity))
+
+    def qualifies(age):
+        return calculate_age_similarity(new_age, age) >= min_age_similarity
+
+    while low > 0 and qualifies(low - 1):
+        low -= 1
+    while low <= new_age and not qualifies(low):
+        low += 1
+    while qualifies(high + 1):
+        high += 1
+    while high >= new_age and not qualifies(high):
+        high -= 1
+    return low, high
+
+
+def threshold_age_similarity(weights, similarity_threshold):
+    """
+    Return the lowest age similarity with which a case can still reach a
+    similarity threshold, i.e. with perfect symptom and environment scores.
+    """
+    if not weights['Animal Age (Months)']:
+        return 0.0
+    other_weights = (weights['Symptoms'] +
+                     weights['Environmental Conditions'])
+    # Slightly lower, so rounding never excludes a qualifying case
+    return (similarity_threshold - other_weights) / weights[
+        'Animal Age (Months)'] - 1e-9
+
+
+def prefilter_window(new_case, weights, similarity_threshold, age_filter):
+    """
+    Resolve the age_window argument of the retrieval functions.
+
+    Args:
+        age_filter: None for no age filter, 'threshold' for the window
+        outside which no case can reach the similarity threshold (it never
+        changes the result), or the lowest acceptable age similarity.
+
+    Returns:
+        tuple: The (lowest, highest) age to retrieve, or None.
+    """
+    if age_filter is None:
+        return None
+    if age_filter == 'threshold':
+        age_filter = threshold_age_similarity(weights, similarity_threshold)
+    return age_bounds(new_case.get('Animal Age (Months)', 0), age_filter)
+
+
 def calculate_environmental_similarity(new_conditions, existing_conditions):
     """
     Calculate the similarity between the environmental
@@ -187,7 +268,8 @@ def calculate_overall_similarity(new_case, existing_case, weights):
 
 
 def retrieve_similar_cases(
-        new_case, case_database, similarity_threshold=0.5, top_n=3):
+        new_case, case_database, similarity_threshold=0.5, top_n=3,
+        same_sex=False, age_window=None, weights=None):
     """
     Retrieve the most similar cases from the case database for a given new
     case.
@@ -198,18 +280,35 @@ def retrieve_similar_cases(
         similarity_threshold (float): The minimum similarity score required to
         consider a case as similar.
         top_n (int): The maximum number of similar cases to retrieve.
+        same_sex (bool): Only retrieve cases of the new case's sex.
+        age_window: Only retrieve cases within an age window; see
+        prefilter_window. Defaults to None, no filter.
+        weights (dict): The weight of each feature, e.g. from
+        load_retrieval_config as the app uses. Defaults to the module's
+        weights.
 
     Returns:
         list: A list of tuples, where each tuple contains the case ID, the
         corresponding case dictionary,
               and the similarity score for the top N most similar cases.
     """
+    if weights is None:
+        weights = default_weights
     similar_cases = defaultdict(list)
+    sex = new_case.get('Animal Sex') if same_sex else None
+    window = prefilter_window(
+        new_case, weights, similarity_threshold, age_window)
 
     # Calculate the similarity between the new case and each existing case
     for case_id, existing_case in case_database.items():
+        if sex is not None and existing_case['Animal Sex'] != sex:
+            continue
+        if window is not None and not (
+                window[0] <= existing_case['Animal Age (Months)'] <=
+                window[1]):
+            continue
         overall_similarity = calculate_overall_similarity(
-            new_case, existing_case, weights)  # Ensure 'weights' is defined
+            new_case, existing_case, weights)
         if overall_similarity >= similarity_threshold:
             similar_cases[overall_similarity].append(
                 (case_id, existing_case, overall_similarity))
@@ -234,6 +333,31 @@ weights = {
     'Animal Age (Months)': 0.2,
     'Environmental Conditions': 0.2
 }
+# For the functions whose weights argument shadows the name above
+default_weights = weights
+similarity_threshold = 0.5
+
+
+def load_retrieval_config(file_path):
+    """
+    Load the similarity weights and threshold chosen by WeightTuning.py.
+
+    Args:
+        file_path (str): The JSON file WeightTuning.py wrote, e.g.
+        'cbr_config.json'.
+
+    Returns:
+        tuple: The weights dictionary and the similarity threshold; the
+        defaults above if the file does not exist.
+    """
+    try:
+        with open(file_path, 'r') as file:
+            config = json.load(file)
+    except FileNotFoundError:
+        return dict(weights), similarity_threshold
+    return ({feature: float(config['weights'][feature])
+             for feature in weights},
+            float(config['similarity_threshold']))
 
 
 # # **4. DETERMINING THE DIAGNOSIS AMND TREATMENT**
@@ -257,28 +381,30 @@ def diagnose_and_treat(new_case, similar_cases):
         tuple: A tuple containing the determined diagnosis (str) and the
         recommended treatment (list).
     """
-    diagnoses = []
-    treatments = []
+    diagnosis_counter = Counter()
+    treatment_counter = Counter()
+    total_weight = 0
 
-    # Collect diagnoses and treatments from the similar cases
+    # Collect diagnoses and treatments from the similar cases; a merged
+    # case votes once for each case it stands for
     for case_id, case, similarity_score in similar_cases:
-        diagnoses.append(case['Diagnosis'])
-        treatments.append(case['Treatment'])
+        weight = case_weight(case)
+        diagnosis_counter[case['Diagnosis']] += weight
+        for item in case['Treatment']:
+            treatment_counter[item] += weight
+        total_weight += weight
 
     # If no similar cases were found, return default values
-    if not diagnoses:
+    if not diagnosis_counter:
         return "Unknown", ["Unknown"]
 
     # Determine the most common diagnosis
-    diagnosis_counter = Counter(diagnoses)
     most_common_diagnosis, _ = diagnosis_counter.most_common(1)[0]
 
     # Determine the most common treatment
-    treatment_counter = Counter(
-        [item for sublist in treatments for item in sublist])
     most_common_treatment = [
         item for item, count in treatment_counter.most_common()
-        if count >= len(similar_cases) // 2]
+        if count >= total_weight // 2]
 
     return most_common_diagnosis, most_common_treatment
 
@@ -345,18 +471,17 @@ def predict_prognosis(new_case, similar_cases):
     Returns:
         str: The predicted prognosis for the new case.
     """
-    outcomes = []
+    outcome_counter = Counter()
 
     # Collect outcomes from the similar cases
     for case_id, case, similarity_score in similar_cases:
-        outcomes.append(case['Outcome'])
+        outcome_counter[case['Outcome']] += case_weight(case)
 
     # If no similar cases were found, return a default prognosis
-    if not outcomes:
+    if not outcome_counter:
         return "Unable to predict prognosis due to lack of similar cases."
 
     # Determine the most common outcome
-    outcome_counter = Counter(outcomes)
     most_common_outcome, _ = outcome_counter.most_common(1)[0]
 
     # Determine the prognosis based on the most common outcome
@@ -375,9 +500,39 @@ def predict_prognosis(new_case, similar_cases):
 # In[6]:
 
 
+CASE_ID_PATTERN = re.compile(r'CASE(\d+)$')
+
+
+def case_id_number(case_id):
+    """Return the number of a 'CASE<n>' ID, or 0 for any other ID."""
+    match = CASE_ID_PATTERN.match(case_id)
+    return int(match.group(1)) if match else 0
+
+
+def next_case_id(case_ids, last_number=0):
+    """
+    Allocate the ID for a new case.
+
+    IDs count up from the highest numbered existing ID, so an ID is not
+    handed out again after the cases before it are deleted, and numbering
+    simply widens past CASE999.
+
+    Args:
+        case_ids (iterable): The existing case IDs.
+        last_number (int): The highest number issued before, e.g. to cases
+        that have since been deleted.
+
+    Returns:
+        str: The new ID, e.g. 'CASE404'.
+    """
+    last_number = max([last_number] + [
+        case_id_number(case_id) for case_id in case_ids])
+    return f"CASE{last_number + 1:03d}"
+
+
 def update_case_database(
         case_database, new_case, diagnosis, treatment, outcome,
-        similarity_threshold=0.5):
+        similarity_threshold=0.5, similar_cases=None, weights=None):
     """
     Update the case database by adding a new case and its outcome if it's
     sufficiently dissimilar to existing cases.
@@ -390,20 +545,26 @@ def update_case_database(
         outcome (str): The outcome of the new case.
         similarity_threshold (float): The minimum similarity score required
         for considering a case similar. Defaults to 0.5.
+        similar_cases (list): The result of retrieve_similar_cases for the
+        new case at the same threshold, if the caller already has it.
+        Defaults to None, which retrieves them again.
+        weights (dict): The weights to retrieve them with; see
+        retrieve_similar_cases.
 
     Returns:
         dict: The updated case database with the new case added if it meets
         the similarity threshold.
     """
     # Retrieve similar cases from the case database
-    similar_cases = retrieve_similar_cases(
-        new_case, case_database, similarity_threshold=similarity_threshold)
+    if similar_cases is None:
+        similar_cases = retrieve_similar_cases(
+            new_case, case_database,
+            similarity_threshold=similarity_threshold, weights=weights)
 
     # If there are no similar cases above the threshold, add the new case
     if not similar_cases:
         # Generate a unique case ID
-        num_cases = len(case_database)
-        case_id = f"CASE{num_cases + 1:03d}"
+        case_id = next_case_id(case_database)
 
         # Add the new case to the database
         new_case_entry = {
@@ -421,6 +582,38 @@ def update_case_database(
     return case_database
 
 
+CASE_FIELDNAMES = [
+    'Case ID', 'Symptoms', 'Animal Age (Months)', 'Animal Sex',
+    'Environmental Conditions', 'Diagnosis', 'Treatment', 'Outcome']
+
+
+def case_weight(case):
+    """Return how many cases a (possibly merged) case stands for."""
+    return case.get('Count', 1)
+
+
+def _fieldnames(cases):
+    if any('Count' in case for case in cases):
+        return CASE_FIELDNAMES + ['Count']
+    return CASE_FIELDNAMES
+
+
+def _case_row(case_id, case):
+    row = {
+        'Case ID': case_id,
+        'Symptoms': ', '.join(case['Symptoms']),
+        'Animal Age (Months)': case['Animal Age (Months)'],
+        'Animal Sex': case['Animal Sex'],
+        'Environmental Conditions': case['Environmental Conditions'],
+        'Diagnosis': case['Diagnosis'],
+        'Treatment': ', '.join(case['Treatment']),
+        'Outcome': case['Outcome']
+    }
+    if 'Count' in case:
+        row['Count'] = case['Count']
+    return row
+
+
 def save_case_database(case_database, file_path):
     """
     Save the case database to a CSV file.
@@ -430,15 +623,12 @@ def save_case_database(case_database, file_path):
         file_path (str): The path to the CSV file where the database will be
         saved.
     """
-    fieldnames = [
-        'Case ID', 'Symptoms', 'Animal Age (Months)', 'Animal Sex',
-        'Environmental Conditions', 'Diagnosis', 'Treatment', 'Outcome']
-
     # Check if the file exists
     file_exists = os.path.isfile(file_path)
 
     with open(file_path, 'w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer = csv.DictWriter(
+            file, fieldnames=_fieldnames(case_database.values()))
 
         # Write header if the file is empty or doesn't exist
         if not file_exists or os.stat(file_path).st_size == 0:
@@ -446,58 +636,33 @@ def save_case_database(case_database, file_path):
 
         # Append data to the file
         for case_id, case in case_database.items():
-            writer.writerow({
-                'Case ID': case_id,
-                'Symptoms': ', '.join(case['Symptoms']),
-                'Animal Age (Months)': case['Animal Age (Months)'],
-                'Animal Sex': case['Animal Sex'],
-                'Environmental Conditions': case['Environmental Conditions'],
-                'Diagnosis': case['Diagnosis'],
-                'Treatment': ', '.join(case['Treatment']),
-                'Outcome': case['Outcome']
-            })
+            writer.writerow(_case_row(case_id, case))
 
 
-def load_case_database(file_path):
+def append_cases(cases, file_path):
     """
-    Load the case database from a CSV file.
+    Append cases to an existing case database CSV without rewriting it.
 
     Args:
-        file_path (str): The path to the CSV file containing the case database.
-
-    Returns:
-        dict: A dictionary representing the case database.
+        cases (dict): Case ID -> case, the cases to add.
+        file_path (str): The path to the CSV file, which must end with a
+        complete row.
     """
-    case_database = {}
-
-    try:
-        with open(file_path, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                case_id = row['Case ID']
-                symptoms = row['Symptoms'].split(', ')
-                age = int(row['Animal Age (Months)'])
-                sex = row['Animal Sex']
-                environmental_conditions = row['Environmental Conditions']
-                diagnosis = row['Diagnosis']
-                treatment = row['Treatment'].split(', ')
-                outcome = row['Outcome']
-
-                case = {
-                    'Symptoms': symptoms,
-                    'Animal Age (Months)': age,
-                    'Animal Sex': sex,
-                    'Environmental Conditions': environmental_conditions,
-                    'Diagnosis': diagnosis,
-                    'Treatment': treatment,
-                    'Outcome': outcome
-                }
-
-                case_database[case_id] = case
-    except FileNotFoundError:
-        print(f"Error: The file '{file_path}' does not exist.")
-
-    return case_database
+    # Keep the columns of the existing file, e.g. a condensed case base's
+    # Count column
+    with open(file_path, 'r', newline='') as file:
+        fieldnames = next(csv.reader(file), None) or CASE_FIELDNAMES
+    if 'Count' not in fieldnames and any(
+            'Count' in case for case in cases.values()):
+        raise ValueError(f"{file_path} has no Count column")
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    for case_id, case in cases.items():
+        writer.writerow(_case_row(case_id, case))
+    # A single write, so the rows are not interleaved with another writer's
+    with open(file_path, 'a', newline='') as file:
+        file.write(buffer.getvalue())
 
 
 # # **7.UPDATING NEW CASE DATA**
@@ -635,77 +800,77 @@ def update_case(case_database, case_id, diagnosis, treatment, outcome):
 # In[21]:
 
 
-# def get_user_input():
-#     """
-#     Prompt the user for input and return a dictionary representing the new
-#     case.
-#     """
-#     symptoms = input("Enter the symptoms (comma-separated): ").split(",")
-#     symptoms = [symptom.strip() for symptom in symptoms]
-#     animal_age = int(input("Enter the animal age (in months): "))
-#     animal_sex = input("Enter the animal sex: ")
-#     environmental_conditions = input("Enter the environmental conditions: ")
-
-#     new_case = {
-#         'Symptoms': symptoms,
-#         'Animal Age (Months)': animal_age,
-#         'Animal Sex': animal_sex,
-#         'Environmental Conditions': environmental_conditions
-#     }
-
-#     return new_case
-
-
-# def main():
-#     # Define the weights dictionary
-#     weights = {
-#         'Symptoms': 0.6,
-#         'Animal Age (Months)': 0.2,
-#         'Environmental Conditions': 0.2
-#     }
-
-#     # Example usage
-#     file_path = 'FMD cases.csv'
-#     case_database = load_case_database(file_path)
-
-#     new_case = get_user_input()
-
-#     similarity_threshold = 0.5
-#     similar_cases = retrieve_similar_cases(
-#         new_case, case_database, similarity_threshold, top_n=3)
-
-#     if similar_cases:
-#         diagnosis, treatment = diagnose_and_treat(new_case, similar_cases)
-#         prognosis = predict_prognosis(new_case, similar_cases)
+def get_user_input():
+    """
+    Prompt the user for input and return a dictionary representing the new
+    case.
+    """
+    symptoms = input("Enter the symptoms (comma-separated): ").split(",")
+    symptoms = [symptom.strip() for symptom in symptoms]
+    animal_age = int(input("Enter the animal age (in months): "))
+    animal_sex = input("Enter the animal sex: ")
+    environmental_conditions = input("Enter the environmental conditions: ")
+
+    new_case = {
+        'Symptoms': symptoms,
+        'Animal Age (Months)': animal_age,
+        'Animal Sex': animal_sex,
+        'Environmental Conditions': environmental_conditions
+    }
+
+    return new_case
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Diagnose a new case from the case database.")
+    parser.add_argument('csv_path', nargs='?', default='FMD cases.csv')
+    parser.add_argument('--show-cases', action='store_true',
+                        help="print every case in the database and exit")
+    parser.add_argument('--save', action='store_true',
+                        help="record the new case for review if no similar "
+                        "case is found")
+    parser.add_argument('--config', default='cbr_config.json',
+                        help="the weights and threshold (WeightTuning.py)")
+    args = parser.parse_args()
+
+    case_database = load_case_database(args.csv_path)
+
+    if args.show_cases:
+        for case_id, case in case_database.items():
+            print(f"\nCase ID: {case_id}")
+            for key, value in case.items():
+                print(f"{key}: {value}")
+        return
 
-#         print(f"Diagnosis: {diagnosis}")
-#         print(f"Recommended Treatment: {', '.join(treatment)}")
-#         print(f"Prognosis: {prognosis}")
-#     else:
-#         # Check if overall similarity score is above the threshold
-#         overall_similarity = calculate_overall_similarity(
-#             new_case, case_database, weights)
-#         if overall_similarity < similarity_threshold:
-#             diagnosis, treatment = diagnose_and_treat(
-# new_case, similar_cases)
-#             outcome = "Not determined yet"
-#             case_database_updated = update_case_database(
-#                 case_database, new_case, diagnosis, treatment, outcome,
-#                 similarity_threshold)
-
-#             if case_database_updated != case_database:
-#                 print("No update to the case database.")
-#             else:
-#                 save_case_database(case_database_updated, file_path)
-#                 print("Case database updated with the new case.")
-#         else:
-#             print("Similarity score below threshold. New case not added.")
+    new_case = get_user_input()
 
-#         print("No similar cases found. New case added to the database.")
+    # The app's weights and threshold, so both diagnose alike
+    tuned_weights, similarity_threshold = load_retrieval_config(args.config)
+    similar_cases = retrieve_similar_cases(
+        new_case, case_database, similarity_threshold, top_n=3,
+        weights=tuned_weights)
 
+    if similar_cases:
+        diagnosis, treatment = diagnose_and_treat(new_case, similar_cases)
+        prognosis = predict_prognosis(new_case, similar_cases)
 
-# if __name__ == "__main__":
-#     main()
+        print(f"Diagnosis: {diagnosis}")
+        print(f"Recommended Treatment: {', '.join(treatment)}")
+        print(f"Prognosis: {prognosis}")
+    else:
+        print("No similar cases found.")
+        if args.save:
+            update_case_database(
+                case_database, new_case, "No similar cases found.", [],
+                "Not determined yet", similarity_threshold, similar_cases,
+                tuned_weights)
+            save_case_database(case_database, args.csv_path)
+            print("New case added to the database for review.")
+
+
+if __name__ == "__main__":
+    main()
 
 
 # In[1]:
@@ -0,0 +1,238 @@
+"""
+Coarse-to-fine retrieval over clusters of similar cases.
+
+CaseClusters is a two-level index: the cases are grouped around
+representatives, which are themselves cases (medoids), and a new case is
+first scored against the representatives only. The members of the
+`probes` best clusters are then rescored exactly, as IndexView.retrieve
+would. A similar case in a cluster that was not probed is missed, so
+retrieval is approximate; more probes raise the recall and the cost. See
+benchmarks/bench_clusters.py for the top-3 agreement with exact retrieval.
+
+The clusters are built the k-medoids way, with calculate_overall_similarity
+as the similarity:
+
+1. seeds are picked k-means++ style from a sample of the cases, each one
+   more likely the less similar it is to the seeds picked so far;
+2. every case joins the cluster of its most similar representative;
+3. each cluster's representative is replaced by the member most similar
+   to a sample of the other members, and the cases are assigned again
+   (`iterations` times).
+
+Cases added later join the cluster of their most similar representative,
+or start a new cluster while there are fewer than `clusters`. Like
+MinHashLSH, CaseClusters is a CaseIndex derived index:
+
+    index.add_index('clusters', lambda: CaseClusters(clusters=256))
+    view = index.view()
+    view.derived('clusters').retrieve(view, new_case, weights, probes=16)
+"""
+
+import difflib
+
+import numpy as np
+
+import CaseBasedSystem
+import CaseIndex
+import SymptomNormalizer
+
+
+class _Representatives:
+    """
+    A few cases, scored against a new case with numpy.
+
+    The scores equal CaseBasedSystem.calculate_overall_similarity.
+    """
+
+    def __init__(self, cases):
+        self.terms = [SymptomNormalizer.normalize_symptoms(
+            case['Symptoms'])[0] for case in cases]
+        self.sizes = np.array([len(terms) for terms in self.terms],
+                              dtype=np.int64)
+        self.ages = np.array([case['Animal Age (Months)'] for case in cases],
+                             dtype=np.int64)
+        self.environments = {}
+        self.environment_codes = np.array(
+            [self.environments.setdefault(
+                case['Environmental Conditions'], len(self.environments))
+             for case in cases], dtype=np.int64)
+
+    def scores(self, new_case, weights, environment_ratios=None):
+        new_terms, _ = SymptomNormalizer.normalize_symptoms(
+            new_case.get('Symptoms', []))
+        common = np.array([len(new_terms & terms) for terms in self.terms],
+                          dtype=np.int64)
+        symptom_similarity = common / np.maximum(
+            self.sizes, max(len(new_terms), 1))
+
+        new_age = new_case.get('Animal Age (Months)', 0)
+        max_age = np.maximum(self.ages, new_age)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            age_similarity = np.where(
+                max_age > 0, 1 - np.abs(new_age - self.ages) / max_age, 1.0)
+
+        new_conditions = new_case.get('Environmental Conditions', '')
+        if environment_ratios is None:
+            environment_ratios = {}
+        ratios = np.empty(len(self.environments), dtype=np.float64)
+        for text, code in self.environments.items():
+            ratio = environment_ratios.get(text)
+            if ratio is None:
+                ratio = environment_ratios[text] = difflib.SequenceMatcher(
+                    None, new_conditions, text).ratio()
+            ratios[code] = ratio
+        environment_similarity = ratios[self.environment_codes]
+
+        return (weights['Symptoms'] * symptom_similarity +
+                weights['Animal Age (Months)'] * age_similarity +
+                weights['Environmental Conditions'] * environment_similarity)
+
+
+class CaseClusters(CaseIndex.DerivedIndex):
+    """
+    Clusters of the cases around representative cases.
+
+    Args:
+        clusters (int): The number of clusters.
+        probes (int): The number of clusters whose members a query
+        rescores, unless retrieve is given another number.
+        iterations (int): The number of times the representatives are
+        refined after the first assignment.
+        sample_size (int): The number of cases sampled per cluster, to pick
+        the seeds and to refine the representatives.
+        weights (dict): The feature weights the clusters are built with.
+        Defaults to CaseBasedSystem.weights.
+        seed (int): The seed of the sampling.
+    """
+
+    def __init__(self, clusters=256, probes=16, iterations=1, sample_size=16,
+                 weights=None, seed=1):
+        self.clusters = clusters
+        self.probes = probes
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.weights = weights or CaseBasedSystem.weights
+        self.seed = seed
+
+        self._medoids = []
+        self._representatives = _Representatives([])
+        # Per cluster: the rows assigned at build time, and those added since
+        self._members = []
+        self._added = []
+
+    def _set_medoids(self, medoids):
+        self._medoids = medoids
+        self._representatives = _Representatives(medoids)
+
+    def _seed(self, cases, count, rng):
+        # k-means++ with 1 - similarity as the distance
+        representatives = _Representatives(cases)
+        chosen = [int(rng.integers(len(cases)))]
+        best = representatives.scores(cases[chosen[0]], self.weights)
+        while len(chosen) < count:
+            distances = np.clip(1 - best, 0, None) ** 2
+            total = distances.sum()
+            if total <= 0:
+                break
+            choice = int(rng.choice(len(cases), p=distances / total))
+            chosen.append(choice)
+            best = np.maximum(
+                best, representatives.scores(cases[choice], self.weights))
+        return [cases[choice] for choice in chosen]
+
+    def _assign(self, view, rows, environment_ratios):
+        labels = np.zeros(len(rows), dtype=np.int64)
+        best = np.full(len(rows), -np.inf)
+        for cluster, medoid in enumerate(self._medoids):
+            # Medoids share environments; compare each pair once
+            _, scores = view.similarities(
+                medoid, self.weights, rows, environment_ratios.setdefault(
+                    medoid['Environmental Conditions'], {}))
+            closer = scores > best
+            labels[closer] = cluster
+            best[closer] = scores[closer]
+        return labels
+
+    def _refine(self, view, members, rng):
+        medoids = []
+        for medoid, rows in zip(self._medoids, members):
+            if len(rows) > self.sample_size:
+                rows = rng.choice(rows, self.sample_size, replace=False)
+            candidates = [medoid] + [view.case(row) for row in rows]
+            representatives = _Representatives(candidates)
+            totals = [representatives.scores(case, self.weights).sum()
+                      for case in candidates]
+            medoids.append(candidates[int(np.argmax(totals))])
+        return medoids
+
+    def build(self, view):
+        rows = view.visible_rows()
+        count = min(self.clusters, len(rows))
+        if not count:
+            return
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(rng.choice(
+            rows, min(len(rows), count * self.sample_size), replace=False))
+        self._set_medoids(
+            self._seed([view.case(row) for row in sample], count, rng))
+
+        environment_ratios = {}
+        for iteration in range(self.iterations + 1):
+            labels = self._assign(view, rows, environment_ratios)
+            order = np.argsort(labels, kind='stable')
+            bounds = np.searchsorted(
+                labels[order], np.arange(len(self._medoids) + 1))
+            members = [rows[order[start:end]]
+                       for start, end in zip(bounds[:-1], bounds[1:])]
+            if iteration < self.iterations:
+                self._set_medoids(self._refine(view, members, rng))
+        self._members = members
+        self._added = [[] for _ in members]
+
+    def add(self, row, case_id, case):
+        if len(self._medoids) < self.clusters:
+            # The member lists first: readers take the clusters from the
+            # medoids, and a medoid must never lack its lists
+            self._members.append(np.empty(0, dtype=np.int64))
+            self._added.append([row])
+            self._set_medoids(self._medoids + [case])
+            return
+        scores = self._representatives.scores(case, self.weights)
+        self._added[int(np.argmax(scores))].append(row)
+
+    def candidates(self, view, new_case, probes=None,
+                   environment_ratios=None):
+        """
+        Return the visible members of the clusters closest to a new case.
+
+        Args:
+            probes (int): The number of clusters. Defaults to self.probes.
+            environment_ratios (dict): See IndexView.similarities.
+
+        Returns:
+            numpy.ndarray: The candidate rows, in storage order.
+        """
+        if not self._medoids:
+            return np.empty(0, dtype=np.int64)
+        scores = self._representatives.scores(
+            new_case, self.weights, environment_ratios)
+        nearest = np.argsort(-scores, kind='stable')[:probes or self.probes]
+        found = [self._members[cluster] for cluster in nearest]
+        found += [np.asarray(self._added[cluster], dtype=np.int64)
+                  for cluster in nearest]
+        return view.visible(np.unique(np.concatenate(found)))
+
+    def retrieve(self, view, new_case, weights, similarity_threshold=0.5,
+                 top_n=3, probes=None, **filters):
+        """
+        Retrieve similar cases among the members of the nearest clusters.
+
+        Takes the arguments, including the pre-filters, and returns the
+        result of IndexView.retrieve, plus `probes`, the number of clusters
+        to search (default self.probes).
+        """
+        # Both levels compare the same environments with the new case's
+        environment_ratios = {}
+        rows = self.candidates(view, new_case, probes, environment_ratios)
+        return view.retrieve(new_case, weights, similarity_threshold, top_n,
+                             rows, environment_ratios, **filters)
@@ -0,0 +1,901 @@
+"""
+Versioned in-memory case index with incremental maintenance.
+
+CaseIndex keeps the case base in append-only columns (ages, environment
+codes, normalized symptom-term set sizes) with an inverted index from
+symptom term to rows, plus any number of pluggable derived indexes.
+insert(), update() and delete() only touch the rows they change:
+
+- insert appends a row,
+- delete stamps the row with the version that deleted it,
+- update does both, keeping the case's position for tie-breaking.
+
+Every change publishes a new version. Readers work on an IndexView, which
+pins the version it was taken at: it only sees rows that existed at that
+version and had not been deleted yet, so a reader never observes a
+half-applied change and never has to take a lock, while writers never copy
+the index. Deleted rows are reclaimed by compact() once they outnumber the
+live ones.
+
+Retrieval (IndexView.retrieve) returns the same cases as
+CaseBasedSystem.retrieve_similar_cases. When the age and environment
+weights alone cannot reach the similarity threshold, only cases sharing a
+symptom term with the new case can qualify, so just those rows are scored.
+Optional pre-filters (same sex, an age window) restrict the scored rows to
+slices of an AgeIndex.
+"""
+
+import difflib
+import threading
+
+import numpy as np
+
+import CaseBasedSystem
+import SymptomNormalizer
+
+LIVE = np.iinfo(np.int64).max
+
+
+class _Column:
+    # Append-only numpy column that doubles its capacity when full. Readers
+    # call values(), which reads the size before the data, so the slice
+    # they get is always fully written even if a writer reallocates.
+
+    def __init__(self, dtype, values=(), capacity=1024):
+        values = np.asarray(values, dtype=dtype)
+        self.size = len(values)
+        self.data = np.empty(max(capacity, 2 * self.size), dtype=dtype)
+        self.data[:self.size] = values
+
+    def append(self, value):
+        if self.size == len(self.data):
+            data = np.empty(2 * len(self.data), dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+        self.data[self.size] = value
+        self.size += 1
+
+    def values(self):
+        size = self.size
+        return self.data[:size]
+
+
+class DerivedIndex:
+    """
+    Base class for structures derived from the cases.
+
+    A CaseIndex calls add() for every row it appends and remove() for every
+    row it deletes (an update deletes the old row and appends the new one),
+    under its write lock. Readers query the structure through an IndexView
+    and must ignore rows the view cannot see (IndexView.visible); structures
+    that only ever append rows need nothing else to stay consistent.
+    Structures that aggregate the rows instead return an immutable state
+    from published(), which every new view captures (IndexView.state).
+    """
+
+    def build(self, view):
+        """Add every row visible in a view; called by add_index."""
+        for row in view.visible_rows():
+            self.add(row, view.case_id(row), view.case(row))
+
+    def add(self, row, case_id, case):
+        pass
+
+    def published(self):
+        """Return the state views of the version being published see."""
+        return None
+
+    def remove(self, row, case_id, case):
+        pass
+
+
+class FieldIndex(DerivedIndex):
+    """
+    Rows grouped by the value of one case field, e.g. 'Diagnosis'.
+
+    Args:
+        field (str): The case dictionary key to group by.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self._rows = {}
+
+    def build(self, view):
+        rows = view.visible_rows()
+        for row, value in zip(rows.tolist(), view.values(self.field, rows)):
+            self._add(row, value)
+
+    def add(self, row, case_id, case):
+        self._add(row, case[self.field])
+
+    def _add(self, row, value):
+        self._rows.setdefault(value, _Column(
+            np.int64, capacity=16)).append(row)
+
+    def cases(self, view, value):
+        """
+        Return the cases of a view whose field equals value.
+
+        Returns:
+            dict: Case ID -> case, in database order.
+        """
+        column = self._rows.get(value)
+        if column is None:
+            return {}
+        rows = view.visible(column.values())
+        return {view.case_id(row): view.case(row)
+                for row in view.in_order(rows)}
+
+
+class AgeIndex(DerivedIndex):
+    """
+    Rows sorted by age, optionally partitioned by another case field, for
+    the age window and same-sex pre-filters of IndexView.retrieve.
+
+    Args:
+        partition (str): A case field to keep separate sorted arrays for,
+        one per value, e.g. 'Animal Sex'. Defaults to None, one array.
+    """
+
+    def __init__(self, partition=None):
+        self.partition = partition
+        # Per partition value: the ages of the built rows, sorted, with
+        # their rows, and columns of the rows added since
+        self._built = {}
+        self._added = {}
+
+    def build(self, view):
+        rows = view.visible_rows()
+        ages = np.asarray(view.values('Animal Age (Months)', rows),
+                          dtype=np.int64)
+        if self.partition is None:
+            groups = {None: np.arange(len(rows))}
+        else:
+            groups = {}
+            for position, value in enumerate(
+                    view.values(self.partition, rows)):
+                groups.setdefault(value, []).append(position)
+        for value, positions in groups.items():
+            positions = np.asarray(positions, dtype=np.int64)
+            order = np.argsort(ages[positions], kind='stable')
+            self._built[value] = (ages[positions][order],
+                                  rows[positions][order])
+
+    def add(self, row, case_id, case):
+        value = None if self.partition is None else case[self.partition]
+        ages, rows = self._added.setdefault(value, (
+            _Column(np.int64, capacity=16), _Column(np.int64, capacity=16)))
+        ages.append(case['Animal Age (Months)'])
+        rows.append(row)
+
+    def rows(self, view, window=None, values=None):
+        """
+        Return the visible rows within an age window.
+
+        Args:
+            window (tuple): The lowest and highest age, inclusive. Defaults
+            to None, every age.
+            values (list): The partition values to search. Defaults to
+            None, every partition.
+
+        Returns:
+            numpy.ndarray: The rows, in storage order.
+        """
+        if values is None:
+            values = set(self._built) | set(self._added)
+        found = [np.empty(0, dtype=np.int64)]
+        for value in values:
+            if value in self._built:
+                ages, rows = self._built[value]
+                if window is not None:
+                    rows = rows[np.searchsorted(ages, window[0], 'left'):
+                                np.searchsorted(ages, window[1], 'right')]
+                found.append(rows)
+            if value in self._added:
+                ages, rows = (column.values() for column in
+                              self._added[value])
+                if window is not None:
+                    rows = rows[(ages >= window[0]) & (ages <= window[1])]
+                found.append(rows)
+        return view.visible(np.sort(np.concatenate(found)))
+
+
+def _adjust(counts, keys, weight):
+    # A copy of counts with weight added to each key; zero counts vanish
+    counts = dict(counts)
+    for key in keys:
+        counts[key] = counts.get(key, 0) + weight
+        if not counts[key]:
+            del counts[key]
+    return counts
+
+
+def _most_common(counts):
+    # [name, count] pairs rather than a dict, which JSON encoders may sort
+    return [[name, count] for name, count in
+            sorted(counts.items(), key=lambda item: -item[1])]
+
+
+def _summary(diagnosis, counts):
+    cases, treatments, outcomes = counts
+    return {'diagnosis': diagnosis, 'cases': cases,
+            'treatments': _most_common(treatments),
+            'outcomes': _most_common(outcomes)}
+
+
+class DiagnosisStats(DerivedIndex):
+    """
+    Case, treatment and outcome counts per diagnosis, kept up to date as
+    cases are added and removed, so that they can be read without scanning
+    the cases. A merged case counts as the cases it stands for
+    (CaseBasedSystem.case_weight), as in diagnose_and_treat.
+
+    Every change replaces the counts of its diagnosis rather than modifying
+    them, and each view captures the counts of its version, so readers need
+    no lock and see the counts of exactly the cases in their view.
+    """
+
+    def __init__(self):
+        # Diagnosis -> (cases, treatment -> cases, outcome -> cases)
+        self._stats = {}
+
+    def build(self, view):
+        rows = view.visible_rows()
+        stats = {}
+        for diagnosis, treatment, outcome, count in zip(
+                view.values('Diagnosis', rows),
+                view.values('Treatment', rows),
+                view.values('Outcome', rows), view.values('Count', rows)):
+            weight = 1 if count is None else count
+            counts = stats.setdefault(diagnosis, [0, {}, {}])
+            counts[0] += weight
+            for item in treatment:
+                counts[1][item] = counts[1].get(item, 0) + weight
+            counts[2][outcome] = counts[2].get(outcome, 0) + weight
+        self._stats = {diagnosis: tuple(counts)
+                       for diagnosis, counts in stats.items()}
+
+    def _change(self, case, weight):
+        diagnosis = case['Diagnosis']
+        cases, treatments, outcomes = self._stats.get(diagnosis, (0, {}, {}))
+        stats = dict(self._stats)
+        if cases + weight:
+            stats[diagnosis] = (
+                cases + weight, _adjust(treatments, case['Treatment'], weight),
+                _adjust(outcomes, [case['Outcome']], weight))
+        else:
+            stats.pop(diagnosis, None)
+        self._stats = stats
+
+    def add(self, row, case_id, case):
+        self._change(case, CaseBasedSystem.case_weight(case))
+
+    def remove(self, row, case_id, case):
+        self._change(case, -CaseBasedSystem.case_weight(case))
+
+    def published(self):
+        return self._stats
+
+    def summary(self, view, diagnosis, name='stats'):
+        """
+        Return the counts of one diagnosis in a view.
+
+        Args:
+            view (IndexView): The view.
+            diagnosis (str): The diagnosis.
+            name (str): The name the index was added under.
+
+        Returns:
+            dict: 'cases', the number of cases with the diagnosis, and
+            'treatments' and 'outcomes', [name, cases] pairs of each
+            treatment and outcome, most frequent first. None if no case has
+            the diagnosis.
+        """
+        counts = view.state(name).get(diagnosis)
+        return None if counts is None else _summary(diagnosis, counts)
+
+    def summaries(self, view, name='stats'):
+        """Return the summary of every diagnosis, most cases first."""
+        return sorted((_summary(diagnosis, counts)
+                       for diagnosis, counts in view.state(name).items()),
+                      key=lambda summary: -summary['cases'])
+
+
+class _Store:
+    # The rows and derived structures of one generation of the index.
+    # compact() replaces the store; views keep the one they were taken on.
+
+    def __init__(self, derived_factories):
+        self.case_ids = []
+        self.payloads = []
+        self.order = _Column(np.int64)
+        self.deleted = _Column(np.int64)
+        self.previous = _Column(np.int64)
+        self.ages = _Column(np.int64)
+        self.environments = _Column(np.int32)
+        self.set_sizes = _Column(np.int32)
+        self.postings = {}
+        self.row_of = {}
+        self.base = None
+        self.columns = {}
+        self.derived = {name: factory()
+                        for name, factory in derived_factories.items()}
+
+    def case(self, row):
+        case = self.payloads[row]
+        if case is None:
+            case = self.payloads[row] = self.base.case(row)
+        return case
+
+    def value(self, row, field):
+        case = self.payloads[row]
+        if case is not None:
+            # None for an optional field the case lacks, like a snapshot
+            return case.get(field)
+        # Rows still in the snapshot are never modified in place, so their
+        # value can come from a whole column read once
+        column = self.columns.get(field)
+        if column is None:
+            try:
+                column = self.columns[field] = self.base.column(field)
+            except KeyError:
+                return self.case(row)[field]
+        return column[row]
+
+
+class IndexView:
+    """
+    A consistent, read-only view of a CaseIndex at one version.
+
+    Args:
+        index (CaseIndex): The index.
+        store (_Store): The store the view reads.
+        version (int): The version the view pins.
+        rows (int): The number of rows that existed at that version.
+        live (int): The number of cases visible at that version.
+    """
+
+    def __init__(self, index, store, version, rows, live):
+        self.terms = index.terms
+        self.environments = index.environments
+        self.version = version
+        self._store = store
+        self._rows = rows
+        self._live = live
+        self._states = {name: derived.published()
+                        for name, derived in store.derived.items()}
+
+    def __len__(self):
+        return self._live
+
+    def visible(self, rows):
+        """Filter an array of rows down to those visible in this view."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < self._rows]
+        return rows[self._store.deleted.values()[rows] > self.version]
+
+    def visible_rows(self):
+        """Return every visible row, in storage order."""
+        deleted = self._store.deleted.values()[:self._rows]
+        return np.flatnonzero(deleted > self.version)
+
+    def in_order(self, rows):
+        """Sort rows into database order (the order cases were added in)."""
+        return rows[np.argsort(self._store.order.values()[rows],
+                               kind='stable')]
+
+    def case_id(self, row):
+        return self._store.case_ids[row]
+
+    def case_ids(self):
+        """Return the IDs of the visible cases, in storage order."""
+        case_ids = self._store.case_ids
+        return [case_ids[row] for row in self.visible_rows().tolist()]
+
+    def case(self, row):
+        """Return the case dictionary of a row. Do not modify it."""
+        return self._store.case(row)
+
+    def row_of(self, case_id):
+        """Return the visible row of a case ID, or None."""
+        store = self._store
+        row = store.row_of.get(case_id, -1)
+        # The latest row may be newer than the view; walk back through the
+        # case's earlier rows to the one this version sees
+        while row >= 0:
+            if row < self._rows and \
+                    store.deleted.values()[row] > self.version:
+                return row
+            row = int(store.previous.values()[row])
+        return None
+
+    def values(self, field, rows):
+        """Return one field of the cases at rows, as a list."""
+        return [self._store.value(row, field) for row in rows.tolist()]
+
+    def get(self, case_id):
+        """Return the case with the given ID, or None."""
+        row = self.row_of(case_id)
+        return None if row is None else self.case(row)
+
+    def items(self):
+        """Iterate over (case ID, case) pairs in database order."""
+        for row in self.in_order(self.visible_rows()):
+            yield self.case_id(row), self.case(row)
+
+    def to_case_database(self):
+        """Return the visible cases as a load_case_database dictionary."""
+        return dict(self.items())
+
+    def derived(self, name):
+        """Return a derived index registered with CaseIndex.add_index."""
+        return self._store.derived[name]
+
+    def state(self, name):
+        """Return what a derived index published for this view's version."""
+        return self._states[name]
+
+    def _term_ids(self, new_case):
+        terms, _ = SymptomNormalizer.normalize_symptoms(
+            new_case.get('Symptoms', []))
+        known = [self.terms.lookup(term) for term in terms]
+        return len(terms), [term_id for term_id in known
+                            if term_id is not None]
+
+    def rows_with_term(self, term_id):
+        """Return the visible rows whose symptoms include a term ID."""
+        postings = self._store.postings.get(term_id)
+        if postings is None:
+            return np.empty(0, dtype=np.int64)
+        return self.visible(postings.values())
+
+    def _common_terms(self, term_ids, rows):
+        # How many of the terms each row has. Postings are in row order, so
+        # a few rows are looked up in them; many rows are counted in one
+        # pass over the postings
+        postings = [self._store.postings[term_id].values()
+                    for term_id in term_ids
+                    if term_id in self._store.postings]
+        if len(rows) * len(postings) >= sum(map(len, postings)) / 8:
+            return np.bincount(self._matching_rows(term_ids),
+                               minlength=self._rows)[rows]
+        common = np.zeros(len(rows), dtype=np.int64)
+        for posting in postings:
+            found = np.minimum(np.searchsorted(posting, rows),
+                               len(posting) - 1)
+            common += posting[found] == rows
+        return common
+
+    def _matching_rows(self, term_ids):
+        # Every row listed under each of the terms; a row appears once per
+        # term it shares with the new case
+        postings = [self._store.postings[term_id].values()
+                    for term_id in term_ids
+                    if term_id in self._store.postings]
+        if not postings:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate(postings)
+        return rows[rows < self._rows]
+
+    def similarities(self, new_case, weights, rows=None,
+                     environment_ratios=None):
+        """
+        Score a new case against cases of the view.
+
+        The scores equal CaseBasedSystem.calculate_overall_similarity.
+
+        Args:
+            new_case (dict): A dictionary representing the new case.
+            weights (dict): The weight of each feature.
+            rows (numpy.ndarray): The rows to score. Defaults to all of the
+            visible rows.
+            environment_ratios (dict): Environment -> its SequenceMatcher
+            ratio against the new case's, read and filled in, so that calls
+            for the same new case compare each environment once.
+
+        Returns:
+            tuple: The scored rows and their similarity scores.
+        """
+        store = self._store
+        if rows is None:
+            rows = self.visible_rows()
+        new_terms, term_ids = self._term_ids(new_case)
+
+        common = self._common_terms(term_ids, rows)
+        symptom_similarity = common / np.maximum(
+            store.set_sizes.values()[rows], max(new_terms, 1))
+
+        new_age = new_case.get('Animal Age (Months)', 0)
+        ages = store.ages.values()[rows]
+        max_age = np.maximum(ages, new_age)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            age_similarity = np.where(
+                max_age > 0, 1 - np.abs(new_age - ages) / max_age, 1.0)
+
+        # One SequenceMatcher per distinct environment among the rows
+        new_conditions = new_case.get('Environmental Conditions', '')
+        if environment_ratios is None:
+            environment_ratios = {}
+        codes, inverse = np.unique(store.environments.values()[rows],
+                                   return_inverse=True)
+        ratios = np.empty(len(codes), dtype=np.float64)
+        for i, code in enumerate(codes):
+            text = self.environments.terms[code]
+            ratio = environment_ratios.get(text)
+            if ratio is None:
+                ratio = environment_ratios[text] = difflib.SequenceMatcher(
+                    None, new_conditions, text).ratio()
+            ratios[i] = ratio
+        environment_similarity = ratios[inverse.reshape(-1)]
+
+        scores = (
+            weights['Symptoms'] * symptom_similarity +
+            weights['Animal Age (Months)'] * age_similarity +
+            weights['Environmental Conditions'] * environment_similarity)
+        return rows, scores
+
+    def candidate_rows(self, new_case, weights, similarity_threshold,
+                       within=None):
+        """
+        Return the rows that can reach the similarity threshold.
+
+        A case with no symptom term in common with the new case scores at
+        most the age plus environment weights; when that is below the
+        threshold, only rows from the inverted index can qualify.
+
+        Args:
+            within (numpy.ndarray): Visible rows, in storage order, to
+            restrict the candidates to, e.g. from filter_rows. When they
+            are fewer than the inverted index entries, they are returned
+            as they are: scoring them is cheaper than narrowing them down.
+
+        Returns:
+            numpy.ndarray: The candidate rows.
+        """
+        other_weights = (weights['Animal Age (Months)'] +
+                         weights['Environmental Conditions'])
+        if other_weights >= similarity_threshold:
+            return self.visible_rows() if within is None else within
+        _, term_ids = self._term_ids(new_case)
+        matching = self._matching_rows(term_ids)
+        if within is not None:
+            if len(within) <= len(matching):
+                return within
+            keep = np.zeros(self._rows, dtype=bool)
+            keep[within] = True
+            matching = matching[keep[matching]]
+        return self.visible(np.unique(matching))
+
+    def filter_rows(self, new_case, weights, similarity_threshold,
+                    same_sex=False, age_window=None):
+        """
+        Return the rows that pass the structured pre-filters.
+
+        The filters use the AgeIndex registered as 'age'; same_sex needs it
+        to be partitioned by 'Animal Sex'.
+
+        Args:
+            same_sex (bool): Only cases of the new case's sex.
+            age_window: Only cases within an age window; see
+            CaseBasedSystem.prefilter_window.
+
+        Returns:
+            numpy.ndarray: The rows, in storage order, or None if no filter
+            is set.
+        """
+        sex = new_case.get('Animal Sex') if same_sex else None
+        window = CaseBasedSystem.prefilter_window(
+            new_case, weights, similarity_threshold, age_window)
+        if sex is None and window is None:
+            return None
+        ages = self._store.derived.get('age')
+        if not isinstance(ages, AgeIndex) or (
+                sex is not None and ages.partition != 'Animal Sex'):
+            raise ValueError("The pre-filters need an AgeIndex registered "
+                             "as 'age', partitioned by 'Animal Sex' for "
+                             "same_sex")
+        return ages.rows(self, window, None if sex is None else [sex])
+
+    def retrieve(self, new_case, weights, similarity_threshold=0.5, top_n=3,
+                 rows=None, environment_ratios=None, same_sex=False,
+                 age_window=None):
+        """
+        Retrieve the most similar cases for a new case.
+
+        Returns the same cases, in the same order, as
+        CaseBasedSystem.retrieve_similar_cases: best score first, ties in
+        database order.
+
+        Args:
+            new_case (dict): A dictionary representing the new case.
+            weights (dict): The weight of each feature.
+            similarity_threshold (float): The minimum similarity score.
+            top_n (int): The maximum number of cases to retrieve.
+            rows (numpy.ndarray): Visible rows to consider, e.g. from an
+            approximate index. Defaults to candidate_rows, which loses no
+            qualifying case.
+            environment_ratios (dict): See similarities.
+            same_sex, age_window: Pre-filters, off by default; see
+            filter_rows. Only the rows that pass them are scored.
+
+        Returns:
+            list: (case ID, case dictionary, similarity score) tuples.
+        """
+        filtered = self.filter_rows(new_case, weights, similarity_threshold,
+                                    same_sex, age_window)
+        if rows is None:
+            rows = self.candidate_rows(
+                new_case, weights, similarity_threshold, filtered)
+        elif filtered is not None:
+            rows = np.intersect1d(rows, filtered, assume_unique=True)
+        rows, scores = self.similarities(
+            new_case, weights, rows, environment_ratios)
+        keep = scores >= similarity_threshold
+        rows, scores = rows[keep], scores[keep]
+        order = np.lexsort((self._store.order.values()[rows], -scores))
+        return [(self.case_id(rows[i]), self.case(rows[i]), float(scores[i]))
+                for i in order[:top_n]]
+
+
+class CaseIndex:
+    """
+    The case base as a versioned index that is updated incrementally.
+
+    Writers (insert, update, delete, put) are serialized by a lock and each
+    publishes a new version; view() returns the current version for
+    readers.
+    """
+
+    def __init__(self):
+        self.terms = SymptomNormalizer.Vocabulary()
+        self.environments = SymptomNormalizer.Vocabulary()
+        self._lock = threading.RLock()
+        self._derived_factories = {}
+        self._store = _Store(self._derived_factories)
+        self._next_order = 0
+        self._version = 0
+        self._live = 0
+        self._view = IndexView(self, self._store, 0, 0, 0)
+
+    @classmethod
+    def from_case_database(cls, case_database):
+        """
+        Build an index from a load_case_database dictionary.
+
+        Args:
+            case_database (dict): Case ID -> case.
+
+        Returns:
+            CaseIndex: The index, at version 1.
+        """
+        index = cls()
+        with index._lock:
+            for case_id, case in case_database.items():
+                index._append(case_id, case, index._next_order, -1)
+                index._next_order += 1
+                index._live += 1
+            index._publish()
+        return index
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Build an index from a CaseSnapshot without re-parsing any symptom.
+
+        Args:
+            snapshot (CaseSnapshot.CaseSnapshot): The snapshot.
+
+        Returns:
+            CaseIndex: The index, at version 1.
+        """
+        index = cls()
+        index.terms = SymptomNormalizer.Vocabulary(
+            snapshot.vocabularies['term'])
+        index.environments = SymptomNormalizer.Vocabulary(
+            snapshot.vocabularies['environment'])
+        size = len(snapshot)
+        store = index._store
+
+        # Case dictionaries are rebuilt from the snapshot on first use
+        store.case_ids = snapshot.case_ids()
+        store.payloads = [None] * size
+        store.base = snapshot
+        store.order = _Column(np.int64, np.arange(size))
+        store.deleted = _Column(np.int64, np.full(size, LIVE))
+        store.previous = _Column(np.int64, np.full(size, -1))
+        store.ages = _Column(np.int64, snapshot.ages)
+        store.environments = _Column(np.int32, snapshot.environment_codes)
+        store.set_sizes = _Column(np.int32, np.diff(snapshot.term_indptr))
+        store.row_of = {case_id: row
+                        for row, case_id in enumerate(store.case_ids)}
+
+        # Invert the CSR term matrix: group the rows by term
+        term_rows = np.repeat(np.arange(size, dtype=np.int64),
+                              np.diff(snapshot.term_indptr))
+        term_ids = np.asarray(snapshot.term_indices)
+        order = np.argsort(term_ids, kind='stable')
+        term_ids, term_rows = term_ids[order], term_rows[order]
+        bounds = np.flatnonzero(np.diff(term_ids)) + 1
+        starts = np.concatenate(([0], bounds))
+        for start, rows in zip(starts, np.split(term_rows, bounds)):
+            if len(rows):
+                store.postings[int(term_ids[start])] = _Column(
+                    np.int64, rows, capacity=16)
+
+        index._next_order = size
+        index._live = size
+        with index._lock:
+            index._publish()
+        return index
+
+    @property
+    def version(self):
+        return self._version
+
+    def view(self):
+        """Return a consistent view of the current version."""
+        return self._view
+
+    def _publish(self):
+        self._version += 1
+        self._view = IndexView(self, self._store, self._version,
+                               len(self._store.case_ids), self._live)
+        return self._view
+
+    def _append(self, case_id, case, order, previous):
+        store = self._store
+        row = len(store.case_ids)
+        case = {key: list(value) if isinstance(value, list) else value
+                for key, value in case.items()}
+
+        terms, _ = SymptomNormalizer.normalize_symptoms(case['Symptoms'])
+        term_ids = sorted(self.terms.intern(term) for term in terms)
+        for term_id in term_ids:
+            store.postings.setdefault(
+                term_id, _Column(np.int64, capacity=16)).append(row)
+        store.set_sizes.append(len(term_ids))
+        store.ages.append(case['Animal Age (Months)'])
+        store.environments.append(
+            self.environments.intern(case['Environmental Conditions']))
+        store.order.append(order)
+        store.previous.append(previous)
+        store.deleted.append(LIVE)
+        store.payloads.append(case)
+        store.case_ids.append(case_id)
+        store.row_of[case_id] = row
+
+        for derived in store.derived.values():
+            derived.add(row, case_id, case)
+        return row
+
+    def _current_row(self, case_id):
+        store = self._store
+        row = store.row_of.get(case_id)
+        if row is None or store.deleted.values()[row] != LIVE:
+            return None
+        return row
+
+    def _delete_row(self, row, version):
+        store = self._store
+        store.deleted.data[row] = version
+        for derived in store.derived.values():
+            derived.remove(row, store.case_ids[row], store.case(row))
+
+    def insert(self, case_id, case):
+        """
+        Add a new case.
+
+        Args:
+            case_id (str): The new case's ID.
+            case (dict): The case, in load_case_database form.
+
+        Returns:
+            IndexView: The view of the new version.
+
+        Raises:
+            ValueError: If the case ID already exists.
+        """
+        with self._lock:
+            if self._current_row(case_id) is not None:
+                raise ValueError(f"Case {case_id} already exists")
+            previous = self._store.row_of.get(case_id, -1)
+            self._append(case_id, case, self._next_order, previous)
+            self._next_order += 1
+            self._live += 1
+            return self._publish()
+
+    def update(self, case_id, case):
+        """
+        Replace an existing case, keeping its place in the database order.
+
+        Args:
+            case_id (str): The case's ID.
+            case (dict): The new case, in load_case_database form.
+
+        Returns:
+            IndexView: The view of the new version.
+
+        Raises:
+            KeyError: If the case ID does not exist.
+        """
+        with self._lock:
+            row = self._current_row(case_id)
+            if row is None:
+                raise KeyError(case_id)
+            self._delete_row(row, self._version + 1)
+            self._append(case_id, case, int(self._store.order.data[row]), row)
+            return self._publish()
+
+    def put(self, case_id, case):
+        """Insert or update a case, like assigning to a dictionary key."""
+        with self._lock:
+            if self._current_row(case_id) is None:
+                return self.insert(case_id, case)
+            return self.update(case_id, case)
+
+    def delete(self, case_id):
+        """
+        Remove a case.
+
+        Returns:
+            IndexView: The view of the new version.
+
+        Raises:
+            KeyError: If the case ID does not exist.
+        """
+        with self._lock:
+            row = self._current_row(case_id)
+            if row is None:
+                raise KeyError(case_id)
+            self._delete_row(row, self._version + 1)
+            self._live -= 1
+            view = self._publish()
+            if len(self._store.case_ids) - self._live > max(
+                    self._live, 1024):
+                view = self.compact()
+            return view
+
+    def add_index(self, name, factory):
+        """
+        Register a derived index and build it from the current cases.
+
+        Args:
+            name (str): The name to look it up by (IndexView.derived).
+            factory (callable): Returns a new, empty DerivedIndex. It is
+            called again whenever compact() rebuilds the index.
+
+        Returns:
+            IndexView: The view of the new version.
+        """
+        with self._lock:
+            self._derived_factories[name] = factory
+            derived = factory()
+            derived.build(self._view)
+            self._store.derived[name] = derived
+            return self._publish()
+
+    def remove_index(self, name):
+        """Unregister a derived index."""
+        with self._lock:
+            del self._derived_factories[name]
+            del self._store.derived[name]
+            return self._publish()
+
+    def compact(self):
+        """
+        Rebuild the index without its deleted rows.
+
+        Views taken before keep reading the old rows.
+
+        Returns:
+            IndexView: The view of the new version.
+        """
+        with self._lock:
+            view = self._view
+            old = self._store
+            self._store = _Store(self._derived_factories)
+            for row in view.visible_rows():
+                self._append(old.case_ids[row], old.case(row),
+                             int(old.order.data[row]), -1)
+            return self._publish()
@@ -0,0 +1,555 @@
+"""
+Binary, similarity-ready snapshot of the case database.
+
+build_snapshot() parses the case CSV once and writes it as a directory of
+.npy arrays: a vocabulary per categorical column, the symptoms and
+treatments of every case as CSR (indptr/indices) arrays of vocabulary IDs,
+the ages, the merged-case counts, and the environment, sex, diagnosis and
+outcome codes. The symptoms are also normalized once (see
+SymptomNormalizer) into a CSR array of canonical term IDs, with the
+recorded temperature alongside. CaseSnapshot memory-maps those arrays, so
+opening a snapshot costs a few file opens instead of a CSV parse, and
+processes that open the same snapshot share its pages through the page
+cache.
+
+The snapshot also scores a new case against every stored case with numpy
+(CaseSnapshot.similarities), giving exactly the scores of
+CaseBasedSystem.calculate_overall_similarity; the environment similarity is
+only computed once per distinct environment.
+
+open_snapshot() rebuilds the snapshot whenever the SHA-256 of the CSV no
+longer matches the one it was built from. Several processes may do so at
+once, so every build is written to a new version directory inside the
+snapshot directory and published by atomically replacing the CURRENT file
+that names it; readers follow CURRENT and never see a partial version.
+Later builds delete the versions superseded more than STALE_SECONDS ago,
+and open_snapshot retries a version that disappears while it is being
+opened.
+
+Usage:
+    python CaseSnapshot.py "FMD cases.csv"
+"""
+
+import argparse
+import csv
+import difflib
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from array import array
+
+import numpy as np
+
+import SymptomNormalizer
+
+SNAPSHOT_VERSION = 3
+META_FILE = 'meta.json'
+# Names the published version directory inside the snapshot directory
+CURRENT_FILE = 'CURRENT'
+# How long a superseded version is kept for readers that picked it just
+# before it was replaced
+STALE_SECONDS = 300
+OPEN_ATTEMPTS = 5
+VOCABULARIES = ('symptom', 'term', 'treatment', 'environment', 'sex',
+                'diagnosis', 'outcome')
+# Case fields stored as one vocabulary code per row
+CODED_FIELDS = {
+    'Environmental Conditions': 'environment',
+    'Animal Sex': 'sex',
+    'Diagnosis': 'diagnosis',
+    'Outcome': 'outcome'
+}
+
+
+def file_sha256(path):
+    """
+    Hash a file in chunks.
+
+    Args:
+        path (str): The file to hash.
+
+    Returns:
+        str: The hex SHA-256 digest of the file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_snapshot_dir(csv_path):
+    """Return the snapshot directory used for a CSV, e.g. 'cases.snapshot'."""
+    return os.path.splitext(csv_path)[0] + '.snapshot'
+
+
+def _save_strings(directory, name, strings):
+    # Variable-length strings as one UTF-8 blob plus end offsets
+    encoded = [text.encode('utf-8') for text in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f'{name}_offsets.npy'), offsets)
+    np.save(os.path.join(directory, f'{name}_data.npy'),
+            np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+
+def _replace_text(path, text):
+    # A unique temporary name, so concurrent writers do not collide
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(temp_path, 'x') as file:
+            file.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _write_meta(version_dir, meta):
+    _replace_text(os.path.join(version_dir, META_FILE), json.dumps(meta))
+
+
+def _current_version(snapshot_dir):
+    # The published version directory, or None
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE)) as file:
+            name = file.read().strip()
+    except OSError:
+        return None
+    return os.path.join(snapshot_dir, name) if name else None
+
+
+def _remove_stale(snapshot_dir, current):
+    # Superseded and abandoned versions, and the files of the older,
+    # unversioned layout, once untouched for STALE_SECONDS. A superseded
+    # version is touched when it is replaced, so the readers that picked
+    # it just before get that long to open it.
+    cutoff = time.time() - STALE_SECONDS
+    for entry in os.scandir(snapshot_dir):
+        if entry.name == CURRENT_FILE or entry.path == current:
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def build_snapshot(csv_path, snapshot_dir=None, sha256=None):
+    """
+    Parse the case CSV and write its snapshot.
+
+    Rows are read exactly like CaseBasedSystem.load_case_database does,
+    including a later row replacing an earlier one with the same case ID.
+
+    Args:
+        csv_path (str): The case database CSV.
+        snapshot_dir (str): The directory to write the snapshot to. An
+        existing snapshot there is replaced; readers that already opened
+        it keep reading it. Defaults to default_snapshot_dir(csv_path).
+        sha256 (str): The digest of the CSV, if the caller already has it.
+
+    Returns:
+        CaseSnapshot: The new snapshot.
+    """
+    snapshot_dir = snapshot_dir or default_snapshot_dir(csv_path)
+    stat = os.stat(csv_path)
+    sha256 = sha256 or file_sha256(csv_path)
+
+    rows = {}
+    with open(csv_path, 'r') as file:
+        for row in csv.DictReader(file):
+            rows[row['Case ID']] = row
+
+    vocabularies = {name: {} for name in VOCABULARIES}
+
+    def code(name, value):
+        return vocabularies[name].setdefault(value, len(vocabularies[name]))
+
+    symptom_indptr = array('q', [0])
+    symptom_indices = array('i')
+    term_indptr = array('q', [0])
+    term_indices = array('i')
+    temperatures = array('d')
+    treatment_indptr = array('q', [0])
+    treatment_indices = array('i')
+    ages = array('i')
+    # 0 for the cases without a Count column value
+    counts = array('i')
+    columns = {name: array('i')
+               for name in ('environment', 'sex', 'diagnosis', 'outcome')}
+
+    for row in rows.values():
+        symptoms = row['Symptoms'].split(', ')
+        for symptom in symptoms:
+            symptom_indices.append(code('symptom', symptom))
+        symptom_indptr.append(len(symptom_indices))
+
+        terms, fields = SymptomNormalizer.normalize_symptoms(symptoms)
+        term_indices.extend(sorted(code('term', term) for term in terms))
+        term_indptr.append(len(term_indices))
+        if 'temperature_c' in fields:
+            fields.setdefault(
+                'temperature_f', fields['temperature_c'] * 9 / 5 + 32)
+        temperatures.append(fields.get('temperature_f', np.nan))
+
+        for treatment in row['Treatment'].split(', '):
+            treatment_indices.append(code('treatment', treatment))
+        treatment_indptr.append(len(treatment_indices))
+
+        ages.append(int(row['Animal Age (Months)']))
+        counts.append(int(row.get('Count') or 0))
+        columns['environment'].append(
+            code('environment', row['Environmental Conditions']))
+        columns['sex'].append(code('sex', row['Animal Sex']))
+        columns['diagnosis'].append(code('diagnosis', row['Diagnosis']))
+        columns['outcome'].append(code('outcome', row['Outcome']))
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    # Built under a hidden name, then renamed and published
+    version = f'v-{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+    staging = os.path.join(snapshot_dir, '.' + version)
+    version_dir = os.path.join(snapshot_dir, version)
+    os.mkdir(staging)
+
+    try:
+        def save(name, values, dtype):
+            np.save(os.path.join(staging, name + '.npy'),
+                    np.frombuffer(values, dtype=dtype))
+
+        _save_strings(staging, 'case_id', list(rows))
+        for name, vocabulary in vocabularies.items():
+            _save_strings(staging, name + '_vocabulary', list(vocabulary))
+        save('symptom_indptr', symptom_indptr, np.int64)
+        save('symptom_indices', symptom_indices, np.int32)
+        save('term_indptr', term_indptr, np.int64)
+        save('term_indices', term_indices, np.int32)
+        save('temperature_f', temperatures, np.float64)
+        save('treatment_indptr', treatment_indptr, np.int64)
+        save('treatment_indices', treatment_indices, np.int32)
+        save('age', ages, np.int32)
+        save('count', counts, np.int32)
+        for name, values in columns.items():
+            save(name + '_code', values, np.int32)
+
+        _write_meta(staging, {
+            'version': SNAPSHOT_VERSION,
+            'cases': len(rows),
+            'sha256': sha256,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        })
+
+        os.rename(staging, version_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    previous = _current_version(snapshot_dir)
+    _replace_text(os.path.join(snapshot_dir, CURRENT_FILE), version)
+    if previous is not None:
+        try:
+            os.utime(previous)
+        except FileNotFoundError:
+            pass
+    _remove_stale(snapshot_dir, version_dir)
+    return CaseSnapshot(version_dir)
+
+
+def _read_meta(version_dir):
+    if version_dir is None:
+        return None
+    try:
+        with open(os.path.join(version_dir, META_FILE)) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != SNAPSHOT_VERSION:
+        return None
+    return meta
+
+
+def _open_snapshot(csv_path, snapshot_dir):
+    version_dir = _current_version(snapshot_dir)
+    meta = _read_meta(version_dir)
+    stat = os.stat(csv_path)
+
+    if meta is not None and (meta['size'], meta['mtime_ns']) == (
+            stat.st_size, stat.st_mtime_ns):
+        return CaseSnapshot(version_dir)
+
+    sha256 = file_sha256(csv_path)
+    if meta is not None and meta['sha256'] == sha256:
+        meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        _write_meta(version_dir, meta)
+        return CaseSnapshot(version_dir)
+
+    return build_snapshot(csv_path, snapshot_dir, sha256)
+
+
+def open_snapshot(csv_path, snapshot_dir=None):
+    """
+    Open the snapshot of a case CSV, rebuilding it if the CSV changed.
+
+    The CSV is only hashed when its size or modification time differ from
+    the ones recorded in the snapshot; if the hash still matches (e.g. the
+    file was touched or copied), the recorded stat is refreshed instead of
+    rebuilding.
+
+    Args:
+        csv_path (str): The case database CSV.
+        snapshot_dir (str): The snapshot directory. Defaults to
+        default_snapshot_dir(csv_path).
+
+    Returns:
+        CaseSnapshot: A snapshot that matches the CSV's current content.
+    """
+    snapshot_dir = snapshot_dir or default_snapshot_dir(csv_path)
+    os.stat(csv_path)
+    for attempt in range(OPEN_ATTEMPTS):
+        try:
+            return _open_snapshot(csv_path, snapshot_dir)
+        except FileNotFoundError:
+            # The version was superseded and removed while it was opened;
+            # CURRENT names a newer one
+            if attempt == OPEN_ATTEMPTS - 1:
+                raise
+
+
+def _decode_strings(offsets, data):
+    data = bytes(data)
+    return [data[start:end].decode('utf-8')
+            for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+class CaseSnapshot:
+    """
+    Read-only, memory-mapped view of a snapshot written by build_snapshot.
+
+    Cases are addressed by their row index; case(i) rebuilds the dictionary
+    that load_case_database would hold for that row. Every file is opened
+    by the constructor, so the view stays readable after its version is
+    superseded and deleted.
+
+    Args:
+        snapshot_dir (str): The version directory of the snapshot.
+    """
+
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        with open(os.path.join(snapshot_dir, META_FILE)) as file:
+            self.meta = json.load(file)
+
+        self.symptom_indptr = self._load('symptom_indptr')
+        self.symptom_indices = self._load('symptom_indices')
+        self.term_indptr = self._load('term_indptr')
+        self.term_indices = self._load('term_indices')
+        self.temperatures = self._load('temperature_f')
+        self.treatment_indptr = self._load('treatment_indptr')
+        self.treatment_indices = self._load('treatment_indices')
+        self.ages = self._load('age')
+        self.counts = self._load('count')
+        self.environment_codes = self._load('environment_code')
+        self.sex_codes = self._load('sex_code')
+        self.diagnosis_codes = self._load('diagnosis_code')
+        self.outcome_codes = self._load('outcome_code')
+        self._case_ids = (self._load('case_id_offsets'),
+                          self._load('case_id_data'))
+
+        # The vocabularies are small; keep them as Python lists
+        self.vocabularies = {
+            name: self._strings(name + '_vocabulary')
+            for name in VOCABULARIES}
+        self.terms = SymptomNormalizer.Vocabulary(self.vocabularies['term'])
+        self._row_of = None
+
+    def _load(self, name):
+        return np.load(os.path.join(self.snapshot_dir, name + '.npy'),
+                       mmap_mode='r')
+
+    def _strings(self, name):
+        return _decode_strings(self._load(name + '_offsets'),
+                               self._load(name + '_data'))
+
+    def __len__(self):
+        return self.meta['cases']
+
+    @property
+    def source_stat(self):
+        """The (size, mtime_ns) of the CSV the snapshot matches."""
+        return self.meta['size'], self.meta['mtime_ns']
+
+    def case_id(self, index):
+        offsets, data = self._case_ids
+        return bytes(data[offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+    def case_ids(self):
+        """Return the case ID of every row, as a list."""
+        return _decode_strings(*self._case_ids)
+
+    def row_of(self, case_id):
+        """Return the row index of a case ID, or None if it is unknown."""
+        if self._row_of is None:
+            self._row_of = {
+                self.case_id(index): index for index in range(len(self))}
+        return self._row_of.get(case_id)
+
+    def case(self, index):
+        """Return row `index` as a load_case_database case dictionary."""
+        symptoms = self.vocabularies['symptom']
+        treatments = self.vocabularies['treatment']
+        symptom_ids = self.symptom_indices[
+            self.symptom_indptr[index]:self.symptom_indptr[index + 1]]
+        treatment_ids = self.treatment_indices[
+            self.treatment_indptr[index]:self.treatment_indptr[index + 1]]
+        case = {
+            'Symptoms': [symptoms[i] for i in symptom_ids],
+            'Animal Age (Months)': int(self.ages[index]),
+            'Animal Sex': self.vocabularies['sex'][self.sex_codes[index]],
+            'Environmental Conditions': self.vocabularies['environment'][
+                self.environment_codes[index]],
+            'Diagnosis': self.vocabularies['diagnosis'][
+                self.diagnosis_codes[index]],
+            'Treatment': [treatments[i] for i in treatment_ids],
+            'Outcome': self.vocabularies['outcome'][self.outcome_codes[index]]
+        }
+        if self.counts[index]:
+            case['Count'] = int(self.counts[index])
+        return case
+
+    def column(self, field):
+        """
+        Return one field of every case without building the cases.
+
+        Args:
+            field (str): 'Animal Age (Months)', 'Treatment', 'Count' or one
+            of CODED_FIELDS.
+
+        Returns:
+            list: The field's value for each row; for 'Count', None where
+            the case has none.
+        """
+        if field == 'Animal Age (Months)':
+            return self.ages.tolist()
+        if field == 'Count':
+            return np.where(self.counts > 0, self.counts.astype(object),
+                            None).tolist()
+        if field == 'Treatment':
+            names = np.asarray(self.vocabularies['treatment'], dtype=object)
+            treatments = names[self.treatment_indices].tolist()
+            bounds = self.treatment_indptr.tolist()
+            return [treatments[start:end]
+                    for start, end in zip(bounds[:-1], bounds[1:])]
+        name = CODED_FIELDS[field]
+        values = np.asarray(self.vocabularies[name], dtype=object)
+        return values[getattr(self, name + '_codes')].tolist()
+
+    def to_case_database(self):
+        """
+        Rebuild the whole case database dictionary.
+
+        Returns:
+            dict: The same dictionary load_case_database returns for the CSV.
+        """
+        return {self.case_id(index): self.case(index)
+                for index in range(len(self))}
+
+    def similarities(self, new_case, weights):
+        """
+        Score a new case against every case in the snapshot.
+
+        Args:
+            new_case (dict): A dictionary representing the new case.
+            weights (dict): The weight of each feature, as for
+            calculate_overall_similarity.
+
+        Returns:
+            numpy.ndarray: The overall similarity of each row.
+        """
+        # Symptoms: |new & existing| / max(|new|, |existing|, 1) over the
+        # normalized term sets; terms the snapshot has never seen count
+        # towards |new| but cannot match
+        new_terms, _ = SymptomNormalizer.normalize_symptoms(
+            new_case.get('Symptoms', []))
+        known = np.array(
+            [self.terms.lookup(term) for term in new_terms
+             if self.terms.lookup(term) is not None], dtype=np.int32)
+        matches = np.isin(self.term_indices, known)
+        counts = np.concatenate(([0], np.cumsum(matches, dtype=np.int64)))
+        common = counts[self.term_indptr[1:]] - counts[self.term_indptr[:-1]]
+        symptom_similarity = common / np.maximum(
+            np.diff(self.term_indptr), max(len(new_terms), 1))
+
+        # Age: 1 - |new - existing| / max(new, existing), or 1 if both are 0
+        new_age = new_case.get('Animal Age (Months)', 0)
+        ages = np.asarray(self.ages, dtype=np.int64)
+        max_age = np.maximum(ages, new_age)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            age_similarity = np.where(
+                max_age > 0, 1 - np.abs(new_age - ages) / max_age, 1.0)
+
+        # Environment: one SequenceMatcher per distinct environment
+        new_conditions = new_case.get('Environmental Conditions', '')
+        environment_similarity = np.array(
+            [difflib.SequenceMatcher(None, new_conditions, text).ratio()
+             for text in self.vocabularies['environment']],
+            dtype=np.float64)[self.environment_codes]
+
+        return (weights['Symptoms'] * symptom_similarity +
+                weights['Animal Age (Months)'] * age_similarity +
+                weights['Environmental Conditions'] * environment_similarity)
+
+    def retrieve(self, new_case, weights, similarity_threshold=0.5, top_n=3):
+        """
+        Retrieve the most similar cases for a new case.
+
+        Returns the same cases, in the same order, as
+        CaseBasedSystem.retrieve_similar_cases: best score first, ties in
+        database order.
+
+        Args:
+            new_case (dict): A dictionary representing the new case.
+            weights (dict): The weight of each feature.
+            similarity_threshold (float): The minimum similarity score.
+            top_n (int): The maximum number of cases to retrieve.
+
+        Returns:
+            list: (case ID, case dictionary, similarity score) tuples.
+        """
+        scores = self.similarities(new_case, weights)
+        candidates = np.flatnonzero(scores >= similarity_threshold)
+        order = np.argsort(-scores[candidates], kind='stable')[:top_n]
+        return [(self.case_id(index), self.case(index), float(scores[index]))
+                for index in candidates[order]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('csv_path', nargs='?', default='FMD cases.csv')
+    parser.add_argument('--snapshot', default=None,
+                        help='snapshot directory (default: next to the CSV)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    snapshot = build_snapshot(args.csv_path, args.snapshot)
+    built = time.perf_counter() - start
+
+    start = time.perf_counter()
+    snapshot = open_snapshot(args.csv_path, args.snapshot)
+    opened = time.perf_counter() - start
+
+    print(f"Built a snapshot of {len(snapshot)} cases in "
+          f"{snapshot.snapshot_dir} ({built * 1000:.1f} ms); "
+          f"reopening it took {opened * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
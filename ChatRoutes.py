@@ -0,0 +1,49 @@
+"""
+Chatbot blueprint: answers questions with the fine-tuned LLM or the
+retrieval-augmented pipeline.
+
+The model modules connect to their backends and build the RAG index when
+they are imported, so each one is only imported the first time a question
+is routed to it.
+"""
+
+import importlib
+
+from flask import Blueprint, jsonify, render_template, request
+
+import Instrumentation
+from AppFactory import subsystem
+
+blueprint = Blueprint('chat', __name__)
+
+
+def init_subsystems(registry):
+    registry.register(
+        'llm', lambda app: importlib.import_module('ModelInference'))
+    registry.register(
+        'rag',
+        lambda app: importlib.import_module('RetreivalAugmentedGeneration'))
+
+
+@blueprint.route('/chatbot')
+def chatbot():
+    return render_template('chatbot.html')
+
+
+@blueprint.route('/query', methods=['POST'])
+def query():
+    data = request.json
+    user_query = data.get('query')
+    model_no = int(data.get('model_no'))
+
+    if model_no == 1:
+        model_inference = subsystem('llm')
+        with Instrumentation.upstream_call('llm'):
+            answer = model_inference.llm_chain.invoke(input=f"{user_query}")
+        answer = answer['text']
+    else:
+        rag = subsystem('rag')
+        with Instrumentation.upstream_call('rag'):
+            answer = rag.LLM_Run(str(user_query))
+
+    return jsonify({'response': answer})
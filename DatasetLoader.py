@@ -0,0 +1,192 @@
+"""
+Streaming access to the fine-tuning dataset.
+
+fetch() downloads NewData.json once into a local cache file; after that
+everything works offline. The samples are read with an incremental JSON
+parser, one array element at a time, so neither the download nor the
+batching ever holds the whole dataset in memory. Shuffled batching only
+keeps the byte offsets of the samples and seeks to each one in turn.
+
+Usage:
+    python DatasetLoader.py NewData.json --batch-size 100 --shuffle
+"""
+
+import argparse
+import codecs
+import json
+import os
+import random
+from array import array
+
+DATASET_URL = ("https://raw.githubusercontent.com/swafey-karanja/"
+               "Model-training/main/NewData.json")
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+def fetch(url=DATASET_URL, cache_path='NewData.json'):
+    """
+    Download the dataset into a local cache file unless it already exists.
+
+    Args:
+        url (str): The URL of the dataset.
+        cache_path (str): The local file to keep the dataset in.
+
+    Returns:
+        str: The path of the cached dataset.
+    """
+    if os.path.exists(cache_path):
+        return cache_path
+
+    import requests
+
+    temp_path = cache_path + '.part'
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(temp_path, 'wb') as file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                file.write(chunk)
+    os.replace(temp_path, cache_path)
+
+    return cache_path
+
+
+def _scan(path):
+    # Yield (start byte, end byte, element) for each element of the
+    # top-level JSON array, decoding the file CHUNK_SIZE bytes at a time.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    buffer_start = 0  # byte offset of buffer[0] in the file
+    started = False
+    eof = False
+
+    with open(path, 'rb') as file:
+        while True:
+            # Skip whitespace, the opening bracket and separators
+            position = 0
+            while position < len(buffer) and (
+                    buffer[position] in ' \t\r\n,' or
+                    (not started and buffer[position] == '[')):
+                started = started or buffer[position] == '['
+                position += 1
+            if position:
+                buffer_start += len(buffer[:position].encode('utf-8'))
+                buffer = buffer[position:]
+
+            if buffer.startswith(']'):
+                return
+
+            if buffer:
+                try:
+                    element, end = _decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    element = None
+                # An element that ends exactly at the end of the buffer may
+                # still be incomplete (e.g. a number), so wait for more data
+                if element is not None and (end < len(buffer) or eof):
+                    size = len(buffer[:end].encode('utf-8'))
+                    yield buffer_start, buffer_start + size, element
+                    buffer_start += size
+                    buffer = buffer[end:]
+                    continue
+
+            if eof:
+                if buffer.strip():
+                    raise ValueError(f"{path}: truncated JSON array")
+                return
+
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer += decoder.decode(chunk, final=eof)
+
+
+def iter_samples(path):
+    """
+    Stream the samples of a dataset file.
+
+    Args:
+        path (str): A JSON file containing a list of samples.
+
+    Yields:
+        dict: One sample at a time.
+    """
+    for _, _, sample in _scan(path):
+        yield sample
+
+
+def sample_offsets(path):
+    """
+    Find the byte range of every sample in a dataset file.
+
+    Args:
+        path (str): A JSON file containing a list of samples.
+
+    Returns:
+        tuple: Two arrays with the start and end byte offset of each sample.
+    """
+    starts = array('q')
+    ends = array('q')
+    for start, end, _ in _scan(path):
+        starts.append(start)
+        ends.append(end)
+    return starts, ends
+
+
+def iter_batches(path, batch_size=100, shuffle=False, seed=42):
+    """
+    Stream the samples of a dataset file in fine-tuning batches.
+
+    Args:
+        path (str): A JSON file containing a list of samples.
+        batch_size (int): The maximum number of samples per batch.
+        shuffle (bool): Whether to visit the samples in a random order.
+        seed (int): The seed of the shuffle, so runs are reproducible.
+
+    Yields:
+        list: Up to batch_size samples.
+    """
+    if not shuffle:
+        batch = []
+        for sample in iter_samples(path):
+            batch.append(sample)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+
+    starts, ends = sample_offsets(path)
+    order = list(range(len(starts)))
+    random.Random(seed).shuffle(order)
+
+    with open(path, 'rb') as file:
+        for first in range(0, len(order), batch_size):
+            batch = []
+            for index in order[first:first + batch_size]:
+                file.seek(starts[index])
+                batch.append(json.loads(
+                    file.read(ends[index] - starts[index]).decode('utf-8')))
+            yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('cache_path', nargs='?', default='NewData.json')
+    parser.add_argument('--url', default=DATASET_URL)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--shuffle', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    path = fetch(args.url, args.cache_path)
+    sizes = [len(batch) for batch in iter_batches(
+        path, args.batch_size, args.shuffle, args.seed)]
+    print("Dataset Size:", sum(sizes))
+    print("Batches size")
+    print(sizes)
+
+
+if __name__ == "__main__":
+    main()
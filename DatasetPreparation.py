@@ -0,0 +1,300 @@
+"""
+Single-pass parsing of the instruction/response training records into a
+columnar cache.
+
+Every training sample has an 'inputs' string made of one or more turns in
+the format
+
+    <s>### Instruction:\n{instruction} \n\n### Response:\n{response}</s>
+
+prepare() parses each sample once with a precompiled pattern and writes
+the raw inputs, the instructions and the responses as UTF-8 blobs with
+offset arrays (one .npy file per column). PreparedDataset memory-maps the
+columns, so evaluation and fine-tuning batching read strings straight from
+the cache without re-parsing or loading the whole dataset.
+
+Usage:
+    python DatasetPreparation.py NewData.json --cache dataset_cache
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+from array import array
+
+import numpy as np
+
+TURN_PATTERN = re.compile(
+    r'<s>### Instruction:\n(?P<instruction>(?:(?!</s>).)*?) \n'
+    r'(?:(?!</s>).)*?Response:\n(?P<response>.*?)</s>', re.DOTALL)
+
+TEXT_COLUMNS = ('inputs', 'instruction', 'response')
+META_FILE = 'meta.json'
+
+
+def parse_turns(inputs):
+    """
+    Parse every instruction/response turn of a training sample.
+
+    Args:
+        inputs (str): The sample's 'inputs' string.
+
+    Returns:
+        list: (instruction, response) tuples in the order they appear.
+    """
+    return [match.group('instruction', 'response')
+            for match in TURN_PATTERN.finditer(inputs)]
+
+
+def iter_pairs(samples):
+    """
+    Stream the instruction/response pairs of a sequence of samples.
+
+    Args:
+        samples (iterable): Samples with an 'inputs' string.
+
+    Yields:
+        tuple: The sample index, the instruction and the response.
+    """
+    for sample_index, sample in enumerate(samples):
+        for instruction, response in parse_turns(sample['inputs']):
+            yield sample_index, instruction, response
+
+
+class _BlobWriter:
+    # Appends strings to a temporary file and records their end offsets,
+    # so a column never has to be held in memory as a list of strings.
+
+    def __init__(self, directory, name):
+        self.path = os.path.join(directory, name + '.blob')
+        self.file = open(self.path, 'wb')
+        self.offsets = array('q', [0])
+
+    def append(self, text):
+        data = text.encode('utf-8')
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def save(self, cache_dir, name):
+        self.file.close()
+        size = self.offsets[-1]
+        data = np.lib.format.open_memmap(
+            os.path.join(cache_dir, f'{name}_data.npy'), mode='w+',
+            dtype=np.uint8, shape=(size,))
+        with open(self.path, 'rb') as blob:
+            position = 0
+            for chunk in iter(lambda: blob.read(1 << 20), b''):
+                data[position:position + len(chunk)] = np.frombuffer(
+                    chunk, dtype=np.uint8)
+                position += len(chunk)
+        data.flush()
+        del data
+        np.save(os.path.join(cache_dir, f'{name}_offsets.npy'),
+                np.frombuffer(self.offsets, dtype=np.int64))
+        os.remove(self.path)
+
+
+def prepare(samples, cache_dir, source=''):
+    """
+    Parse the samples in one pass and write the columnar cache.
+
+    Args:
+        samples (iterable): Samples with an 'inputs' string. It is consumed
+        once, so a generator works.
+        cache_dir (str): The directory to write the cache to. An existing
+        cache there is replaced.
+        source (str): An identifier of the source data (e.g. its hash),
+        stored so callers can tell whether the cache is current.
+
+    Returns:
+        PreparedDataset: The prepared dataset.
+    """
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.prepare-')
+
+    try:
+        columns = {name: _BlobWriter(staging, name) for name in TEXT_COLUMNS}
+        pair_samples = array('q')
+        pair_turns = array('i')
+        sample_count = 0
+
+        for sample_index, sample in enumerate(samples):
+            inputs = sample['inputs']
+            columns['inputs'].append(inputs)
+            for turn, (instruction, response) in enumerate(
+                    parse_turns(inputs)):
+                columns['instruction'].append(instruction)
+                columns['response'].append(response)
+                pair_samples.append(sample_index)
+                pair_turns.append(turn)
+            sample_count += 1
+
+        for name, writer in columns.items():
+            writer.save(staging, name)
+        np.save(os.path.join(staging, 'pair_sample.npy'),
+                np.frombuffer(pair_samples, dtype=np.int64))
+        np.save(os.path.join(staging, 'pair_turn.npy'),
+                np.frombuffer(pair_turns, dtype=np.int32))
+
+        with open(os.path.join(staging, META_FILE), 'w') as file:
+            json.dump({'source': source, 'samples': sample_count,
+                       'pairs': len(pair_samples)}, file)
+
+        # Swap the finished cache in so readers never see a partial one
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.replace(staging, cache_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    return PreparedDataset(cache_dir)
+
+
+def file_source(path):
+    """
+    Build a source identifier for a dataset file from its path, size and
+    modification time.
+
+    Args:
+        path (str): The dataset file.
+
+    Returns:
+        str: The identifier to pass to prepare and is_current.
+    """
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def is_current(cache_dir, source):
+    """
+    Check whether a cache exists and was prepared from the given source.
+
+    Args:
+        cache_dir (str): The cache directory.
+        source (str): The source identifier passed to prepare.
+
+    Returns:
+        bool: True if the cache can be used as is.
+    """
+    try:
+        with open(os.path.join(cache_dir, META_FILE)) as file:
+            return json.load(file)['source'] == source
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def load_or_prepare(cache_dir, source, load_samples):
+    """
+    Open the cache if it is current, otherwise prepare it.
+
+    Args:
+        cache_dir (str): The cache directory.
+        source (str): The source identifier of the data.
+        load_samples (callable): Returns the samples; only called when the
+        cache has to be rebuilt.
+
+    Returns:
+        PreparedDataset: The prepared dataset.
+    """
+    if is_current(cache_dir, source):
+        return PreparedDataset(cache_dir)
+    return prepare(load_samples(), cache_dir, source=source)
+
+
+class PreparedDataset:
+    """
+    Read-only, memory-mapped view of a cache written by prepare.
+
+    len() is the number of samples; the instruction/response pairs are
+    indexed separately since a sample may hold several turns.
+
+    Args:
+        cache_dir (str): The cache directory.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, META_FILE)) as file:
+            self.meta = json.load(file)
+
+        def load(name):
+            return np.load(os.path.join(cache_dir, name + '.npy'),
+                           mmap_mode='r')
+
+        self._columns = {
+            name: (load(f'{name}_offsets'), load(f'{name}_data'))
+            for name in TEXT_COLUMNS}
+        self.pair_sample = load('pair_sample')
+        self.pair_turn = load('pair_turn')
+
+    def __len__(self):
+        return self.meta['samples']
+
+    @property
+    def num_pairs(self):
+        return self.meta['pairs']
+
+    def _text(self, column, index):
+        offsets, data = self._columns[column]
+        return bytes(data[offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+    def sample(self, index):
+        """Return sample `index` as a {'inputs': ...} dictionary."""
+        return {'inputs': self._text('inputs', index)}
+
+    def samples(self, start=0, stop=None):
+        """Return samples [start, stop) as {'inputs': ...} dictionaries."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        return [self.sample(index) for index in range(start, stop)]
+
+    def pair(self, index):
+        """Return pair `index` as (sample index, instruction, response)."""
+        return (int(self.pair_sample[index]),
+                self._text('instruction', index),
+                self._text('response', index))
+
+    def pairs(self, start=0, stop=None):
+        """
+        Iterate over the pairs belonging to samples [start, stop).
+
+        Yields:
+            tuple: The sample index, the instruction and the response.
+        """
+        first = int(np.searchsorted(self.pair_sample, start, side='left'))
+        last = self.num_pairs if stop is None else int(
+            np.searchsorted(self.pair_sample, stop, side='left'))
+        for index in range(first, last):
+            yield self.pair(index)
+
+    def batches(self, batch_size=100):
+        """
+        Iterate over the samples in fine-tuning batches.
+
+        Yields:
+            list: Up to batch_size {'inputs': ...} dictionaries.
+        """
+        for start in range(0, len(self), batch_size):
+            yield self.samples(start, start + batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('dataset', help='JSON list of training samples')
+    parser.add_argument('--cache', default='dataset_cache')
+    args = parser.parse_args()
+
+    with open(args.dataset, encoding='utf-8') as file:
+        samples = json.load(file)
+    dataset = prepare(samples, args.cache,
+                      source=file_source(args.dataset))
+    print(f"Prepared {len(dataset)} samples with {dataset.num_pairs} "
+          f"instruction/response pairs into {args.cache}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Parallel, resumable evaluation of the fine-tuned model.
+
+Generations run on a bounded thread pool and every finished sample is
+appended to a JSONL checkpoint, so an interrupted run picks up where it
+stopped. BLEU and ROUGE are computed once over the whole corpus at the end
+instead of once per sample.
+
+Usage:
+    python EvaluationHarness.py NewData.json --checkpoint eval.jsonl
+    python EvaluationHarness.py NewData.json --stub --limit 50
+
+--limit counts samples; every instruction/response turn of those samples
+is evaluated.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import DatasetPreparation
+
+
+class StubModel:
+    """
+    An offline stand-in for the fine-tuned model.
+
+    It answers by echoing the instruction, which is enough to exercise the
+    pool, the checkpointing and the metrics without any network access.
+
+    Args:
+        latency (float): Seconds to sleep per generation.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def run(self, Instruction):
+        if self.latency:
+            time.sleep(self.latency)
+        return f"{Instruction} Consult a veterinarian for treatment."
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Load the finished samples from a JSONL checkpoint.
+
+    Args:
+        checkpoint_path (str): The checkpoint file. It may not exist yet.
+
+    Returns:
+        dict: The checkpoint records keyed by sample index.
+    """
+    records = {}
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return records
+
+    with open(checkpoint_path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves a partial last line
+                continue
+            records[record['index']] = record
+    return records
+
+
+def run_generations(pairs, generate, checkpoint_path=None, max_workers=4):
+    """
+    Generate responses for every instruction, resuming from a checkpoint.
+
+    Args:
+        pairs (list): (index, instruction, target response) tuples.
+        generate (callable): Takes an instruction and returns the model's
+        response.
+        checkpoint_path (str): A JSONL file that finished samples are
+        appended to. None disables checkpointing.
+        max_workers (int): The maximum number of concurrent generations.
+
+    Returns:
+        list: One record per finished sample, ordered by index. Samples that
+        raised are reported with an 'error' and are not checkpointed, so they
+        are retried on the next run.
+    """
+    done = load_checkpoint(checkpoint_path)
+    pending = [
+        (index, instruction, target) for index, instruction, target in pairs
+        if done.get(index, {}).get('instruction') != instruction]
+    records = {index: done[index] for index, _, _ in pairs if index in done}
+
+    def timed_generate(instruction):
+        start = time.perf_counter()
+        response = generate(instruction)
+        return response, time.perf_counter() - start
+
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = open(checkpoint_path, 'a', encoding='utf-8')
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(timed_generate, instruction):
+                (index, instruction, target)
+                for index, instruction, target in pending}
+
+            for future in as_completed(futures):
+                index, instruction, target = futures[future]
+                record = {'index': index, 'instruction': instruction,
+                          'target': target}
+                try:
+                    record['response'], record['seconds'] = future.result()
+                except Exception as error:
+                    record['error'] = repr(error)
+                    records[index] = record
+                    continue
+
+                records[index] = record
+                if checkpoint is not None:
+                    checkpoint.write(json.dumps(record) + '\n')
+                    checkpoint.flush()
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+    return [records[index] for index in sorted(records)]
+
+
+def compute_corpus_scores(hypotheses, references):
+    """
+    Compute corpus-level BLEU and average ROUGE in a single pass.
+
+    Args:
+        hypotheses (list): The generated responses.
+        references (list): The target responses.
+
+    Returns:
+        dict: The BLEU score and the ROUGE-1/2/L F1 scores.
+    """
+    from nltk.translate.bleu_score import corpus_bleu
+    from rouge import Rouge
+
+    # Rouge raises on empty hypotheses, so they only count towards BLEU
+    scored = [(hypothesis, reference)
+              for hypothesis, reference in zip(hypotheses, references)
+              if hypothesis.strip() and reference.strip()]
+
+    scores = {'bleu': 0.0, 'rouge-1': 0.0, 'rouge-2': 0.0, 'rouge-l': 0.0}
+    if hypotheses:
+        scores['bleu'] = corpus_bleu(
+            [[reference.split()] for reference in references],
+            [hypothesis.split() for hypothesis in hypotheses])
+    if scored:
+        rouge_scores = Rouge().get_scores(
+            [hypothesis for hypothesis, _ in scored],
+            [reference for _, reference in scored], avg=True)
+        for key in ('rouge-1', 'rouge-2', 'rouge-l'):
+            scores[key] = rouge_scores[key]['f']
+    return scores
+
+
+def summarize(records):
+    """
+    Build the summary report for a set of evaluation records.
+
+    Args:
+        records (list): Records returned by run_generations.
+
+    Returns:
+        dict: Sample and error counts, latency statistics and corpus scores.
+    """
+    finished = [record for record in records if 'error' not in record]
+    latencies = sorted(record['seconds'] for record in finished)
+
+    report = {
+        'samples': len(records),
+        'finished': len(finished),
+        'errors': len(records) - len(finished),
+        'mean_latency_s': sum(latencies) / len(latencies) if latencies else 0,
+        'p95_latency_s':
+            latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    }
+    report.update(compute_corpus_scores(
+        [record['response'] for record in finished],
+        [record['target'] for record in finished]))
+    return report
+
+
+def print_report(report):
+    """Print a summary report returned by summarize."""
+    print(f"\nEvaluated {report['finished']} of {report['samples']} samples "
+          f"({report['errors']} errors)")
+    print(f"Mean latency: {report['mean_latency_s']:.2f}s, "
+          f"p95: {report['p95_latency_s']:.2f}s")
+    print("Corpus BLEU Score:", report['bleu'])
+    print("\tROUGE-1 F1 Score:", report['rouge-1'])
+    print("\tROUGE-2 F1 Score:", report['rouge-2'])
+    print("\tROUGE-L F1 Score:", report['rouge-l'])
+
+
+def evaluate(pairs, generate, checkpoint_path=None, max_workers=4):
+    """
+    Evaluate a model on instruction/response pairs and return the summary
+    report.
+
+    Args:
+        pairs (iterable): (sample index, instruction, response) tuples, as
+        yielded by DatasetPreparation.iter_pairs or PreparedDataset.pairs.
+        generate (callable): Takes an instruction and returns the model's
+        response.
+        checkpoint_path (str): The JSONL checkpoint, or None.
+        max_workers (int): The maximum number of concurrent generations.
+
+    Returns:
+        tuple: The summary report (dict) and the per-pair records (list).
+    """
+    indexed = [(index, instruction, response)
+               for index, (_, instruction, response) in enumerate(pairs)]
+
+    records = run_generations(indexed, generate, checkpoint_path, max_workers)
+    return summarize(records), records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('dataset', help='JSON list of training samples')
+    parser.add_argument('--cache', default='dataset_cache',
+                        help='columnar cache written by DatasetPreparation')
+    parser.add_argument('--checkpoint', default='evaluation.jsonl')
+    parser.add_argument('--report', default=None,
+                        help='write the summary report to this JSON file')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--stub', action='store_true',
+                        help='evaluate the offline stub model')
+    parser.add_argument('--stub-latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    def load_samples():
+        with open(args.dataset, encoding='utf-8') as file:
+            return json.load(file)
+
+    dataset = DatasetPreparation.load_or_prepare(
+        args.cache, DatasetPreparation.file_source(args.dataset),
+        load_samples)
+
+    if args.stub:
+        model = StubModel(args.stub_latency)
+    else:
+        from ModelInference import llm_chain as model
+
+    report, _ = evaluate(
+        dataset.pairs(stop=args.limit or None),
+        lambda instruction: model.run(Instruction=instruction),
+        args.checkpoint, args.workers)
+    print_report(report)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Image search blueprint: upload an image, match it against the local
+gallery, and fall back to Google Vision web detection.
+
+The Google client libraries take seconds and tens of MB to import, so they
+are only imported when the first image falls through to Vision.
+"""
+
+import threading
+import typing
+
+from flask import (Blueprint, current_app, jsonify, redirect,
+                   render_template, request)
+
+import Instrumentation
+import LocalImageSearch
+from AppFactory import subsystem
+from UploadStore import UploadStore
+
+if typing.TYPE_CHECKING:
+    from google.cloud import vision
+
+blueprint = Blueprint('images', __name__)
+
+
+class VisionClients:
+    """
+    One ImageAnnotatorClient per allowed quota project, created on first
+    use.
+
+    Building a client loads the service account credentials and opens a
+    gRPC channel, so clients are kept and shared between requests. Only
+    the projects configured on the server can be billed, which also
+    bounds the number of clients kept.
+
+    Args:
+        credentials_path (str): The service account JSON file.
+        quota_project_ids (iterable): The quota projects allowed.
+    """
+
+    def __init__(self, credentials_path, quota_project_ids):
+        self.credentials_path = credentials_path
+        self.quota_project_ids = frozenset(quota_project_ids)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, quota_project_id):
+        from google.auth import load_credentials_from_file
+        from google.cloud import vision
+
+        if quota_project_id not in self.quota_project_ids:
+            raise ValueError(
+                f"Quota project not allowed: {quota_project_id}")
+        with self._lock:
+            client = self._clients.get(quota_project_id)
+            if client is None:
+                creds, project = load_credentials_from_file(
+                    self.credentials_path)
+                creds = creds.with_quota_project(quota_project_id)
+                client = vision.ImageAnnotatorClient(credentials=creds)
+                self._clients[quota_project_id] = client
+            return client
+
+
+def annotate(path: str, quota_project_id: str,
+             client=None) -> 'vision.WebDetection':
+    from google.cloud import vision
+
+    if client is None:
+        client = VisionClients(
+            current_app.config['GOOGLE_APPLICATION_CREDENTIALS'],
+            [quota_project_id]).get(quota_project_id)
+
+    if path.startswith("http") or path.startswith("gs:"):
+        image = vision.Image()
+        image.source.image_uri = path
+    else:
+        with open(path, "rb") as image_file:
+            content = image_file.read()
+        image = vision.Image(content=content)
+
+    web_detection = client.web_detection(image=image).web_detection
+    return web_detection
+
+
+def report(annotations: 'vision.WebDetection', min_score=0.0) -> dict:
+    results = {}
+
+    if annotations.pages_with_matching_images:
+        results['pages_with_matching_images'] = [
+            page.url for page in annotations.pages_with_matching_images
+        ]
+
+    if annotations.full_matching_images:
+        results['full_matching_images'] = [
+            image.url for image in annotations.full_matching_images
+        ]
+
+    if annotations.partial_matching_images:
+        results['partial_matching_images'] = [
+            image.url for image in annotations.partial_matching_images
+        ]
+
+    if annotations.web_entities:
+        results['web_entities'] = [
+            {
+                'score': entity.score,
+                'description': entity.description
+            } for entity in annotations.web_entities
+            if entity.score > min_score
+        ]
+
+    return results
+
+
+def _load_upload_store(app):
+    upload_store = UploadStore(
+        app.config['UPLOAD_FOLDER'],
+        max_bytes=app.config['UPLOAD_MAX_BYTES'],
+        max_age=app.config['UPLOAD_MAX_AGE'])
+    upload_store.start_sweeper(app.config['UPLOAD_SWEEP_INTERVAL'])
+    Instrumentation.register_stats('upload_store', upload_store.stats)
+    return upload_store
+
+
+def init_subsystems(registry):
+    registry.app.config.setdefault(
+        'GALLERY_INDEX', LocalImageSearch.DEFAULT_INDEX_PATH)
+    registry.register('upload_store', _load_upload_store)
+    registry.register('gallery_index', lambda app: LocalImageSearch.load_index(
+        app.config['GALLERY_INDEX']))
+    registry.register('vision', lambda app: VisionClients(
+        app.config['GOOGLE_APPLICATION_CREDENTIALS'],
+        [app.config['QUOTA_PROJECT_ID']]))
+
+
+@blueprint.route('/imagesearch')
+def index_imagesearch():
+    return render_template('imagesearch.html')
+
+
+@blueprint.route('/upload', methods=['POST'])
+def upload():
+    if 'file' not in request.files:
+        return redirect(request.url)
+    file = request.files['file']
+    if file.filename == '':
+        return redirect(request.url)
+    if file:
+        config = current_app.config
+        filepath = subsystem('upload_store').save(file.stream, file.filename)
+        # The server bills its own project; clients do not get to choose
+        quota_project_id = config['QUOTA_PROJECT_ID']
+        # Try the offline gallery first and only pay for Vision when it is
+        # not confident
+        try:
+            local_matches = LocalImageSearch.search(
+                subsystem('gallery_index'), filepath)
+        except OSError:
+            # PIL cannot read it (UnidentifiedImageError is an OSError)
+            return render_template(
+                'imagesearch.html',
+                error="The file could not be read as an image."), 400
+        local_label = LocalImageSearch.classify(
+            local_matches, config['LOCAL_MATCH_THRESHOLD'])
+        Instrumentation.record_cache('gallery', local_label is not None)
+        if local_label:
+            results = {'local_label': local_label,
+                       'local_matches': local_matches}
+        else:
+            client = subsystem('vision').get(quota_project_id)
+            with Instrumentation.upstream_call('vision'):
+                annotations = annotate(filepath, quota_project_id, client)
+            results = report(annotations, config['WEB_ENTITY_MIN_SCORE'])
+            results['local_matches'] = local_matches
+        return render_template('imageresults.html', results=results)
+
+
+@blueprint.route('/upload_stats')
+def upload_stats():
+    return jsonify(subsystem('upload_store').stats())
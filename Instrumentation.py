@@ -0,0 +1,456 @@
+"""
+Lightweight metrics shared by the Flask apps and the RAG pipeline.
+
+Metrics are kept in process as Prometheus-style counters and histograms and
+rendered in the Prometheus text format by render_prometheus(), which the
+apps serve on /metrics.
+
+init_app() adds per-route request latency histograms to a Flask app, the
+/metrics endpoint and, when enabled, the /debug/profile sampling profiler.
+
+Instrumentation is controlled by environment variables:
+    METRICS_ENABLED=0     turn all instrumentation off. The RAG components
+                          are then not wrapped at all, so there is no
+                          per-call overhead.
+    RAG_TRACE_LOG=<path>  also write one JSON line per RAG request with the
+                          per-stage timings and counts.
+    PROFILER_ENABLED=1    serve /debug/profile?seconds=10, which samples
+                          every thread's stack and returns the collapsed
+                          stacks used by flame graph tools.
+    LOG_LEVEL=DEBUG       the level of the structured logs written by
+                          log_event().
+"""
+
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+_registry = []
+_stats_sources = []
+
+
+class Counter:
+    """
+    A monotonically increasing value per label combination.
+
+    Args:
+        name (str): The metric name.
+        help (str): The one-line description shown by Prometheus.
+        labels (tuple): The label names.
+    """
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = _labels(self.labels, key)
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    A bucketed distribution of observed values per label combination.
+
+    Args:
+        name (str): The metric name.
+        help (str): The one-line description shown by Prometheus.
+        labels (tuple): The label names.
+        buckets (tuple): The upper bounds of the buckets, ascending.
+    """
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # key -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _labels(
+                        self.labels + ('le',), key + (repr(bound),))
+                    lines.append(
+                        f"{self.name}_bucket{bucket_labels} {cumulative}")
+                inf_labels = _labels(self.labels + ('le',), key + ('+Inf',))
+                lines.append(f"{self.name}_bucket{inf_labels} {count}")
+                lines.append(
+                    f"{self.name}_sum{_labels(self.labels, key)} {total}")
+                lines.append(
+                    f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, value.replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def register_stats(prefix, source):
+    """
+    Export the numeric values of a stats dictionary on every scrape.
+
+    Args:
+        prefix (str): The metric name prefix, e.g. 'upload_store'.
+        source (callable): Returns a dictionary of name -> number, such as
+        UploadStore.stats.
+    """
+    _stats_sources.append((prefix, source))
+
+
+def render_prometheus():
+    """
+    Render every registered metric in the Prometheus text format.
+
+    Returns:
+        str: The exposition text served on /metrics.
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for prefix, source in _stats_sources:
+        for key, value in sorted(source().items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# Application metrics
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_seconds', 'Request latency per route.',
+    labels=('route', 'method', 'status'))
+CBR_RETRIEVALS = Counter(
+    'cbr_retrievals_total', 'Case retrievals by whether a match was found.',
+    labels=('result',))
+CBR_CASES_RETURNED = Histogram(
+    'cbr_cases_returned', 'Similar cases returned per retrieval.',
+    buckets=(0, 1, 2, 3, 5, 10))
+CBR_TOP_SIMILARITY = Histogram(
+    'cbr_top_similarity', 'Similarity score of the best retrieved case.',
+    buckets=SCORE_BUCKETS)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Lookups in local caches by hit or miss.',
+    labels=('cache', 'result'))
+UPSTREAM_CALLS = Counter(
+    'upstream_calls_total', 'Calls to remote services by outcome.',
+    labels=('service', 'outcome'))
+UPSTREAM_SECONDS = Histogram(
+    'upstream_seconds', 'Latency of calls to remote services.',
+    labels=('service',))
+
+
+def record_retrieval(similar_cases):
+    """
+    Record the result of a case retrieval.
+
+    Args:
+        similar_cases (list): The (case ID, case, score) tuples returned by
+        retrieve_similar_cases.
+    """
+    if not ENABLED:
+        return
+    CBR_RETRIEVALS.inc(result='matched' if similar_cases else 'unknown')
+    CBR_CASES_RETURNED.observe(len(similar_cases))
+    if similar_cases:
+        CBR_TOP_SIMILARITY.observe(max(score for _, _, score in similar_cases))
+
+
+def record_cache(cache, hit):
+    """Count a hit or a miss of a local cache."""
+    if ENABLED:
+        CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+@contextlib.contextmanager
+def upstream_call(service):
+    """
+    Time a call to a remote service and count its outcome.
+
+    Args:
+        service (str): The service name, e.g. 'vision' or 'llm'.
+    """
+    if not ENABLED:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_CALLS.inc(service=service, outcome='error')
+        raise
+    else:
+        UPSTREAM_CALLS.inc(service=service, outcome='ok')
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, service=service)
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Write a structured log line, skipping all formatting when the level is
+    disabled.
+
+    Args:
+        logger (logging.Logger): The logger to write to.
+        level (int): The logging level, e.g. logging.DEBUG.
+        event (str): A short event name.
+        **fields: JSON-serialisable values to attach to the event.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps(
+            {'event': event, **fields}, default=str))
+
+
+# Sampling profiler
+
+_profile_lock = threading.Lock()
+
+
+def sample_stacks(seconds, interval=0.005):
+    """
+    Sample the stacks of every other thread for a while.
+
+    Args:
+        seconds (float): How long to sample for.
+        interval (float): The time between samples.
+
+    Returns:
+        str: One line per distinct stack in the collapsed format read by
+        flamegraph.pl and speedscope ("outer;inner count").
+    """
+    stacks = collections.Counter()
+    own_id = threading.get_ident()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} "
+                             f"({os.path.basename(code.co_filename)}:"
+                             f"{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[';'.join(reversed(names))] += 1
+        time.sleep(interval)
+
+    return ''.join(f"{stack} {count}\n"
+                   for stack, count in stacks.most_common())
+
+
+def init_app(app):
+    """
+    Add request metrics, /metrics and the optional profiler to a Flask app.
+
+    Args:
+        app (flask.Flask): The application to instrument.
+    """
+    from flask import Response, abort, g, request
+
+    if not logging.getLogger().handlers:
+        logging.basicConfig(
+            level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+            format='%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    if ENABLED:
+        @app.before_request
+        def start_timer():
+            g.request_start = time.perf_counter()
+
+        @app.after_request
+        def observe_latency(response):
+            start = g.pop('request_start', None)
+            if start is not None:
+                rule = 'unmatched'
+                if request.url_rule is not None:
+                    rule = request.url_rule.rule
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - start, route=rule,
+                    method=request.method, status=response.status_code)
+            return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_prometheus(),
+                        mimetype='text/plain; version=0.0.4')
+
+    profiler_enabled = app.config.get(
+        'PROFILER_ENABLED', os.environ.get('PROFILER_ENABLED') == '1')
+    if profiler_enabled:
+        @app.route('/debug/profile')
+        def profile():
+            seconds = min(float(request.args.get('seconds', 10)), 60)
+            interval = max(float(request.args.get('interval', 0.005)), 0.001)
+            # One profile at a time; concurrent samplers would see each other
+            if not _profile_lock.acquire(blocking=False):
+                abort(409)
+            try:
+                collapsed = sample_stacks(seconds, interval)
+            finally:
+                _profile_lock.release()
+            return Response(collapsed, mimetype='text/plain')
+
+
+# RAG pipeline metrics
+
+RAG_STAGE_SECONDS = Histogram(
+    'rag_stage_seconds', 'Time spent in each RAG pipeline component.',
+    labels=('stage',))
+RAG_REQUEST_SECONDS = Histogram(
+    'rag_request_seconds', 'End-to-end time of a RAG query.')
+RAG_PROMPT_TOKENS = Histogram(
+    'rag_prompt_tokens', 'Whitespace-separated tokens in the built prompt.',
+    buckets=COUNT_BUCKETS)
+RAG_GENERATED_TOKENS = Histogram(
+    'rag_generated_tokens', 'Whitespace-separated tokens in the reply.',
+    buckets=COUNT_BUCKETS)
+RAG_RETRIEVED_DOCUMENTS = Histogram(
+    'rag_retrieved_documents', 'Documents returned by the retriever.',
+    buckets=COUNT_BUCKETS)
+
+_current_trace = contextvars.ContextVar('rag_trace', default=None)
+
+trace_logger = logging.getLogger('rag.trace')
+if ENABLED and os.environ.get('RAG_TRACE_LOG'):
+    _handler = logging.FileHandler(os.environ['RAG_TRACE_LOG'])
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_logger.addHandler(_handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+
+def _record_stage_output(stage, output, trace):
+    # Pull the prompt/token/document counts out of a component's output
+    if not isinstance(output, dict):
+        return
+    if 'prompt' in output:
+        tokens = len(str(output['prompt']).split())
+        RAG_PROMPT_TOKENS.observe(tokens)
+        if trace is not None:
+            trace['prompt_tokens'] = tokens
+    if 'replies' in output:
+        tokens = sum(len(str(reply).split()) for reply in output['replies'])
+        RAG_GENERATED_TOKENS.observe(tokens)
+        if trace is not None:
+            trace['generated_tokens'] = tokens
+    if stage == 'retriever' and 'documents' in output:
+        RAG_RETRIEVED_DOCUMENTS.observe(len(output['documents']))
+        if trace is not None:
+            trace['documents'] = len(output['documents'])
+
+
+def instrument_pipeline(pipeline, stages):
+    """
+    Wrap the run method of pipeline components with timing hooks.
+
+    Does nothing when instrumentation is disabled, so disabled pipelines run
+    the original, unwrapped components.
+
+    Args:
+        pipeline: A haystack Pipeline.
+        stages (iterable): The names of the components to time.
+    """
+    if not ENABLED:
+        return
+
+    for stage in stages:
+        component = pipeline.get_component(stage)
+        run = component.run
+
+        @functools.wraps(run)
+        def timed_run(*args, _run=run, _stage=stage, **kwargs):
+            start = time.perf_counter()
+            output = _run(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            RAG_STAGE_SECONDS.observe(seconds, stage=_stage)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace['stages'][_stage] = seconds
+            _record_stage_output(_stage, output, trace)
+            return output
+
+        component.run = timed_run
+
+
+@contextlib.contextmanager
+def rag_trace(question):
+    """
+    Time a RAG request and collect its per-stage trace.
+
+    Args:
+        question (str): The user's question.
+    """
+    if not ENABLED:
+        yield None
+        return
+
+    trace = {'question_chars': len(question), 'stages': {}}
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace['total_seconds'] = time.perf_counter() - start
+        _current_trace.reset(token)
+        RAG_REQUEST_SECONDS.observe(trace['total_seconds'])
+        if trace_logger.handlers:
+            trace['timestamp'] = time.time()
+            trace_logger.info(json.dumps(trace))
@@ -0,0 +1,180 @@
+"""
+Local CPU text embeddings for the RAG pipeline.
+
+The RAG pipeline embeds its chunks and every query through the hosted
+Gradient embedders: a network round trip per query, and indexing that
+waits on the remote API. Embedder is the interface the pipeline needs,
+texts in and unit-length vectors out, and HashedTfidfEmbedder implements
+it on the CPU with numpy only:
+
+1. terms are the BM25Retriever terms, plus pairs of adjacent terms, each
+   hashed into one of `features` buckets;
+2. a text is a TF-IDF vector over the buckets (sublinear term frequency,
+   inverse document frequency learnt by fit() from the corpus);
+3. fit() takes the truncated SVD of the corpus's TF-IDF matrix (latent
+   semantic analysis), and embed() projects a text onto its top
+   `dimensions` components.
+
+Texts are embedded in batches of `batch_size`, and batches run on
+`workers` threads. numpy releases the GIL in the projection, but the
+tokenizing is Python, so threads only overlap the numpy part. See
+benchmarks/bench_embedders.py for the embeddings per second.
+
+RAG_EMBEDDER=local selects it in RetreivalAugmentedGeneration.py:
+
+    embedder = HashedTfidfEmbedder().fit(chunks)
+    vectors = embedder.embed(["How do farmers manage waste?"])
+"""
+
+import abc
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import BM25Retriever
+
+
+class Embedder(abc.ABC):
+    """The interface of the RAG embedders."""
+
+    dimensions = None
+
+    @abc.abstractmethod
+    def embed(self, texts):
+        """
+        Embed texts.
+
+        Args:
+            texts (list): The texts.
+
+        Returns:
+            numpy.ndarray: A (texts, dimensions) float32 array of unit
+            vectors; texts with nothing to embed get zero vectors.
+        """
+
+
+class HashedTfidfEmbedder(Embedder):
+    """
+    Latent semantic analysis over hashed TF-IDF features.
+
+    Args:
+        dimensions (int): The size of the embeddings; at most the rank of
+        the corpus fitted.
+        features (int): The number of hash buckets of the terms.
+        batch_size (int): The number of texts embedded at a time.
+        workers (int): The number of threads embedding batches. Defaults
+        to the number of CPUs.
+    """
+
+    def __init__(self, dimensions=128, features=1 << 20, batch_size=32,
+                 workers=None):
+        self.dimensions = dimensions
+        self.features = features
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        # Bucket -> column of the corpus's buckets, their inverse document
+        # frequencies, and the (columns, dimensions) projection
+        self._columns = {}
+        self._idf = np.empty(0, dtype=np.float32)
+        self._projection = np.empty((0, 0), dtype=np.float32)
+
+    def _buckets(self, text):
+        terms = BM25Retriever.tokenize(text)
+        grams = terms + [f'{first} {second}'
+                         for first, second in zip(terms, terms[1:])]
+        counts = {}
+        for gram in grams:
+            bucket = zlib.crc32(gram.encode('utf-8')) % self.features
+            counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def _tfidf(self, texts):
+        # The TF-IDF rows of texts over the fitted columns, unit length, as
+        # CSR arrays; unseen buckets are ignored
+        indptr = [0]
+        columns = []
+        counts = []
+        for text in texts:
+            for bucket, count in self._buckets(text).items():
+                column = self._columns.get(bucket)
+                if column is not None:
+                    columns.append(column)
+                    counts.append(count)
+            indptr.append(len(columns))
+        indptr = np.array(indptr, dtype=np.int64)
+        columns = np.array(columns, dtype=np.int64)
+        values = (1 + np.log(np.array(counts, dtype=np.float32))) * \
+            self._idf[columns]
+        # Empty rows hold no values, so each present row's sum runs to the
+        # next present row's start
+        lengths = np.diff(indptr)
+        present = lengths > 0
+        norms = np.ones(len(texts), dtype=np.float32)
+        if present.any():
+            norms[present] = np.sqrt(np.add.reduceat(
+                values ** 2, indptr[:-1][present]))
+        values /= np.repeat(norms, lengths)
+        return indptr, columns, values
+
+    def fit(self, texts):
+        """
+        Learn the buckets, inverse document frequencies and components of
+        a corpus.
+
+        Args:
+            texts (list): The corpus, e.g. the RAG chunks.
+
+        Returns:
+            HashedTfidfEmbedder: self.
+        """
+        bucket_counts = [self._buckets(text) for text in texts]
+        frequencies = {}
+        for counts in bucket_counts:
+            for bucket in counts:
+                frequencies[bucket] = frequencies.get(bucket, 0) + 1
+        self._columns = {bucket: column for column, bucket in
+                         enumerate(sorted(frequencies))}
+        document_frequency = np.array(
+            [frequencies[bucket] for bucket in sorted(frequencies)],
+            dtype=np.float32)
+        self._idf = (np.log((1 + len(texts)) / (1 + document_frequency)) +
+                     1).astype(np.float32)
+
+        indptr, columns, values = self._tfidf(texts)
+        matrix = np.zeros((len(texts), len(self._columns)), dtype=np.float32)
+        rows = np.repeat(np.arange(len(texts)), np.diff(indptr))
+        matrix[rows, columns] = values
+        _, _, components = np.linalg.svd(matrix, full_matrices=False)
+        self.dimensions = min(self.dimensions, len(components))
+        self._projection = np.ascontiguousarray(
+            components[:self.dimensions].T)
+        return self
+
+    def _embed_batch(self, texts):
+        indptr, columns, values = self._tfidf(texts)
+        embeddings = np.zeros((len(texts), self.dimensions),
+                              dtype=np.float32)
+        lengths = np.diff(indptr)
+        present = lengths > 0
+        if present.any():
+            # As in _tfidf, one sum per present row
+            weighted = self._projection[columns] * values[:, None]
+            embeddings[present] = np.add.reduceat(
+                weighted, indptr[:-1][present])
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1)
+
+    def embed(self, texts):
+        texts = list(texts)
+        batches = [texts[start:start + self.batch_size]
+                   for start in range(0, len(texts), self.batch_size)]
+        if not batches:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        if self.workers == 1 or len(batches) == 1:
+            return np.concatenate([self._embed_batch(batch)
+                                   for batch in batches])
+        with ThreadPoolExecutor(self.workers) as executor:
+            return np.concatenate(list(executor.map(
+                self._embed_batch, batches)))
@@ -0,0 +1,302 @@
+"""
+Offline image-similarity search against a labelled disease gallery.
+
+The gallery is a directory with one sub-directory per label, e.g.
+
+    gallery/
+        Lumpy skin disease/
+            cow1.jpg
+        Foot-and-Mouth Disease/
+            lesion3.png
+
+Each image is reduced on the CPU to an HSV colour histogram and a 64-bit
+difference hash. The features are stored in a single .npz index that
+answers nearest-neighbour queries with a couple of vectorised numpy
+operations, so it can run before (and often instead of) a Google Vision
+web detection call.
+
+Usage:
+    python LocalImageSearch.py build gallery/ --index gallery_index.npz
+    python LocalImageSearch.py query uploads/cow.jpg --index gallery_index.npz
+    python LocalImageSearch.py benchmark --index gallery_index.npz
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+HISTOGRAM_BINS = (8, 4, 4)  # hue, saturation, value
+HISTOGRAM_WEIGHT = 0.6
+HASH_WEIGHT = 0.4
+DEFAULT_INDEX_PATH = 'gallery_index.npz'
+
+
+def compute_features(path):
+    """
+    Compute the colour histogram and difference hash for an image.
+
+    Args:
+        path (str): The path to the image file.
+
+    Returns:
+        tuple: The L1-normalised HSV histogram (numpy.ndarray of float32) and
+        the 64-bit difference hash (int).
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+
+        hsv = np.asarray(image.resize((64, 64)).convert('HSV'))
+        bins = np.array(HISTOGRAM_BINS)
+        quantised = (hsv.reshape(-1, 3).astype(np.int32) * bins) // 256
+        flat = (quantised[:, 0] * bins[1] + quantised[:, 1]) * bins[2] \
+            + quantised[:, 2]
+        histogram = np.bincount(flat, minlength=int(bins.prod()))
+        histogram = (histogram / histogram.sum()).astype(np.float32)
+
+        gray = np.asarray(image.convert('L').resize((9, 8)), dtype=np.int16)
+        bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+        difference_hash = int(''.join('1' if bit else '0' for bit in bits), 2)
+
+    return histogram, difference_hash
+
+
+def build_index(gallery_dir, index_path=DEFAULT_INDEX_PATH):
+    """
+    Index every image in a labelled gallery directory.
+
+    Args:
+        gallery_dir (str): The gallery directory, with one sub-directory per
+        label.
+        index_path (str): Where to write the .npz index.
+
+    Returns:
+        int: The number of images indexed.
+    """
+    histograms = []
+    hashes = []
+    labels = []
+    paths = []
+
+    for label in sorted(os.listdir(gallery_dir)):
+        label_dir = os.path.join(gallery_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for name in sorted(os.listdir(label_dir)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(label_dir, name)
+            try:
+                histogram, difference_hash = compute_features(path)
+            except OSError as error:
+                print(f"Skipping {path}: {error}")
+                continue
+            histograms.append(histogram)
+            hashes.append(difference_hash)
+            labels.append(label)
+            paths.append(path)
+
+    np.savez(
+        index_path,
+        histograms=np.array(histograms, dtype=np.float32).reshape(
+            len(histograms), -1),
+        hashes=np.array(hashes, dtype=np.uint64),
+        labels=np.array(labels, dtype=str),
+        paths=np.array(paths, dtype=str))
+
+    return len(paths)
+
+
+def load_index(index_path=DEFAULT_INDEX_PATH):
+    """
+    Load an index written by build_index.
+
+    Args:
+        index_path (str): The path to the .npz index.
+
+    Returns:
+        dict: The index arrays, or None if the index does not exist.
+    """
+    if not os.path.exists(index_path):
+        return None
+    with np.load(index_path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def _hamming_similarity(hashes, query_hash):
+    xor = np.bitwise_xor(hashes, np.uint64(query_hash))
+    distances = np.unpackbits(xor.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+    return 1 - distances / 64
+
+
+def search_features(index, histogram, difference_hash, top_n=5):
+    """
+    Find the gallery images most similar to the given features.
+
+    Args:
+        index (dict): An index returned by load_index.
+        histogram (numpy.ndarray): The query colour histogram.
+        difference_hash (int): The query difference hash.
+        top_n (int): The maximum number of matches to return.
+
+    Returns:
+        list: Dictionaries with the label, path and similarity score of each
+        match, best first.
+    """
+    if index is None or len(index['paths']) == 0:
+        return []
+
+    # Histogram intersection and hash agreement are both in [0, 1]
+    histogram_similarity = np.minimum(index['histograms'], histogram).sum(
+        axis=1)
+    hash_similarity = _hamming_similarity(index['hashes'], difference_hash)
+    scores = (HISTOGRAM_WEIGHT * histogram_similarity +
+              HASH_WEIGHT * hash_similarity)
+
+    top_n = min(top_n, len(scores))
+    best = np.argpartition(-scores, top_n - 1)[:top_n]
+    best = best[np.argsort(-scores[best])]
+
+    return [
+        {
+            'label': str(index['labels'][i]),
+            'path': str(index['paths'][i]),
+            'score': float(scores[i])
+        } for i in best
+    ]
+
+
+def search(index, path, top_n=5):
+    """
+    Find the gallery images most similar to an image file.
+
+    Args:
+        index (dict): An index returned by load_index.
+        path (str): The path to the query image.
+        top_n (int): The maximum number of matches to return.
+
+    Returns:
+        list: Dictionaries with the label, path and similarity score of each
+        match, best first.
+    """
+    if index is None:
+        return []
+    histogram, difference_hash = compute_features(path)
+    return search_features(index, histogram, difference_hash, top_n)
+
+
+def classify(matches, min_score=0.85):
+    """
+    Decide whether the local matches are confident enough to skip Vision.
+
+    Args:
+        matches (list): Matches returned by search, best first.
+        min_score (float): The score the best match must reach.
+
+    Returns:
+        str: The label voted for by the matches (weighted by score), or None
+        when the best match is below min_score.
+    """
+    if not matches or matches[0]['score'] < min_score:
+        return None
+
+    votes = {}
+    for match in matches:
+        votes[match['label']] = votes.get(match['label'], 0) + match['score']
+    return max(votes, key=votes.get)
+
+
+def benchmark(index, queries=200, synthetic_size=0, top_n=5):
+    """
+    Measure query latency against an index.
+
+    Args:
+        index (dict): An index returned by load_index, or None to benchmark
+        a purely synthetic index.
+        queries (int): The number of queries to time.
+        synthetic_size (int): When set, the index is replaced by this many
+        random feature vectors so scaling can be measured without a large
+        gallery.
+        top_n (int): The number of matches per query.
+
+    Returns:
+        dict: The index size and the p50/p95/max latency in milliseconds.
+    """
+    rng = np.random.default_rng(0)
+    bins = int(np.prod(HISTOGRAM_BINS))
+
+    if synthetic_size or index is None:
+        size = synthetic_size or 1000
+        histograms = rng.random((size, bins), dtype=np.float32)
+        histograms /= histograms.sum(axis=1, keepdims=True)
+        index = {
+            'histograms': histograms,
+            'hashes': rng.integers(0, 2 ** 63, size, dtype=np.uint64),
+            'labels': np.array(['synthetic'] * size),
+            'paths': np.array([f'synthetic/{i}' for i in range(size)])
+        }
+
+    size = len(index['paths'])
+    timings = []
+    for i in range(queries):
+        row = i % size
+        start = time.perf_counter()
+        search_features(index, index['histograms'][row],
+                        int(index['hashes'][row]), top_n)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        'index_size': size,
+        'queries': queries,
+        'p50_ms': timings[len(timings) // 2],
+        'p95_ms': timings[int(len(timings) * 0.95) - 1],
+        'max_ms': timings[-1]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='index a labelled gallery')
+    build.add_argument('gallery')
+
+    query = commands.add_parser('query', help='search with an image')
+    query.add_argument('image')
+    query.add_argument('--top', type=int, default=5)
+
+    bench = commands.add_parser('benchmark', help='measure query latency')
+    bench.add_argument('--queries', type=int, default=200)
+    bench.add_argument('--synthetic', type=int, default=0,
+                       help='benchmark a random index of this many images')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        count = build_index(args.gallery, args.index)
+        print(f"Indexed {count} images into {args.index} "
+              f"in {time.perf_counter() - start:.2f}s")
+    elif args.command == 'query':
+        matches = search(load_index(args.index), args.image, args.top)
+        for match in matches:
+            print(f"{match['score']:.3f}  {match['label']}  {match['path']}")
+        print("Local label:", classify(matches))
+    else:
+        index = None if args.synthetic else load_index(args.index)
+        results = benchmark(index, args.queries, args.synthetic)
+        print(f"Index size: {results['index_size']} images, "
+              f"{results['queries']} queries")
+        print(f"p50 {results['p50_ms']:.3f} ms, "
+              f"p95 {results['p95_ms']:.3f} ms, "
+              f"max {results['max_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
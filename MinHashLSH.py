@@ -0,0 +1,173 @@
+"""
+Approximate symptom retrieval with MinHash signatures and LSH banding.
+
+Exact retrieval (CaseIndex.IndexView.retrieve) scores every case that
+shares a symptom term with the new case. Common signs such as fever are
+shared by most of a large case base, so that is still a scan of most of
+it. MinHashLSH instead keeps a MinHash signature of each case's set of
+normalized symptom terms, split into bands of a few hash values each.
+Cases whose signature agrees with the new case's on a whole band land in
+the same bucket, and only those candidates are rescored exactly. The
+scores are the exact calculate_overall_similarity scores; only cases that
+share no bucket with the new case are missed.
+
+A case whose symptom terms have Jaccard similarity j with the new case
+becomes a candidate with probability
+
+    1 - (1 - j ** rows_per_band) ** bands
+
+(candidate_probability). More bands or fewer rows per band raise the
+recall and the number of candidates; see benchmarks/bench_lsh.py for the
+recall@3 against exact retrieval.
+
+MinHashLSH is a CaseIndex derived index:
+
+    index.add_index('minhash', lambda: MinHashLSH(bands=16, rows_per_band=2))
+    view = index.view()
+    view.derived('minhash').retrieve(view, new_case, weights)
+"""
+
+import zlib
+
+import numpy as np
+
+import CaseIndex
+import SymptomNormalizer
+
+# A Mersenne prime above every CRC-32 of a term, so the hash functions
+# (a * x + b) mod PRIME are distinct permutations of the term hashes
+PRIME = (1 << 31) - 1
+EMPTY = np.iinfo(np.uint32).max
+
+
+class MinHashLSH(CaseIndex.DerivedIndex):
+    """
+    LSH buckets of the symptom term sets of the cases.
+
+    Args:
+        bands (int): The number of bands; each one is a separate chance
+        for a case to become a candidate.
+        rows_per_band (int): The number of MinHash values per band; a case
+        must match the new case on all of them.
+        seed (int): The seed of the hash functions.
+    """
+
+    def __init__(self, bands=16, rows_per_band=2, seed=1):
+        self.bands = bands
+        self.rows_per_band = rows_per_band
+        size = bands * rows_per_band
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, PRIME, size, dtype=np.uint64)
+        self._b = rng.integers(0, PRIME, size, dtype=np.uint64)
+        # Odd multipliers that fold the hash values of a band into one key
+        self._mix = rng.integers(
+            0, 1 << 63, rows_per_band, dtype=np.uint64) | np.uint64(1)
+        self._term_hashes = {}
+
+        # Per band: the bucket keys of the built rows, sorted, with their
+        # rows, and a dictionary of the rows added since
+        self._keys = [np.empty(0, dtype=np.uint64)] * bands
+        self._rows = [np.empty(0, dtype=np.int64)] * bands
+        self._added = [{} for _ in range(bands)]
+
+    def candidate_probability(self, jaccard):
+        """
+        Return the probability that a case becomes a candidate.
+
+        Args:
+            jaccard (float): The Jaccard similarity of its symptom terms
+            to the new case's.
+        """
+        return 1 - (1 - jaccard ** self.rows_per_band) ** self.bands
+
+    def _term_hash(self, term):
+        hashes = self._term_hashes.get(term)
+        if hashes is None:
+            x = np.uint64(zlib.crc32(term.encode('utf-8')) % PRIME)
+            hashes = ((self._a * x + self._b) % np.uint64(PRIME)).astype(
+                np.uint32)
+            self._term_hashes[term] = hashes
+        return hashes
+
+    def signature(self, terms):
+        """
+        Return the MinHash signature of a set of normalized terms.
+
+        Returns:
+            numpy.ndarray: bands * rows_per_band hash values, or None for
+            an empty set.
+        """
+        if not terms:
+            return None
+        return np.min([self._term_hash(term) for term in terms], axis=0)
+
+    def _band_keys(self, signatures):
+        # (cases, bands * rows) signatures -> (cases, bands) bucket keys
+        values = signatures.reshape(
+            len(signatures), self.bands, self.rows_per_band)
+        with np.errstate(over='ignore'):
+            return (values.astype(np.uint64) * self._mix).sum(
+                axis=2, dtype=np.uint64)
+
+    def build(self, view):
+        # Computes the signatures from the inverted index, one term at a
+        # time, instead of normalizing every case again
+        rows = view.visible_rows()
+        signatures = np.full((len(rows), self.bands * self.rows_per_band),
+                             EMPTY, dtype=np.uint32)
+        has_terms = np.zeros(len(rows), dtype=bool)
+        for term_id, term in enumerate(view.terms.terms):
+            positions = np.searchsorted(rows, view.rows_with_term(term_id))
+            if len(positions):
+                signatures[positions] = np.minimum(
+                    signatures[positions], self._term_hash(term))
+                has_terms[positions] = True
+
+        rows, signatures = rows[has_terms], signatures[has_terms]
+        keys = self._band_keys(signatures)
+        for band in range(self.bands):
+            order = np.argsort(keys[:, band], kind='stable')
+            self._keys[band] = keys[order, band]
+            self._rows[band] = rows[order]
+
+    def add(self, row, case_id, case):
+        terms, _ = SymptomNormalizer.normalize_symptoms(case['Symptoms'])
+        signature = self.signature(terms)
+        if signature is None:
+            return
+        for band, key in enumerate(self._band_keys(signature[None])[0]):
+            self._added[band].setdefault(int(key), []).append(row)
+
+    def candidates(self, view, new_case):
+        """
+        Return the visible rows that share a bucket with a new case.
+
+        Returns:
+            numpy.ndarray: The candidate rows, in storage order.
+        """
+        terms, _ = SymptomNormalizer.normalize_symptoms(
+            new_case.get('Symptoms', []))
+        signature = self.signature(terms)
+        if signature is None:
+            return np.empty(0, dtype=np.int64)
+
+        found = []
+        for band, key in enumerate(self._band_keys(signature[None])[0]):
+            keys = self._keys[band]
+            start = np.searchsorted(keys, key, side='left')
+            end = np.searchsorted(keys, key, side='right')
+            found.append(self._rows[band][start:end])
+            found.append(np.asarray(
+                self._added[band].get(int(key), ()), dtype=np.int64))
+        return view.visible(np.unique(np.concatenate(found)))
+
+    def retrieve(self, view, new_case, weights, similarity_threshold=0.5,
+                 top_n=3, **filters):
+        """
+        Retrieve similar cases among the LSH candidates only.
+
+        Takes the arguments, including the pre-filters, and returns the
+        result of IndexView.retrieve.
+        """
+        return view.retrieve(new_case, weights, similarity_threshold, top_n,
+                             rows=self.candidates(view, new_case), **filters)
@@ -1,13 +1,17 @@
 from gradient_haystack.embedders.gradient_document_embedder import GradientDocumentEmbedder
 from gradient_haystack.embedders.gradient_text_embedder import GradientTextEmbedder
 from gradient_haystack.generator.base import GradientGenerator
-from haystack import Document, Pipeline
+from haystack import Document, Pipeline, component
 from haystack.components.writers import DocumentWriter
 from haystack.document_stores.in_memory.document_store import InMemoryDocumentStore
 from haystack.components.retrievers.in_memory.embedding_retriever import InMemoryEmbeddingRetriever
 from haystack.components.builders import PromptBuilder
 from haystack.components.builders.answer_builder import AnswerBuilder
 import os
+from typing import List
+import BM25Retriever
+import Instrumentation
+import LocalEmbedder
 # import requests
 
 os.environ['GRADIENT_ACCESS_TOKEN'] = "4RkXwcXCIhjSilcrkYNanvSI8h1WWrgt"
@@ -15,14 +19,24 @@ os.environ['GRADIENT_WORKSPACE_ID'] = "496b8f01-47f9-4f62-91c8-e634679ca2d3_work
 
 fine_tuned_Model_Id = "28643f93-bdd5-4602-b911-2e9fea183186_model_adapter"
 
+# The first retrieval stage: 'embedding' (Gradient embeddings), 'bm25' (the
+# local BM25Retriever index only, no embedding calls) or 'hybrid' (both,
+# merged by reciprocal rank fusion)
+RETRIEVER = os.environ.get('RAG_RETRIEVER', 'embedding')
+if RETRIEVER not in ('embedding', 'bm25', 'hybrid'):
+    raise ValueError(f"Unknown RAG_RETRIEVER: {RETRIEVER}")
+# The embedding backend: 'gradient' (the hosted Gradient embedders) or
+# 'local' (LocalEmbedder on the CPU, fitted to the chunks at startup; no
+# network calls)
+EMBEDDER = os.environ.get('RAG_EMBEDDER', 'gradient')
+if EMBEDDER not in ('gradient', 'local'):
+    raise ValueError(f"Unknown RAG_EMBEDDER: {EMBEDDER}")
+# The number of chunks put into the prompt
+TOP_K = 5
+
 document_store = InMemoryDocumentStore()
 writer = DocumentWriter(document_store=document_store)
 
-document_embedder = GradientDocumentEmbedder(
-    access_token=os.environ["GRADIENT_ACCESS_TOKEN"],
-    workspace_id=os.environ["GRADIENT_WORKSPACE_ID"],
-)
-
 # URL of the online repository where the Raw_Text_Data.txt file is located
 # url = "https://raw.githubusercontent.com/swafey-karanja/Model-training/main/Raw_Text_Data.txt"
 
@@ -40,23 +54,65 @@ document_embedder = GradientDocumentEmbedder(
 with open("Raw_Text_Data.txt", encoding="utf-8") as file:
     text_data = file.read()
 
+# Both retrievers rank the same chunks, so their rankings can be fused
 docs = [
-    Document(content=text_data)
+    Document(content=chunk)
+    for chunk in BM25Retriever.chunk_text(text_data)
 ]
 
 print(len(text_data))
 
-indexing_pipeline = Pipeline()
-indexing_pipeline.add_component(
-    instance=document_embedder, name="document_embedder")
-indexing_pipeline.add_component(instance=writer, name="writer")
-indexing_pipeline.connect("document_embedder", "writer")
-indexing_pipeline.run({"document_embedder": {"documents": docs}})
 
-text_embedder = GradientTextEmbedder(
-    access_token=os.environ["GRADIENT_ACCESS_TOKEN"],
-    workspace_id=os.environ["GRADIENT_WORKSPACE_ID"],
-)
+@component
+class LocalDocumentEmbedder:
+    """Embeds documents with a LocalEmbedder.Embedder."""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]):
+        embeddings = self.embedder.embed(
+            [document.content for document in documents])
+        for document, embedding in zip(documents, embeddings):
+            document.embedding = embedding.tolist()
+        return {"documents": documents}
+
+
+@component
+class LocalTextEmbedder:
+    """Embeds a query with a LocalEmbedder.Embedder."""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+
+    @component.output_types(embedding=List[float])
+    def run(self, text: str):
+        return {"embedding": self.embedder.embed([text])[0].tolist()}
+
+
+if RETRIEVER != 'bm25' and EMBEDDER == 'local':
+    local_embedder = LocalEmbedder.HashedTfidfEmbedder().fit(
+        [document.content for document in docs])
+    document_embedder = LocalDocumentEmbedder(local_embedder)
+    text_embedder = LocalTextEmbedder(local_embedder)
+elif RETRIEVER != 'bm25':
+    document_embedder = GradientDocumentEmbedder(
+        access_token=os.environ["GRADIENT_ACCESS_TOKEN"],
+        workspace_id=os.environ["GRADIENT_WORKSPACE_ID"],
+    )
+    text_embedder = GradientTextEmbedder(
+        access_token=os.environ["GRADIENT_ACCESS_TOKEN"],
+        workspace_id=os.environ["GRADIENT_WORKSPACE_ID"],
+    )
+
+if RETRIEVER != 'bm25':
+    indexing_pipeline = Pipeline()
+    indexing_pipeline.add_component(
+        instance=document_embedder, name="document_embedder")
+    indexing_pipeline.add_component(instance=writer, name="writer")
+    indexing_pipeline.connect("document_embedder", "writer")
+    indexing_pipeline.run({"document_embedder": {"documents": docs}})
 
 generator = GradientGenerator(
     access_token=os.environ["GRADIENT_ACCESS_TOKEN"],
@@ -74,30 +130,102 @@ Query: {{query}}
 \nAnswer:
 """
 
-retriever = InMemoryEmbeddingRetriever(document_store=document_store)
+
+@component
+class LocalBM25Retriever:
+    """Retrieves chunks from the persisted BM25Retriever index."""
+
+    def __init__(self, documents, top_k=TOP_K):
+        self.index = BM25Retriever.open_index("Raw_Text_Data.txt")
+        # The index was built from the same chunks, in the same order
+        self.documents = documents
+        self.top_k = top_k
+
+    @component.output_types(documents=List[Document])
+    def run(self, query: str):
+        ranking = BM25Retriever.search(self.index, query, self.top_k)
+        return {"documents": [self.documents[position]
+                              for position, _ in ranking]}
+
+
+@component
+class RankFusion:
+    """Merges the two retrievers' chunks by reciprocal rank fusion."""
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+
+    @component.output_types(documents=List[Document])
+    def run(self, embedding_documents: List[Document],
+            bm25_documents: List[Document]):
+        by_id = {document.id: document
+                 for document in embedding_documents + bm25_documents}
+        fused = BM25Retriever.reciprocal_rank_fusion(
+            [[document.id for document in embedding_documents],
+             [document.id for document in bm25_documents]])
+        return {"documents": [by_id[document_id]
+                              for document_id in fused[:self.top_k]]}
+
+
 prompt_builder = PromptBuilder(template=prompt)
 
+# Whatever the mode, the component named "retriever" outputs the chunks
+# for the prompt
 rag_pipeline = Pipeline()
-rag_pipeline.add_component(instance=text_embedder, name="text_embedder")
-rag_pipeline.add_component(instance=retriever, name="retriever")
+if RETRIEVER == 'embedding':
+    rag_pipeline.add_component(instance=text_embedder, name="text_embedder")
+    rag_pipeline.add_component(
+        instance=InMemoryEmbeddingRetriever(
+            document_store=document_store, top_k=TOP_K),
+        name="retriever")
+    rag_pipeline.connect("text_embedder", "retriever")
+    stages = ("text_embedder", "retriever")
+elif RETRIEVER == 'bm25':
+    rag_pipeline.add_component(
+        instance=LocalBM25Retriever(docs), name="retriever")
+    stages = ("retriever",)
+else:
+    rag_pipeline.add_component(instance=text_embedder, name="text_embedder")
+    rag_pipeline.add_component(
+        instance=InMemoryEmbeddingRetriever(
+            document_store=document_store, top_k=TOP_K),
+        name="embedding_retriever")
+    rag_pipeline.add_component(
+        instance=LocalBM25Retriever(docs), name="bm25_retriever")
+    rag_pipeline.add_component(instance=RankFusion(), name="retriever")
+    rag_pipeline.connect("text_embedder", "embedding_retriever")
+    rag_pipeline.connect(
+        "embedding_retriever", "retriever.embedding_documents")
+    rag_pipeline.connect("bm25_retriever", "retriever.bm25_documents")
+    stages = ("text_embedder", "embedding_retriever", "bm25_retriever",
+              "retriever")
 rag_pipeline.add_component(instance=prompt_builder, name="prompt_builder")
 rag_pipeline.add_component(instance=generator, name="generator")
 rag_pipeline.add_component(instance=AnswerBuilder(), name="answer_builder")
 rag_pipeline.connect("generator.replies", "answer_builder.replies")
 rag_pipeline.connect("retriever", "answer_builder.documents")
-rag_pipeline.connect("text_embedder", "retriever")
 rag_pipeline.connect("retriever", "prompt_builder.documents")
 rag_pipeline.connect("prompt_builder", "generator")
 
+# Per-stage latency, prompt/token counts and the optional trace log, see
+# Instrumentation.py
+Instrumentation.instrument_pipeline(
+    rag_pipeline, stages + ("prompt_builder", "generator"))
+
 
 def LLM_Run(question):
-    result = rag_pipeline.run(
-        {
-            "text_embedder": {"text": question},
-            "prompt_builder": {"query": question},
-            "answer_builder": {"query": question}
-        }
-    )
+    inputs = {
+        "prompt_builder": {"query": question},
+        "answer_builder": {"query": question}
+    }
+    if RETRIEVER != 'bm25':
+        inputs["text_embedder"] = {"text": question}
+    if RETRIEVER == 'bm25':
+        inputs["retriever"] = {"query": question}
+    elif RETRIEVER == 'hybrid':
+        inputs["bm25_retriever"] = {"query": question}
+    with Instrumentation.rag_trace(question):
+        result = rag_pipeline.run(inputs)
     return result["answer_builder"]["answers"][0].data
 
 
@@ -0,0 +1,250 @@
+"""
+Normalization of free-text symptoms into canonical terms.
+
+The case base records the same sign in many spellings: "fever (103°F)",
+"Fever of 104°F" and "High fever (105°F)" are all a fever, and "Mouth
+blisters" is "Blisters on mouth". normalize_symptom() turns one symptom
+string into a canonical term plus structured fields:
+
+- lowercases and collapses whitespace and punctuation,
+- pulls numeric measurements (temperature, percentage drop, months) and a
+  leading severity qualifier out into fields,
+- maps synonymous phrases and words onto one canonical form.
+
+Vocabulary interns the canonical terms as integer IDs, so symptom sets can
+be compared as sets of ints. Normalization results are cached per distinct
+string, so a case base is normalized once when it is loaded and each query
+once when it arrives.
+
+Usage:
+    python SymptomNormalizer.py "FMD cases.csv"
+"""
+
+import argparse
+import csv
+import functools
+import re
+import threading
+import unicodedata
+
+# Leading qualifiers that grade a sign rather than name a different one
+SEVERITY_WORDS = ('severe', 'severely', 'high', 'mild', 'slight', 'extreme',
+                  'acute', 'low-grade', 'intermittent')
+
+# Whole-term synonyms, applied after measurements and severity are removed
+PHRASE_SYNONYMS = {
+    'mouth blisters': 'blisters on mouth',
+    'udder blisters': 'blisters on udder',
+    'drooling': 'excessive salivation',
+    'salivation': 'excessive salivation',
+    'reduced milk production': 'decreased milk production',
+    'decreased milk yield': 'decreased milk production',
+    'reduced milk yield': 'decreased milk production',
+    'reduced yield': 'decreased milk production',
+    'inappetence': 'reduced appetite',
+    'decreased appetite': 'reduced appetite',
+    'reduced feed intake': 'reduced appetite',
+    'off-feed': 'reduced appetite',
+    'reluctance to eat': 'reduced appetite',
+    'clotted milk': 'clots in milk',
+    'milk clots': 'clots in milk',
+    'thick milk with clots': 'clots in milk',
+    'swollen regional lymph nodes': 'enlarged lymph nodes',
+    'swollen lymph nodes in region': 'enlarged lymph nodes',
+    'regional lymphadenopathy': 'enlarged lymph nodes',
+    'hot udder': 'udder heat',
+    'udder warmth': 'udder heat',
+    'firm udder': 'udder firmness',
+    'hardened udder': 'udder firmness',
+    'swollen udder': 'udder swelling',
+    'udder edema': 'udder swelling',
+    'painful quarters': 'painful quarter',
+    'watery abnormal milk': 'watery milk',
+    'abnormal watery milk': 'watery milk',
+    'labored breathing': 'dyspnea',
+    'labored abdominal breathing': 'dyspnea',
+    'history of late-term abortions': 'history of late-term abortion',
+    'failure to recover placenta': 'retained placenta',
+    'failure of placenta to expel': 'retained placenta'
+}
+
+# Single-word synonyms, applied to every word of a term
+WORD_SYNONYMS = {
+    'bloody': 'bloodstained',
+    'headpressing': 'head pressing',
+    'feet': 'foot',
+    'lesion': 'lesions'
+}
+
+_DEGREE = r'(?:°|º|�|\s*deg(?:rees)?)?\s*'
+MEASUREMENTS = (
+    ('temperature_f', re.compile(
+        r'(?:of\s+)?\(?\s*(\d+(?:\.\d+)?)\s*' + _DEGREE + r'f\b\)?')),
+    ('temperature_c', re.compile(
+        r'(?:of\s+)?\(?\s*(\d+(?:\.\d+)?)\s*' + _DEGREE + r'c\b\)?')),
+    ('percent_drop', re.compile(
+        r'\(?\s*>?\s*(\d+(?:\.\d+)?)\s*%\s*(?:drop)?\s*\)?')),
+    ('months', re.compile(
+        r'(?:at\s+)?(\d+(?:\.\d+)?)\s*months?(?:\s+gestation)?'))
+)
+_LEADING_CONJUNCTION = re.compile(r'^(?:and|or|with)\s+')
+_PUNCTUATION = re.compile(r'[^\w\s/-]+')
+_SPACES = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_symptom(text):
+    """
+    Normalize one symptom string.
+
+    Args:
+        text (str): A symptom as written in a case, e.g. "High fever
+        (105°F)".
+
+    Returns:
+        tuple: The canonical term (e.g. 'fever') and a tuple of
+        (field, value) pairs for the structured fields found in the text,
+        e.g. (('severity', 'high'), ('temperature_f', 105.0)). The term is
+        '' when nothing but punctuation or measurements remains.
+    """
+    text = unicodedata.normalize('NFKC', text).lower()
+    fields = {}
+
+    for name, pattern in MEASUREMENTS:
+        match = pattern.search(text)
+        if match:
+            fields[name] = float(match.group(1))
+            text = text[:match.start()] + ' ' + text[match.end():]
+
+    text = _PUNCTUATION.sub(' ', text)
+    text = _SPACES.sub(' ', text).strip(' -/')
+    text = _LEADING_CONJUNCTION.sub('', text)
+
+    words = text.split(' ') if text else []
+    if len(words) > 1 and words[0] in SEVERITY_WORDS:
+        fields['severity'] = words.pop(0)
+    if words and words[-1] in ('of', 'at', 'with'):
+        words.pop()
+
+    term = ' '.join(words)
+    term = PHRASE_SYNONYMS.get(term, term)
+    term = ' '.join(WORD_SYNONYMS.get(word, word) for word in term.split(' '))
+    term = PHRASE_SYNONYMS.get(term, term)
+
+    return term, tuple(sorted(fields.items()))
+
+
+def split_symptoms(text):
+    """
+    Split a comma-separated symptom list as entered in the case form.
+
+    Args:
+        text (str): E.g. "fever (104°F), lameness , ".
+
+    Returns:
+        list: The stripped, non-empty symptoms.
+    """
+    return [symptom.strip() for symptom in text.split(',') if symptom.strip()]
+
+
+def normalize_symptoms(symptoms):
+    """
+    Normalize a case's symptom list.
+
+    Args:
+        symptoms (list): The symptom strings of a case.
+
+    Returns:
+        tuple: The set of canonical terms (empty terms dropped) and a dict
+        of the structured fields. When several symptoms carry the same
+        field, the highest value is kept.
+    """
+    terms = set()
+    fields = {}
+    for symptom in symptoms:
+        term, symptom_fields = normalize_symptom(symptom)
+        if term:
+            terms.add(term)
+        for name, value in symptom_fields:
+            if name == 'severity' or name not in fields:
+                fields.setdefault(name, value)
+            else:
+                fields[name] = max(fields[name], value)
+    return terms, fields
+
+
+class Vocabulary:
+    """
+    Interns canonical terms as consecutive integer IDs.
+
+    Args:
+        terms (iterable): Terms to intern up front, e.g. a saved vocabulary;
+        they get the IDs 0, 1, ... in order.
+    """
+
+    def __init__(self, terms=()):
+        self.terms = []
+        self._ids = {}
+        self._lock = threading.Lock()
+        for term in terms:
+            self.intern(term)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def intern(self, term):
+        """Return the ID of a term, assigning the next free ID if it is new."""
+        term_id = self._ids.get(term)
+        if term_id is None:
+            with self._lock:
+                term_id = self._ids.get(term)
+                if term_id is None:
+                    term_id = len(self.terms)
+                    self.terms.append(term)
+                    self._ids[term] = term_id
+        return term_id
+
+    def lookup(self, term):
+        """Return the ID of a term, or None if it was never interned."""
+        return self._ids.get(term)
+
+    def term_ids(self, symptoms, add=False):
+        """
+        Normalize a symptom list into a set of term IDs.
+
+        Args:
+            symptoms (list): The symptom strings of a case.
+            add (bool): Whether to intern unknown terms. When False, terms
+            outside the vocabulary are left out.
+
+        Returns:
+            set: The term IDs.
+        """
+        terms, _ = normalize_symptoms(symptoms)
+        if add:
+            return {self.intern(term) for term in terms}
+        return {self._ids[term] for term in terms if term in self._ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('csv_path', nargs='?', default='FMD cases.csv')
+    args = parser.parse_args()
+
+    raw = set()
+    groups = {}
+    with open(args.csv_path, 'r') as file:
+        for row in csv.DictReader(file):
+            for symptom in row['Symptoms'].split(', '):
+                raw.add(symptom)
+                term, _ = normalize_symptom(symptom)
+                groups.setdefault(term, set()).add(symptom)
+
+    print(f"{len(raw)} distinct symptom strings -> {len(groups)} terms")
+    for term, spellings in sorted(groups.items()):
+        if len(spellings) > 1:
+            print(f"  {term!r}: {sorted(spellings)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,6 @@
-from flask import Flask, render_template, request, jsonify
-import RetreivalAugmentedGeneration
-import ModelInference
+from AppFactory import create_app
 
-app = Flask(__name__)
-
-
-@app.route('/')
-def index():
-    return render_template('chatbot.html')
-
-
-@app.route('/query', methods=['POST'])
-def query():
-    data = request.json
-    user_query = data.get('query')
-    model_no = int(data.get('model_no'))
-
-    if model_no == 1:
-        answer = ModelInference.llm_chain.invoke(input=f"{user_query}")
-        answer = answer['text']
-    else:
-        answer = RetreivalAugmentedGeneration.LLM_Run(str(user_query))
-
-    return jsonify({'response': answer})
+app = create_app(['chat'])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+"""
+Content-addressed storage for uploaded images.
+
+Uploads are named by the SHA-256 of their bytes, so the same photo uploaded
+twice is stored once and two different photos that share a filename no
+longer overwrite each other. Files are fanned out into two-character
+sub-directories to keep every directory small, and a background sweeper
+evicts files by age and by total size (least recently used first).
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Uploads in progress are written to this sub-directory, and the rescan
+# deletes partial files older than PART_MAX_AGE seconds (left by a crash)
+PART_DIR = 'tmp'
+PART_MAX_AGE = 3600
+
+
+class UploadStore:
+    """
+    A deduplicating upload directory with size/age-based eviction.
+
+    Args:
+        root (str): The directory holding the stored files.
+        max_bytes (int): The total size the store is allowed to reach before
+        the least recently used files are evicted. 0 disables the limit.
+        max_age (float): The number of seconds a file may go unused before it
+        is evicted. 0 disables the limit.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, max_age=7 * 86400):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = {}  # path -> [size, last_used]
+        self._counters = {'writes': 0, 'dedup_hits': 0, 'evictions': 0,
+                          'evicted_bytes': 0, 'sweeps': 0}
+        self._sweeper = None
+        self._stop = threading.Event()
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    def _remove_stale_parts(self):
+        # Older versions wrote partial files to the root itself
+        cutoff = time.time() - PART_MAX_AGE
+        for directory in (os.path.join(self.root, PART_DIR), self.root):
+            for entry in os.scandir(directory):
+                if not entry.is_file() or not entry.name.endswith('.part'):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _scan(self):
+        # Only the fan-out directories belong to the store; anything else
+        # left in the root by older versions of the app is not touched.
+        os.makedirs(os.path.join(self.root, PART_DIR), exist_ok=True)
+        self._remove_stale_parts()
+        entries = {}
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries[entry.path] = [stat.st_size, stat.st_mtime]
+        with self._lock:
+            self._entries = entries
+
+    def path_for(self, digest, extension=''):
+        """
+        Return the storage path for a digest and file extension.
+
+        Args:
+            digest (str): The hex SHA-256 digest of the file contents.
+            extension (str): The file extension, including the dot.
+
+        Returns:
+            str: The path of the stored file.
+        """
+        return os.path.join(self.root, digest[:2], digest + extension)
+
+    def save(self, stream, filename=''):
+        """
+        Store the contents of a file-like object, deduplicating on content.
+
+        Args:
+            stream: A binary file-like object positioned at the data.
+            filename (str): The client-supplied filename. Only its extension
+            is kept.
+
+        Returns:
+            str: The path of the stored file.
+        """
+        extension = os.path.splitext(filename)[1].lower()
+        if not extension[1:].isalnum():
+            extension = ''
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.join(self.root, PART_DIR), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+
+            path = self.path_for(digest.hexdigest(), extension)
+            now = time.time()
+            with self._lock:
+                if os.path.exists(path):
+                    # Refresh the timestamp so eviction treats it as used
+                    os.utime(path, (now, now))
+                    self._counters['dedup_hits'] += 1
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(temp_path, path)
+                    temp_path = None
+                    self._counters['writes'] += 1
+                self._entries[path] = [size, now]
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return path
+
+    def sweep(self):
+        """
+        Evict files that are too old, then the least recently used files
+        until the store fits in max_bytes.
+
+        Returns:
+            dict: The number of files and bytes evicted by this sweep.
+        """
+        now = time.time()
+        evicted = 0
+        evicted_bytes = 0
+
+        with self._lock:
+            by_age = sorted(self._entries.items(), key=lambda item: item[1][1])
+            total = sum(size for size, _ in self._entries.values())
+
+            for path, (size, last_used) in by_age:
+                too_old = self.max_age and now - last_used > self.max_age
+                too_big = self.max_bytes and total > self.max_bytes
+                if not (too_old or too_big):
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                del self._entries[path]
+                total -= size
+                evicted += 1
+                evicted_bytes += size
+
+            self._counters['evictions'] += evicted
+            self._counters['evicted_bytes'] += evicted_bytes
+            self._counters['sweeps'] += 1
+
+        if evicted:
+            logger.info("upload sweep evicted %d files (%d bytes)",
+                        evicted, evicted_bytes)
+        return {'evicted': evicted, 'evicted_bytes': evicted_bytes}
+
+    def stats(self):
+        """
+        Report disk usage and activity counters for the store.
+
+        Returns:
+            dict: The file count, total bytes, configured limits and the
+            write/dedup/eviction counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['files'] = len(self._entries)
+            stats['bytes'] = sum(size for size, _ in self._entries.values())
+        stats['max_bytes'] = self.max_bytes
+        stats['max_age'] = self.max_age
+        return stats
+
+    def start_sweeper(self, interval=300):
+        """
+        Start a daemon thread that rescans the store and sweeps it every
+        `interval` seconds.
+
+        Args:
+            interval (float): The number of seconds between sweeps.
+        """
+        if self._sweeper is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self._scan()
+                    self.sweep()
+                except OSError:
+                    logger.exception("upload sweep failed")
+
+        self._sweeper = threading.Thread(
+            target=run, name='upload-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        """Stop the background sweeper if it is running."""
+        if self._sweeper is None:
+            return
+        self._stop.set()
+        self._sweeper.join()
+        self._sweeper = None
@@ -0,0 +1,343 @@
+"""
+Leave-one-out tuning of the retrieval weights and similarity threshold.
+
+Each diagnosed case is diagnosed from all the other cases, the way the app
+diagnoses a new case: the top 3 cases at or above the threshold, then
+diagnose_and_treat. This is repeated for every candidate combination of
+feature weights and threshold. The combination with the most correct
+diagnoses is written to a JSON file, which the app loads (CBR_CONFIG,
+cbr_config.json by default).
+
+calculate_overall_similarity is a weighted sum of three feature
+similarities, and only the weights change from one combination to the
+next. ComponentSimilarities therefore computes the symptom, age and
+environment similarity of every pair of cases once, as matrices. The
+environment matrix is looked up in a table of difflib ratios between the
+distinct environments. Each combination then costs a weighted sum of
+three matrices, a sort per case and the votes. The scores equal
+calculate_overall_similarity exactly, so ties resolve as in
+retrieve_similar_cases.
+
+The matrices are dense float64, so memory grows with the number of cases
+diagnosed times the number of cases: 24 bytes per pair, and about 50 at
+the peak of scoring a combination, plus 8 bytes per case and distinct
+symptom term while the symptom matrix is built. The 403 cases of FMD
+cases.csv peak under 10 MB; 10,000 cases would take 5 GB, so diagnose a
+--sample of them on large case bases (1,000 of 10,000 cases: 500 MB).
+
+The candidates are either a grid of weights that sum to 1 (--step) or
+--random weight triples, each tried with every --thresholds value. When
+several combinations have the best accuracy, the one closest to the
+current weights and threshold wins. A search that finds nothing better
+therefore leaves the configuration as it is.
+
+Usage:
+    python WeightTuning.py "FMD cases.csv"
+    python WeightTuning.py "FMD cases.csv" --step 0.05 --output cbr.json
+    python WeightTuning.py --random 1000 --thresholds 0.4 0.5 0.6
+"""
+
+import argparse
+import difflib
+import json
+import random
+import time
+
+import numpy as np
+
+import AtomicWrite
+import CaseBasedSystem
+import SymptomNormalizer
+
+FEATURES = ('Symptoms', 'Animal Age (Months)', 'Environmental Conditions')
+
+
+class ComponentSimilarities:
+    """
+    The feature similarities between the query cases and every case.
+
+    Memory peaks at about 50 bytes per (query, case) pair; see the module
+    docstring.
+
+    Args:
+        case_database (dict): Case ID -> case.
+        query_ids (list): The IDs of the cases to diagnose. Defaults to
+        every case.
+
+    Attributes:
+        symptoms (numpy.ndarray): (queries, cases) matrix of
+        calculate_symptom_similarity scores.
+        ages (numpy.ndarray): The same for calculate_age_similarity.
+        environments (numpy.ndarray): The same for
+        calculate_environmental_similarity.
+    """
+
+    def __init__(self, case_database, query_ids=None):
+        cases = list(case_database.values())
+        positions = {case_id: position
+                     for position, case_id in enumerate(case_database)}
+        if query_ids is None:
+            query_ids = list(case_database)
+        self.queries = np.array([positions[case_id] for case_id in query_ids],
+                                dtype=np.int64)
+
+        # Diagnoses vote as spelled, and are judged without stray spaces
+        codes = {}
+        self.labels = np.array(
+            [codes.setdefault(case['Diagnosis'], len(codes))
+             for case in cases], dtype=np.int64)
+        self.names = list(codes)
+        stripped = {}
+        self.stripped = np.array(
+            [stripped.setdefault(name.strip(), len(stripped))
+             for name in self.names], dtype=np.int64)
+        self.counts = np.array(
+            [CaseBasedSystem.case_weight(case) for case in cases],
+            dtype=np.int64)
+
+        self.symptoms = self._symptom_similarities(cases)
+        self.ages = self._age_similarities(cases)
+        self.environments = self._environment_similarities(cases)
+
+    def _symptom_similarities(self, cases):
+        vocabulary = SymptomNormalizer.Vocabulary()
+        term_sets = [vocabulary.term_ids(case['Symptoms'], add=True)
+                     for case in cases]
+        width = max((max(terms) + 1 for terms in term_sets if terms),
+                    default=0)
+        present = np.zeros((len(cases), width), dtype=np.float64)
+        for position, terms in enumerate(term_sets):
+            present[position, list(terms)] = 1
+        sizes = present.sum(axis=1)
+        common = present[self.queries] @ present.T
+        return common / np.maximum(
+            np.maximum(sizes[self.queries, None], sizes[None, :]), 1)
+
+    def _age_similarities(self, cases):
+        ages = np.array([case['Animal Age (Months)'] for case in cases],
+                        dtype=np.int64)
+        new_ages = ages[self.queries, None]
+        max_age = np.maximum(new_ages, ages[None, :])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(
+                max_age > 0, 1 - np.abs(new_ages - ages) / max_age, 1.0)
+
+    def _environment_similarities(self, cases):
+        environments = {}
+        codes = np.array(
+            [environments.setdefault(
+                case['Environmental Conditions'], len(environments))
+             for case in cases], dtype=np.int64)
+        texts = list(environments)
+        ratios = np.array(
+            [[difflib.SequenceMatcher(None, new, existing).ratio()
+              for existing in texts] for new in texts])
+        return ratios[codes[self.queries, None], codes[None, :]]
+
+    def scores(self, weights):
+        """
+        Return the calculate_overall_similarity scores of the query cases
+        against the other cases; a case against itself scores -inf.
+        """
+        scores = (weights['Symptoms'] * self.symptoms +
+                  weights['Animal Age (Months)'] * self.ages +
+                  weights['Environmental Conditions'] * self.environments)
+        scores[np.arange(len(self.queries)), self.queries] = -np.inf
+        return scores
+
+    def nearest(self, weights, top_n=3):
+        """
+        Rank the other cases for every query case by overall similarity.
+
+        Returns:
+            tuple: (queries, top_n) matrices of the positions of the most
+            similar cases, in retrieval order, and of their scores.
+        """
+        scores = self.scores(weights)
+        # Stable, so equal scores keep database order
+        top = np.argsort(-scores, axis=1, kind='stable')[:, :top_n]
+        return top, np.take_along_axis(scores, top, axis=1)
+
+    def accuracy(self, top, top_scores, similarity_threshold=0.5):
+        """
+        Diagnose every query case from its nearest cases (see nearest) at
+        or above a threshold.
+
+        Returns:
+            tuple: The accuracy (the share of the query cases given their
+            own diagnosis) and the coverage (the share for which some case
+            was similar enough).
+        """
+        similar = top_scores >= similarity_threshold
+        labels = self.labels[top]
+        votes = self.counts[top] * similar
+
+        # The votes for the diagnosis at each position; the first of the
+        # most voted positions wins, as with Counter.most_common
+        totals = ((labels[:, :, None] == labels[:, None, :]) *
+                  votes[:, None, :]).sum(axis=2)
+        totals[~similar] = -1
+        best = np.argmax(totals, axis=1)
+        predicted = labels[np.arange(len(top)), best]
+
+        found = similar.any(axis=1)
+        correct = found & (self.stripped[predicted] ==
+                           self.stripped[self.labels[self.queries]])
+        return correct.mean(), found.mean()
+
+    def leave_one_out(self, weights, similarity_threshold=0.5, top_n=3):
+        """
+        Diagnose every query case from the other cases.
+
+        Args:
+            weights (dict): The weight of each feature.
+            similarity_threshold (float): The retrieval threshold.
+            top_n (int): The number of cases retrieved.
+
+        Returns:
+            tuple: The accuracy and the coverage; see accuracy.
+        """
+        top, top_scores = self.nearest(weights, top_n)
+        return self.accuracy(top, top_scores, similarity_threshold)
+
+
+def weight_grid(step=0.1):
+    """Return every weight triple on a grid of `step` that sums to 1."""
+    steps = int(round(1 / step))
+    return [dict(zip(FEATURES, (symptoms / steps, age / steps,
+                                (steps - symptoms - age) / steps)))
+            for symptoms in range(steps + 1)
+            for age in range(steps + 1 - symptoms)]
+
+
+def random_weights(count, seed=0):
+    """Return `count` random weight triples that sum to about 1."""
+    rng = np.random.default_rng(seed)
+    return [dict(zip(FEATURES, (round(float(weight), 4)
+                                for weight in draw)))
+            for draw in rng.dirichlet(np.ones(len(FEATURES)), count)]
+
+
+def _distance(weights, similarity_threshold, current_weights,
+              current_threshold):
+    return (sum(abs(weights[feature] - current_weights[feature])
+                for feature in FEATURES) +
+            abs(similarity_threshold - current_threshold))
+
+
+def tune(similarities, candidates, thresholds, current_weights,
+         current_threshold, top_n=3):
+    """
+    Score every combination of candidate weights and threshold.
+
+    Args:
+        similarities (ComponentSimilarities): The precomputed similarities.
+        candidates (list): Weight dictionaries.
+        thresholds (list): Similarity thresholds.
+        current_weights (dict): The weights in use, preferred on ties.
+        current_threshold (float): The threshold in use.
+        top_n (int): The number of cases retrieved.
+
+    Returns:
+        list: (accuracy, coverage, weights, threshold) tuples, best first.
+    """
+    results = []
+    for weights in candidates:
+        # The threshold only cuts the ranking short
+        top, top_scores = similarities.nearest(weights, top_n)
+        for similarity_threshold in thresholds:
+            accuracy, coverage = similarities.accuracy(
+                top, top_scores, similarity_threshold)
+            results.append((accuracy, coverage, weights,
+                            similarity_threshold))
+    results.sort(key=lambda result: (-result[0], _distance(
+        result[2], result[3], current_weights, current_threshold)))
+    return results
+
+
+def save_config(file_path, weights, similarity_threshold, accuracy, cases):
+    """Write the weights and threshold for load_retrieval_config."""
+    config = {
+        'weights': weights,
+        'similarity_threshold': similarity_threshold,
+        'leave_one_out_accuracy': round(float(accuracy), 4),
+        'cases': cases
+    }
+    with AtomicWrite.replacing(file_path) as temp_path:
+        with open(temp_path, 'w') as file:
+            json.dump(config, file, indent=2)
+            file.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('csv_path', nargs='?', default='FMD cases.csv')
+    parser.add_argument('--output', default='cbr_config.json',
+                        help='the config file; its weights and threshold, '
+                        'if it exists, are the current ones')
+    parser.add_argument('--step', type=float, default=0.1,
+                        help='the spacing of the weight grid')
+    parser.add_argument('--random', type=int,
+                        help='try this many random weight triples instead '
+                        'of the grid')
+    parser.add_argument('--thresholds', type=float, nargs='+',
+                        default=[0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65,
+                                 0.7, 0.75, 0.8])
+    parser.add_argument('--sample', type=int,
+                        help='diagnose only this many cases (default all); '
+                        'memory is about 50 bytes x sample x cases, so '
+                        'sample large case bases')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--show', type=int, default=5,
+                        help='the number of best combinations to print')
+    args = parser.parse_args()
+
+    case_database = CaseBasedSystem.load_case_database(args.csv_path)
+    pending = CaseBasedSystem.fetch_unknown_diagnosis_cases(case_database)
+    query_ids = [case_id for case_id in case_database
+                 if case_id not in pending]
+    if args.sample is not None and args.sample < len(query_ids):
+        query_ids = random.Random(args.seed).sample(query_ids, args.sample)
+    if not query_ids:
+        parser.error("No diagnosed cases to tune on")
+
+    start = time.perf_counter()
+    similarities = ComponentSimilarities(case_database, query_ids)
+    precomputed = time.perf_counter() - start
+
+    current_weights, current_threshold = \
+        CaseBasedSystem.load_retrieval_config(args.output)
+    if args.random:
+        candidates = random_weights(args.random, args.seed)
+    else:
+        candidates = weight_grid(args.step)
+    start = time.perf_counter()
+    if current_weights not in candidates:
+        candidates.append(current_weights)
+    thresholds = sorted(set(args.thresholds) | {current_threshold})
+    results = tune(similarities, candidates, thresholds, current_weights,
+                   current_threshold)
+    searched = time.perf_counter() - start
+
+    baseline, _ = similarities.leave_one_out(
+        current_weights, current_threshold)
+    print(f"{len(query_ids)} of {len(case_database)} cases diagnosed from "
+          f"the others; similarities in {precomputed:.2f} s, "
+          f"{len(results)} combinations in {searched:.2f} s")
+    print(f"Current: {current_weights}, threshold {current_threshold}: "
+          f"accuracy {baseline:.1%}")
+    for accuracy, coverage, weights, similarity_threshold in \
+            results[:args.show]:
+        print(f"  accuracy {accuracy:.1%}  coverage {coverage:.1%}  "
+              f"threshold {similarity_threshold:.2f}  " + '  '.join(
+                  f"{feature} {weights[feature]:.2f}"
+                  for feature in FEATURES))
+
+    accuracy, _, weights, similarity_threshold = results[0]
+    save_config(args.output, weights, similarity_threshold, accuracy,
+                len(query_ids))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
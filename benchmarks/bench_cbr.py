@@ -0,0 +1,345 @@
+"""
+Benchmark suite for the case-based reasoning engine.
+
+Times load_case_database, retrieve_similar_cases, diagnose_and_treat,
+predict_prognosis and save_case_database, and building, opening and
+retrieving from the binary case snapshot, on synthetic case bases of
+several sizes and records the peak traced memory of each stage. It also
+times importing CaseBasedSystem in a fresh interpreter. Each stage reports
+the median of --runs runs (with --compare, as many as the baseline
+recorded). Results are written to a JSON file (--output, untracked), or
+to the committed baseline with --update-baseline; --compare flags stages
+that got slower than a previous baseline by more than --tolerance (or
+the spread of the baseline's runs, up to twice --tolerance) and by more
+than --min-delta-ms, so timer and disk noise is not a regression.
+
+Usage (from the repository root):
+    python benchmarks/bench_cbr.py --sizes 1000 100000 1000000
+    python benchmarks/bench_cbr.py --sizes 1000 \\
+        --compare benchmarks/cbr_baseline.json
+    python benchmarks/bench_cbr.py --sizes 1000 100000 --queries 3 \\
+        --runs 5 --update-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import synthetic_cases
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+import CaseSnapshot  # noqa: E402
+import SymptomNormalizer  # noqa: E402
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'cbr_baseline.json')
+RESULTS_PATH = os.path.join(BENCHMARK_DIR, 'bench_cbr_results.json')
+
+
+def import_case_based_system():
+    """Import CaseBasedSystem from the repository root."""
+    import CaseBasedSystem
+    return CaseBasedSystem
+
+
+def measure_import(module, repeat=5):
+    """
+    Time importing a repository module in fresh interpreters.
+
+    The interpreter runs in an empty directory, so an import that depends on
+    files in the working directory fails instead of being timed.
+
+    Args:
+        module (str): The module name, e.g. 'CaseBasedSystem'.
+        repeat (int): How many interpreters to average over.
+
+    Returns:
+        dict: 'seconds' (per import) and 'peak_mb' (None).
+    """
+    code = (f"import sys, time\n"
+            f"sys.path.insert(0, {synthetic_cases.REPO_ROOT!r})\n"
+            f"start = time.perf_counter()\n"
+            f"import {module}\n"
+            f"print(time.perf_counter() - start)")
+    seconds = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, '-c', code], cwd=directory, check=True,
+                capture_output=True, text=True).stdout
+            seconds.append(float(output.split()[-1]))
+    return {'seconds': sum(seconds) / repeat, 'peak_mb': None}
+
+
+def measure(function, *args, repeat=1, memory=True, **kwargs):
+    """
+    Time a call and, optionally, measure its peak traced memory.
+
+    The timed calls run without tracemalloc, which would slow them down;
+    memory is measured by one extra traced call.
+
+    Args:
+        function (callable): The function to benchmark.
+        *args: Positional arguments for the function.
+        repeat (int): How many times to call it for the timing.
+        memory (bool): Whether to measure peak memory as well.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        tuple: The function's result and a dict with 'seconds' (per call)
+        and 'peak_mb' (None when memory is False).
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args, **kwargs)
+    seconds = (time.perf_counter() - start) / repeat
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = peak / (1024 * 1024)
+
+    return result, {'seconds': seconds, 'peak_mb': peak_mb}
+
+
+def _median(runs):
+    # Stage name -> the median 'seconds' and 'peak_mb' over several runs,
+    # and the 'slowest' run, a measure of the noise of the stage
+    stages = {}
+    for stage in runs[0]:
+        seconds = [run[stage]['seconds'] for run in runs]
+        peaks = [run[stage]['peak_mb'] for run in runs
+                 if run[stage]['peak_mb'] is not None]
+        stages[stage] = {
+            'seconds': statistics.median(seconds),
+            'slowest': max(seconds),
+            'peak_mb': statistics.median(peaks) if peaks else None
+        }
+    return stages
+
+
+def _mean(stats):
+    peaks = [stat['peak_mb'] for stat in stats if stat['peak_mb'] is not None]
+    return {
+        'seconds': sum(stat['seconds'] for stat in stats) / len(stats),
+        'peak_mb': max(peaks) if peaks else None
+    }
+
+
+def benchmark_size(cbr, size, queries, memory=True, seed=0):
+    """
+    Run every stage against a synthetic case base of the given size.
+
+    Args:
+        cbr: The CaseBasedSystem module.
+        size (int): The number of cases.
+        queries (int): The number of retrieval queries to average over.
+        memory (bool): Whether to measure peak memory.
+        seed (int): The seed of the synthetic case base.
+
+    Returns:
+        dict: Stage name -> {'seconds', 'peak_mb'}.
+    """
+    profiles = synthetic_cases.load_profiles()
+    case_database = synthetic_cases.generate_cases(size, seed, profiles)
+    new_cases = synthetic_cases.generate_queries(queries, seed + 1, profiles)
+    results = {}
+    # Every run starts with the same cold normalization cache, and the
+    # file stages of small case bases are averaged over several calls,
+    # as a single call of a few ms is mostly timer and disk noise
+    SymptomNormalizer.normalize_symptom.cache_clear()
+    repeat = max(1, min(10, 10000 // size))
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'cases.csv')
+
+        _, results['save_case_database'] = measure(
+            cbr.save_case_database, case_database, file_path, repeat=repeat,
+            memory=memory)
+        loaded, results['load_case_database'] = measure(
+            cbr.load_case_database, file_path, repeat=repeat, memory=memory)
+        _, results['build_snapshot'] = measure(
+            CaseSnapshot.build_snapshot, file_path, repeat=repeat,
+            memory=memory)
+        snapshot, results['open_snapshot'] = measure(
+            CaseSnapshot.open_snapshot, file_path, repeat=repeat,
+            memory=memory)
+
+        snapshot_stats = []
+        for new_case in new_cases:
+            _, stats = measure(snapshot.retrieve, new_case, cbr.weights, 0.5,
+                               top_n=3, memory=memory)
+            snapshot_stats.append(stats)
+        results['snapshot_retrieve'] = _mean(snapshot_stats)
+        del snapshot
+
+    retrieval_stats = []
+    diagnose_stats = []
+    prognosis_stats = []
+    for new_case in new_cases:
+        similar_cases, stats = measure(
+            cbr.retrieve_similar_cases, new_case, loaded, 0.5, top_n=3,
+            memory=memory)
+        retrieval_stats.append(stats)
+
+        # The reasoning steps only see the top cases, so repeat them enough
+        # to get a stable timing
+        _, stats = measure(cbr.diagnose_and_treat, new_case, similar_cases,
+                           repeat=1000, memory=memory)
+        diagnose_stats.append(stats)
+        _, stats = measure(cbr.predict_prognosis, new_case, similar_cases,
+                           repeat=1000, memory=memory)
+        prognosis_stats.append(stats)
+
+    results['retrieve_similar_cases'] = _mean(retrieval_stats)
+    results['diagnose_and_treat'] = _mean(diagnose_stats)
+    results['predict_prognosis'] = _mean(prognosis_stats)
+    return results
+
+
+def _slower(old, new, tolerance, min_delta):
+    # A median within the spread of the baseline's own runs is noise, up
+    # to twice the tolerance, so that a noisy stage still has a limit
+    spread = old.get('slowest', old['seconds']) / old['seconds'] - 1
+    allowed = min(max(tolerance, spread), 2 * tolerance)
+    return (new > old['seconds'] * (1 + allowed) and
+            new - old['seconds'] > min_delta)
+
+
+def compare(baseline, current, tolerance, min_delta=0.001):
+    """
+    Find stages that got slower than the baseline.
+
+    Args:
+        baseline (dict): A previous results file.
+        current (dict): The current results.
+        tolerance (float): The allowed relative slowdown, e.g. 0.2 for 20%.
+        A stage whose slowest baseline run was slower still is allowed
+        that much, up to twice the tolerance.
+        min_delta (float): The allowed absolute slowdown in seconds; a
+        stage must exceed both to regress.
+
+    Returns:
+        list: (size, stage, baseline seconds, current seconds) for every
+        regression; size is None for the startup stages.
+    """
+    regressions = []
+    for stage, stats in current.get('startup', {}).items():
+        old = baseline.get('startup', {}).get(stage)
+        if old is not None and _slower(old, stats['seconds'], tolerance,
+                                       min_delta):
+            regressions.append((None, stage, old['seconds'], stats['seconds']))
+    for size, stages in current['results'].items():
+        for stage, stats in stages.items():
+            old = baseline['results'].get(size, {}).get(stage)
+            if old is None:
+                continue
+            if _slower(old, stats['seconds'], tolerance, min_delta):
+                regressions.append(
+                    (size, stage, old['seconds'], stats['seconds']))
+    return regressions
+
+
+def print_results(results):
+    for stage, stats in results.get('startup', {}).items():
+        print(f"  {stage:<26} {stats['seconds'] * 1000:12.3f} ms")
+    for size, stages in results['results'].items():
+        print(f"\n{int(size):,} cases")
+        for stage, stats in stages.items():
+            memory = '' if stats['peak_mb'] is None else \
+                f"  peak {stats['peak_mb']:.1f} MB"
+            print(f"  {stage:<26} {stats['seconds'] * 1000:12.3f} ms{memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--runs', type=int, default=None,
+                        help='repeat every stage and report the median '
+                        '(default 1, or as many as the --compare baseline)')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the tracemalloc runs')
+    parser.add_argument('--output', default=RESULTS_PATH,
+                        help='where to write the results (untracked)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help=f'write the results to {BASELINE_PATH} '
+                        'instead of --output')
+    parser.add_argument('--compare', default=None,
+                        help='baseline JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='slowdowns smaller than this are noise')
+    args = parser.parse_args()
+    if args.update_baseline:
+        args.output = BASELINE_PATH
+
+    baseline = None
+    if args.compare:
+        # Read it first: --output may point at the same file
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    if args.runs is None:
+        # Compare medians with medians of as many runs
+        args.runs = 1 if baseline is None else \
+            baseline['meta'].get('runs', 1)
+
+    cbr = import_case_based_system()
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'queries': args.queries,
+            'seed': args.seed,
+            'runs': args.runs
+        },
+        'startup': _median([
+            {'import_case_based_system': measure_import('CaseBasedSystem')}
+            for _ in range(args.runs)]),
+        'results': {}
+    }
+    print_results({'startup': results['startup'], 'results': {}})
+    for size in args.sizes:
+        stages = _median([
+            benchmark_size(cbr, size, args.queries, not args.no_memory,
+                           args.seed)
+            for _ in range(args.runs)])
+        results['results'][str(size)] = stages
+        print_results({'results': {str(size): stages}})
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.tolerance,
+                              args.min_delta_ms / 1000)
+        for size, stage, old, new in regressions:
+            where = '' if size is None else f" at {int(size):,} cases"
+            print(f"REGRESSION {stage}{where}: "
+                  f"{old * 1000:.3f} ms -> {new * 1000:.3f} ms "
+                  f"({new / old - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} and "
+              f"{args.min_delta_ms:g} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Latency and agreement of clustered (coarse-to-fine) retrieval against
+exact retrieval.
+
+Builds a CaseIndex over a synthetic case base, the way the web app does,
+adds a CaseClusters index for each number of clusters, and runs the same
+queries through exact retrieval (IndexView.retrieve, which returns what
+CaseBasedSystem.retrieve_similar_cases returns) and through the clusters
+with each number of probes. Reports the build time, the mean query time,
+the share of the case base rescored per query, recall@3 (the fraction of
+the exact top 3 that the clusters also returned), and the share of queries
+whose diagnose_and_treat diagnosis is unchanged.
+
+50 queries, Python 3.11 on Linux (CLUSTERSxPROBES; build in seconds, query
+in milliseconds):
+
+                  100,000 cases                     1,000,000 cases
+    method   build query rescored recall diag  build query rescored recall diag
+    exact      0.2  20.0   21.1%   1.000 100%    2.5 145.0   21.0%   1.000 100%
+    256x8     17.4  22.4    4.6%   0.833  98%   64.5  47.0    4.4%   0.913 100%
+    256x16    17.4  22.3    8.8%   0.933 100%   64.5  63.1    8.3%   0.947 100%
+    256x32    17.4  22.5   16.6%   0.973 100%   64.5  95.6   15.8%   0.987 100%
+    1024x8    67.9  23.2    1.1%   0.733 100%  241.5  35.6    1.1%   0.880  98%
+    1024x16   67.9  26.6    2.2%   0.800 100%  241.5  30.5    2.3%   0.913  98%
+    1024x32   67.9  23.9    4.5%   0.900 100%  241.5  46.8    4.5%   0.960 100%
+
+Every query pays one difflib comparison per distinct environment among
+the representatives and the rescored cases, as exact retrieval does among
+its candidates; at 100,000 cases that is most of the query time, so the
+clusters only pay off on larger case bases. On the same 1,000,000 cases,
+MinHashLSH 16x3 reaches recall 0.993 in 26 ms (see bench_lsh.py).
+
+Usage (from the repository root):
+    python benchmarks/bench_clusters.py --sizes 100000 1000000
+    python benchmarks/bench_clusters.py --clusters 64 256 --probes 4 16
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import synthetic_cases
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+import CaseBasedSystem  # noqa: E402
+import CaseClusters  # noqa: E402
+import CaseIndex  # noqa: E402
+import CaseSnapshot  # noqa: E402
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def recall(exact, approximate):
+    """Return the share of the exact results found by the approximation."""
+    if not exact:
+        return 1.0
+    found = {case_id for case_id, _, _ in approximate}
+    return sum(case_id in found for case_id, _, _ in exact) / len(exact)
+
+
+def same_diagnosis(new_case, exact, approximate):
+    expected, _ = CaseBasedSystem.diagnose_and_treat(new_case, exact)
+    diagnosis, _ = CaseBasedSystem.diagnose_and_treat(new_case, approximate)
+    return diagnosis == expected
+
+
+def benchmark_size(size, queries, cluster_counts, probe_counts, iterations=1,
+                   seed=0):
+    """
+    Compare exact and clustered retrieval on a synthetic case base.
+
+    Returns:
+        list: A row per method: name, build seconds, mean query seconds,
+        mean rescored share of the case base, mean recall@3, and the share
+        of queries with the exact diagnosis.
+    """
+    profiles = synthetic_cases.load_profiles()
+    case_database = synthetic_cases.generate_cases(size, seed, profiles)
+    new_cases = synthetic_cases.generate_queries(queries, seed + 1, profiles)
+    weights = CaseBasedSystem.weights
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'cases.csv')
+        CaseBasedSystem.save_case_database(case_database, file_path)
+        case_database = None
+        snapshot = CaseSnapshot.open_snapshot(file_path)
+        index, build = timed(CaseIndex.CaseIndex.from_snapshot, snapshot)
+        view = index.view()
+        # The first query pays for loading the cases it returns
+        view.retrieve(new_cases[0], weights)
+
+        exact = []
+        seconds = 0.0
+        rescored = 0
+        for new_case in new_cases:
+            similar_cases, elapsed = timed(view.retrieve, new_case, weights)
+            exact.append(similar_cases)
+            seconds += elapsed
+            rescored += len(view.candidate_rows(new_case, weights, 0.5))
+        results = [('exact', build, seconds / queries,
+                    rescored / queries / size, 1.0, 1.0)]
+
+        for clusters in cluster_counts:
+            name = f'clusters {clusters}'
+            _, build = timed(index.add_index, name,
+                             lambda: CaseClusters.CaseClusters(
+                                 clusters=clusters, iterations=iterations))
+            view = index.view()
+            derived = view.derived(name)
+            for probes in probe_counts:
+                seconds = 0.0
+                rescored = 0
+                recalls = []
+                agreed = 0
+                for new_case, expected in zip(new_cases, exact):
+                    similar_cases, elapsed = timed(
+                        derived.retrieve, view, new_case, weights,
+                        probes=probes)
+                    seconds += elapsed
+                    rescored += len(
+                        derived.candidates(view, new_case, probes))
+                    recalls.append(recall(expected, similar_cases))
+                    agreed += same_diagnosis(
+                        new_case, expected, similar_cases)
+                results.append((f'{clusters}x{probes}', build,
+                                seconds / queries, rescored / queries / size,
+                                sum(recalls) / queries, agreed / queries))
+            index.remove_index(name)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--clusters', type=int, nargs='+', default=[256])
+    parser.add_argument('--probes', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--iterations', type=int, default=1,
+                        help='k-medoids refinements of the clusters')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(f"\n{size:,} cases, {args.queries} queries "
+              f"(method: CLUSTERSxPROBES)")
+        print(f"  {'method':<10}{'build s':>9}{'query ms':>10}"
+              f"{'rescored':>10}{'recall@3':>10}{'diagnosis':>11}")
+        for name, build, seconds, share, mean_recall, agreed in \
+                benchmark_size(size, args.queries, args.clusters,
+                               args.probes, args.iterations):
+            print(f"  {name:<10}{build:>9.2f}{seconds * 1000:>10.2f}"
+                  f"{share:>10.2%}{mean_recall:>10.3f}{agreed:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Throughput of the local CPU embedder (LocalEmbedder, RAG_EMBEDDER=local).
+
+Fits a HashedTfidfEmbedder to the chunks of Raw_Text_Data.txt, then
+embeds the chunks, repeated to --texts texts, at several batch sizes and
+numbers of worker threads, and reports embeddings per second. A single
+query is timed too, as the pipeline's text embedder embeds one question
+per request. As a check of the embeddings, the question part of every
+"question: answer" chunk is embedded and the chunks ranked by cosine
+similarity; hit@k is the share whose own chunk ranks in the top k (see
+benchmarks/bench_rag_retrieval.py for the same check of BM25).
+
+Median of 3 runs, Python 3.11 on Linux, 1 CPU, 315 chunks, 128
+dimensions, 10000 texts:
+
+    fit                       0.57 s
+    query (mean)              0.16 ms   p95 0.37 ms
+    batch    1, 1 worker      6152 embeddings/s
+    batch    1, 4 workers     4549 embeddings/s
+    batch   32, 1 worker     10473 embeddings/s
+    batch   32, 4 workers     9252 embeddings/s
+    batch  256, 1 worker      7826 embeddings/s
+    batch  256, 4 workers     7411 embeddings/s
+    hit@1 / hit@5             95.1% / 100.0% of 184 question chunks
+
+Batching amortises the per-call numpy overhead up to about 32 texts;
+larger batches gather a (terms, dimensions) block of the projection that
+no longer fits in cache, hence the default batch_size of 32. The
+tokenizing holds the GIL, so extra workers can only overlap the
+projection, and on a single CPU they cost a little; run with more CPUs to
+see their effect.
+
+Usage (from the repository root):
+    python benchmarks/bench_embedders.py
+    python benchmarks/bench_embedders.py --texts 50000 --workers 1 2 4
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+import synthetic_cases
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+import BM25Retriever  # noqa: E402
+import LocalEmbedder  # noqa: E402
+
+TEXT_PATH = os.path.join(synthetic_cases.REPO_ROOT, 'Raw_Text_Data.txt')
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def load_chunks():
+    with open(TEXT_PATH, encoding='utf-8') as file:
+        return BM25Retriever.chunk_text(file.read())
+
+
+def throughput(embedder, texts, batch_size, workers):
+    """Return the embeddings per second of one embed() call over texts."""
+    embedder.batch_size = batch_size
+    embedder.workers = workers
+    start = time.perf_counter()
+    embedder.embed(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def query_seconds(embedder, chunks, repeat):
+    """Time embedding one text at a time, as the pipeline embeds queries."""
+    seconds = []
+    for _ in range(repeat):
+        for chunk in chunks:
+            start = time.perf_counter()
+            embedder.embed([chunk])
+            seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def hits(embedder, chunks):
+    """
+    Rank the chunks by cosine similarity to their question parts.
+
+    Returns:
+        tuple: hit@1, hit@5 and the number of question chunks.
+    """
+    positions = []
+    questions = []
+    for position, chunk in enumerate(chunks):
+        question, separator, _ = chunk.partition(': ')
+        if separator and question.startswith(('What', 'How', 'Why')):
+            positions.append(position)
+            questions.append(question)
+    scores = embedder.embed(questions) @ embedder.embed(chunks).T
+    ranking = np.argsort(-scores, axis=1, kind='stable')[:, :5]
+    found = ranking == np.array(positions)[:, None]
+    return (found[:, :1].any(axis=1).mean(), found.any(axis=1).mean(),
+            len(questions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--texts', type=int, default=10000,
+                        help='texts embedded per measurement')
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1, 32, 256])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, os.cpu_count() or 1, 4}))
+    parser.add_argument('--dimensions', type=int, default=128)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per measurement; the median is reported')
+    args = parser.parse_args()
+
+    chunks = load_chunks()
+    texts = (chunks * (args.texts // len(chunks) + 1))[:args.texts]
+
+    start = time.perf_counter()
+    embedder = LocalEmbedder.HashedTfidfEmbedder(
+        dimensions=args.dimensions).fit(chunks)
+    fit = time.perf_counter() - start
+
+    print(f"HashedTfidfEmbedder over {len(chunks)} chunks of {TEXT_PATH}, "
+          f"{embedder.dimensions} dimensions, {os.cpu_count()} CPUs")
+    print(f"  {'fit':<24}{fit:>9.2f} s")
+    seconds = query_seconds(embedder, chunks, 1)
+    print(f"  {'query (mean)':<24}{statistics.mean(seconds) * 1000:>9.2f} ms"
+          f"   p95 {percentile(seconds, 0.95) * 1000:.2f} ms")
+    for batch_size in args.batch_sizes:
+        for workers in args.workers:
+            rate = statistics.median(
+                throughput(embedder, texts, batch_size, workers)
+                for _ in range(args.repeat))
+            name = f"batch {batch_size:>4}, {workers} worker" + \
+                ('s' if workers > 1 else '')
+            print(f"  {name:<24}{rate:>9.0f} embeddings/s")
+    hit1, hit5, questions = hits(embedder, chunks)
+    print(f"  hit@1 {hit1:.1%}, hit@5 {hit5:.1%} of {questions} "
+          f"question chunks")
+
+
+if __name__ == "__main__":
+    main()
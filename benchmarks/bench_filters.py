@@ -0,0 +1,122 @@
+"""
+Latency of retrieval with the structured pre-filters.
+
+Builds a CaseIndex over a synthetic case base from its snapshot, as the web
+app does, with an AgeIndex partitioned by sex, and runs the same queries
+with each filter setting. Reports the mean query time, the share of the
+case base scored per query, and how many queries still return the same
+top 3 as unfiltered retrieval. The 'threshold' age window excludes no
+case that can reach the threshold, so its top 3 never changes.
+
+50 queries, Python 3.11 on Linux:
+
+                                    100,000 cases        1,000,000 cases
+    filter              threshold  query ms scored     query ms scored
+    none                      0.5      20.1  21.1%        144.7  21.0%
+    same sex                  0.5      17.3  14.3%         83.7  14.3%
+    age >= 0.8                0.5      18.0  11.8%         39.9  11.3%
+    same sex, age >= 0.8      0.5      16.8   7.3%         28.8   7.3%
+    none                      0.9      22.5  21.1%        129.7  21.0%
+    age threshold             0.9      19.0  16.5%         92.8  16.5%
+
+The 'threshold' window returned the unfiltered top 3 for every query; the
+other filters change the results by design (same sex: 34-38% unchanged).
+
+Usage (from the repository root):
+    python benchmarks/bench_filters.py --sizes 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import synthetic_cases
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+import CaseBasedSystem  # noqa: E402
+import CaseIndex  # noqa: E402
+import CaseSnapshot  # noqa: E402
+
+# (name, similarity threshold, IndexView.retrieve pre-filters)
+SETTINGS = [
+    ('none', 0.5, {}),
+    ('same sex', 0.5, {'same_sex': True}),
+    ('age >= 0.8', 0.5, {'age_window': 0.8}),
+    ('same sex, age >= 0.8', 0.5, {'same_sex': True, 'age_window': 0.8}),
+    ('none', 0.9, {}),
+    ('age threshold', 0.9, {'age_window': 'threshold'}),
+]
+
+
+def benchmark_size(size, queries, seed=0):
+    """
+    Time retrieval with each of SETTINGS on a synthetic case base.
+
+    Returns:
+        list: A row per setting: name, threshold, mean query seconds, mean
+        scored share of the case base, and the share of queries with the
+        unfiltered top 3 at the same threshold.
+    """
+    profiles = synthetic_cases.load_profiles()
+    case_database = synthetic_cases.generate_cases(size, seed, profiles)
+    new_cases = synthetic_cases.generate_queries(queries, seed + 1, profiles)
+    weights = CaseBasedSystem.weights
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'cases.csv')
+        CaseBasedSystem.save_case_database(case_database, file_path)
+        case_database = None
+        index = CaseIndex.CaseIndex.from_snapshot(
+            CaseSnapshot.open_snapshot(file_path))
+        index.add_index(
+            'age', lambda: CaseIndex.AgeIndex(partition='Animal Sex'))
+        view = index.view()
+        # The first query pays for loading the cases it returns
+        view.retrieve(new_cases[0], weights)
+
+        results = []
+        unfiltered = {}
+        for name, threshold, filters in SETTINGS:
+            seconds = 0.0
+            scored = 0
+            same = 0
+            for position, new_case in enumerate(new_cases):
+                start = time.perf_counter()
+                similar_cases = view.retrieve(
+                    new_case, weights, threshold, **filters)
+                seconds += time.perf_counter() - start
+
+                scored += len(view.candidate_rows(
+                    new_case, weights, threshold, view.filter_rows(
+                        new_case, weights, threshold, **filters)))
+                case_ids = [case_id for case_id, _, _ in similar_cases]
+                if not filters:
+                    unfiltered[threshold, position] = case_ids
+                same += case_ids == unfiltered[threshold, position]
+            results.append((name, threshold, seconds / queries,
+                            scored / queries / size, same / queries))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(f"\n{size:,} cases, {args.queries} queries")
+        print(f"  {'filter':<22}{'threshold':>10}{'query ms':>10}"
+              f"{'scored':>9}{'same top 3':>12}")
+        for name, threshold, seconds, share, same in benchmark_size(
+                size, args.queries):
+            print(f"  {name:<22}{threshold:>10.1f}{seconds * 1000:>10.2f}"
+                  f"{share:>9.1%}{same:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
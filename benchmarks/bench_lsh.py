@@ -0,0 +1,156 @@
+"""
+Recall and speed of MinHash-LSH retrieval against exact retrieval.
+
+Builds a CaseIndex over a synthetic case base, adds a MinHashLSH index for
+each configuration, and runs the same queries through exact retrieval
+(IndexView.retrieve, which returns what
+CaseBasedSystem.retrieve_similar_cases returns) and through the LSH
+candidates. Reports the mean query time, the share of the case base
+rescored per query, and recall@3: the fraction of the exact top 3 that the
+approximate search also returned.
+
+50 queries, Python 3.11 on Linux:
+
+                 100,000 cases               1,000,000 cases
+    method    query ms rescored recall   query ms rescored recall
+    exact        42.7    21.1%   1.000      162.3    21.0%   1.000
+    lsh 8x2      11.2     5.4%   0.940       41.3     5.4%   0.993
+    lsh 16x2     17.2    10.7%   0.973       86.1    10.7%   0.987
+    lsh 32x2     22.3    16.1%   0.993      140.6    16.0%   1.000
+    lsh 16x3      9.8     3.0%   0.893       26.3     3.0%   0.993
+
+Part of every query is one difflib comparison per distinct environment
+among the rescored cases, which does not shrink with the candidates.
+
+Usage (from the repository root):
+    python benchmarks/bench_lsh.py --sizes 100000 1000000
+    python benchmarks/bench_lsh.py --configs 8x2 16x2 32x2 16x1 --verify
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import synthetic_cases
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+import CaseBasedSystem  # noqa: E402
+import CaseIndex  # noqa: E402
+import CaseSnapshot  # noqa: E402
+import MinHashLSH  # noqa: E402
+
+
+def parse_config(text):
+    """Parse 'BANDSxROWS', e.g. '16x2', into MinHashLSH arguments."""
+    bands, rows_per_band = text.lower().split('x')
+    return {'bands': int(bands), 'rows_per_band': int(rows_per_band)}
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def recall(exact, approximate):
+    """Return the share of the exact results found by the approximation."""
+    if not exact:
+        return 1.0
+    found = {case_id for case_id, _, _ in approximate}
+    return sum(case_id in found for case_id, _, _ in exact) / len(exact)
+
+
+def benchmark_size(size, queries, configs, verify=False, seed=0):
+    """
+    Compare exact and LSH retrieval on a synthetic case base.
+
+    The index is built the way the web app builds it, from the binary
+    snapshot of the case CSV.
+
+    Returns:
+        list: A row per method: name, build seconds, mean query seconds,
+        mean rescored share of the case base, and mean recall@3.
+    """
+    profiles = synthetic_cases.load_profiles()
+    case_database = synthetic_cases.generate_cases(size, seed, profiles)
+    new_cases = synthetic_cases.generate_queries(queries, seed + 1, profiles)
+    weights = CaseBasedSystem.weights
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'cases.csv')
+        CaseBasedSystem.save_case_database(case_database, file_path)
+        if not verify:
+            case_database = None
+        snapshot = CaseSnapshot.open_snapshot(file_path)
+        index, build = timed(CaseIndex.CaseIndex.from_snapshot, snapshot)
+        view = index.view()
+
+        exact = []
+        seconds = 0.0
+        rescored = 0
+        for new_case in new_cases:
+            similar_cases, elapsed = timed(view.retrieve, new_case, weights)
+            exact.append(similar_cases)
+            seconds += elapsed
+            rescored += len(view.candidate_rows(new_case, weights, 0.5))
+            if case_database is not None:
+                expected = CaseBasedSystem.retrieve_similar_cases(
+                    new_case, case_database, 0.5, top_n=3)
+                if [case_id for case_id, _, _ in expected] != \
+                        [case_id for case_id, _, _ in similar_cases]:
+                    raise AssertionError(
+                        f"Exact retrieval differs: {new_case}")
+        results = [('exact', build, seconds / queries,
+                    rescored / queries / size, 1.0)]
+
+        for config in configs:
+            name = f"lsh {config['bands']}x{config['rows_per_band']}"
+            _, build = timed(index.add_index, name,
+                             lambda: MinHashLSH.MinHashLSH(**config))
+            view = index.view()
+            lsh = view.derived(name)
+            seconds = 0.0
+            rescored = 0
+            recalls = []
+            for new_case, expected in zip(new_cases, exact):
+                similar_cases, elapsed = timed(
+                    lsh.retrieve, view, new_case, weights)
+                seconds += elapsed
+                rescored += len(lsh.candidates(view, new_case))
+                recalls.append(recall(expected, similar_cases))
+            results.append((name, build, seconds / queries,
+                            rescored / queries / size,
+                            sum(recalls) / queries))
+            index.remove_index(name)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--configs', nargs='+', type=parse_config,
+                        default=[parse_config(text) for text in
+                                 ('8x2', '16x2', '32x2', '16x3')],
+                        help='LSH configurations as BANDSxROWS')
+    parser.add_argument('--verify', action='store_true',
+                        help='check exact retrieval against '
+                        'retrieve_similar_cases (slow)')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(f"\n{size:,} cases, {args.queries} queries")
+        print(f"  {'method':<12}{'build s':>9}{'query ms':>10}"
+              f"{'rescored':>10}{'recall@3':>10}")
+        for name, build, seconds, share, mean_recall in benchmark_size(
+                size, args.queries, args.configs, args.verify):
+            print(f"  {name:<12}{build:>9.2f}{seconds * 1000:>10.2f}"
+                  f"{share:>10.2%}{mean_recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Latency of the RAG first stage: local BM25 retrieval against the remote
+query embedding it replaces.
+
+Times building, loading and searching the BM25Retriever index of
+Raw_Text_Data.txt over a fixed question set (QUESTIONS). As a check of the
+ranking, the question part of every "question: answer" chunk is searched
+too; hit@k is the share whose own chunk ranks in the top k.
+
+The embedding stage cannot run offline. It is timed with --embedding
+(needs gradient_haystack and the GRADIENT_* credentials), or summarised
+from a RAG_TRACE_LOG file of the running app with --trace-log, whose
+text_embedder stage is the round trip that RAG_RETRIEVER=bm25 skips.
+
+Median of 3 runs, Python 3.11 on Linux, 315 chunks, 20 questions x 200
+repeats:
+
+    build index          32.9 ms
+    load index            6.2 ms
+    search (mean)        0.09 ms   p95 0.12 ms
+    hit@1 / hit@5        97.8% / 100.0% of 184 question chunks
+
+A search costs a tenth of a millisecond; the embedding round trip it
+replaces is a network call to Gradient (not measured here, no network).
+
+Usage (from the repository root):
+    python benchmarks/bench_rag_retrieval.py
+    python benchmarks/bench_rag_retrieval.py --trace-log rag_trace.jsonl
+    python benchmarks/bench_rag_retrieval.py --embedding
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import synthetic_cases
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+import BM25Retriever  # noqa: E402
+
+TEXT_PATH = os.path.join(synthetic_cases.REPO_ROOT, 'Raw_Text_Data.txt')
+
+QUESTIONS = [
+    "Do bulls show signs of Trichomoniasis?",
+    "How do farmers manage waste?",
+    "What are the signs of heat stress in cattle?",
+    "How can I prevent mastitis in dairy cows?",
+    "What vaccines do poultry need?",
+    "How is foot and mouth disease spread?",
+    "What should pigs be fed?",
+    "How do I control ticks on livestock?",
+    "What is artificial insemination used for?",
+    "How can parasites be controlled in sheep?",
+    "What causes diarrhoea in calves?",
+    "What are the benefits of free-range poultry?",
+    "How does climate affect animal farming?",
+    "What is the role of grazing management?",
+    "How do you treat lumpy skin disease?",
+    "Why is record keeping important on a farm?",
+    "What are the symptoms of Newcastle disease?",
+    "How should a dairy farm be cleaned?",
+    "What is aquaculture?",
+    "How can farmers improve milk production?",
+]
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def time_bm25(repeat):
+    """
+    Time the BM25 index and check its ranking.
+
+    Returns:
+        dict: Build and load seconds, per-search seconds, and hit@1 and
+        hit@5 over the question chunks.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, 'index.npz')
+        start = time.perf_counter()
+        BM25Retriever.build_index(TEXT_PATH, index_path)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        index = BM25Retriever.load_index(index_path, TEXT_PATH)
+        load = time.perf_counter() - start
+
+    searches = []
+    for _ in range(repeat):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            BM25Retriever.search(index, question)
+            searches.append(time.perf_counter() - start)
+
+    hits = {1: 0, 5: 0}
+    questions = 0
+    for position, chunk in enumerate(index['chunks']):
+        question, separator, _ = str(chunk).partition(': ')
+        if not separator or not question.startswith(('What', 'How', 'Why')):
+            continue
+        questions += 1
+        ranking = [found for found, _ in
+                   BM25Retriever.search(index, question, top_k=5)]
+        for k in hits:
+            hits[k] += position in ranking[:k]
+    return {'build': build, 'load': load, 'searches': searches,
+            'hits': {k: hit / max(questions, 1) for k, hit in hits.items()},
+            'questions': questions}
+
+
+def time_embedding():
+    """Time one GradientTextEmbedder call per question, in seconds."""
+    from gradient_haystack.embedders.gradient_text_embedder import \
+        GradientTextEmbedder
+
+    embedder = GradientTextEmbedder(
+        access_token=os.environ["GRADIENT_ACCESS_TOKEN"],
+        workspace_id=os.environ["GRADIENT_WORKSPACE_ID"])
+    embedder.warm_up()
+    seconds = []
+    for question in QUESTIONS:
+        start = time.perf_counter()
+        embedder.run(text=question)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def trace_stages(trace_log):
+    """Collect the stage timings of a RAG_TRACE_LOG file, in seconds."""
+    stages = {}
+    with open(trace_log) as file:
+        for line in file:
+            trace = json.loads(line)
+            for stage, seconds in trace.get('stages', {}).items():
+                stages.setdefault(stage, []).append(seconds)
+    return stages
+
+
+def report(name, seconds):
+    print(f"  {name:<22}{statistics.mean(seconds) * 1000:>9.2f} ms"
+          f"   p95 {percentile(seconds, 0.95) * 1000:.2f} ms"
+          f"   ({len(seconds)} calls)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='searches of each question')
+    parser.add_argument('--embedding', action='store_true',
+                        help='also time the remote query embedding')
+    parser.add_argument('--trace-log',
+                        help='a RAG_TRACE_LOG file to summarise')
+    args = parser.parse_args()
+
+    bm25 = time_bm25(args.repeat)
+    print(f"BM25 over {TEXT_PATH}")
+    print(f"  {'build index':<22}{bm25['build'] * 1000:>9.2f} ms")
+    print(f"  {'load index':<22}{bm25['load'] * 1000:>9.2f} ms")
+    report('search', bm25['searches'])
+    print(f"  hit@1 {bm25['hits'][1]:.1%}, hit@5 {bm25['hits'][5]:.1%} "
+          f"of {bm25['questions']} question chunks")
+
+    if args.embedding:
+        print("Remote query embedding")
+        report('text_embedder', time_embedding())
+    if args.trace_log:
+        print(f"Stages in {args.trace_log}")
+        for stage, seconds in trace_stages(args.trace_log).items():
+            report(stage, seconds)
+
+
+if __name__ == "__main__":
+    main()
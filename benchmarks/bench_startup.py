@@ -0,0 +1,132 @@
+"""
+Startup time and memory of the web app entry points.
+
+Starts each target in a fresh interpreter under `python -X importtime` and
+reports the time to build the app, the peak RSS of the process, the
+packages that took longest to import, and which of the heavy client
+libraries (Google Cloud, langchain, haystack and the model modules built on
+them) were imported. No target should import any of them: the chat models
+load on the first question and the Vision client on the first image that
+the local gallery cannot label.
+
+Targets:
+    App1         App1.py, every blueprint
+    cbr          wsgi.py with APP_SUBSYSTEMS=cbr, a CBR-only worker
+    cbr-preload  the same, with the case base loaded as gunicorn's master
+                 does before forking
+
+Median of 3 runs, Python 3.11 on Linux, without the Google, langchain and
+haystack packages installed:
+
+    target        startup   peak RSS   heavy modules
+    App1           307 ms    43.5 MB   none
+    cbr            318 ms    43.2 MB   none
+    cbr-preload    344 ms    44.1 MB   none
+
+numpy, werkzeug and jinja2 account for about half of the startup time.
+
+Usage (from the repository root):
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --targets cbr --top 15 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import synthetic_cases
+
+HEAVY_MODULES = ('google', 'langchain', 'haystack', 'gradient_haystack',
+                 'ModelInference', 'RetreivalAugmentedGeneration')
+
+TARGETS = {
+    'App1': ({}, "import App1"),
+    'cbr': ({'APP_SUBSYSTEMS': 'cbr'}, "import wsgi"),
+    'cbr-preload': ({'APP_SUBSYSTEMS': 'cbr', 'APP_PRELOAD': 'case_base'},
+                    "import wsgi\nwsgi.preload(wsgi.app)")
+}
+
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in sys.modules
+               if name.split('.')[0] in {heavy!r})
+print(json.dumps({{
+    'seconds': seconds,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy': heavy
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Total the `-X importtime` output per top-level package.
+
+    Returns:
+        dict: Package name (e.g. 'numpy') -> the time spent importing its
+        modules, in seconds, excluding the packages they imported.
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1e6
+    return packages
+
+
+def run_target(name):
+    """
+    Start one target in a fresh interpreter.
+
+    Returns:
+        dict: 'seconds', 'max_rss_kb', 'heavy' (the heavy modules
+        imported) and 'packages' (see parse_importtime).
+    """
+    env, code = TARGETS[name]
+    script = CHILD.format(root=synthetic_cases.REPO_ROOT, code=code,
+                          heavy=HEAVY_MODULES)
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=synthetic_cases.REPO_ROOT, env=dict(os.environ, **env),
+        capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"{name} failed to start:\n{process.stderr}")
+    result = json.loads(process.stdout.splitlines()[-1])
+    result['packages'] = parse_importtime(process.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--targets', nargs='+', default=list(TARGETS),
+                        choices=list(TARGETS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=8,
+                        help='how many of the slowest packages to list')
+    args = parser.parse_args()
+
+    for name in args.targets:
+        runs = [run_target(name) for _ in range(args.repeat)]
+        seconds = statistics.median(run['seconds'] for run in runs)
+        rss = statistics.median(run['max_rss_kb'] for run in runs)
+        print(f"\n{name}: {seconds * 1000:.0f} ms, "
+              f"peak RSS {rss / 1024:.1f} MB")
+        heavy = runs[-1]['heavy']
+        print(f"  heavy modules: {', '.join(heavy) if heavy else 'none'}")
+        packages = sorted(runs[-1]['packages'].items(),
+                          key=lambda item: item[1], reverse=True)
+        for package, seconds in packages[:args.top]:
+            print(f"  {package:<32} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Latency of /submit for cases that match nothing in the case base.
+
+Builds the cbr blueprint on a synthetic case base and posts new cases that
+share only their first symptom with the stored ones, so every request
+takes the unknown-case path: retrieval scores the cases with that symptom,
+finds none above the threshold, and the new case is recorded for review.
+Reports the median and p95 latency per case base size.
+
+/submit on the unknown-case path, 200 requests, Python 3.11 on Linux:
+
+                 second retrieval scan    reused retrieval result
+    cases         p50 ms     p95 ms        p50 ms     p95 ms
+    1,000            5.8       34.2           3.8       16.6
+    100,000         12.4       54.5           7.1       30.2
+
+Usage (from the repository root):
+    python benchmarks/bench_submit.py --sizes 1000 100000 --requests 200
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import synthetic_cases
+from bench_cbr import import_case_based_system
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+
+def unknown_queries(count, seed=1):
+    """
+    Generate new cases that fall below the similarity threshold.
+
+    Returns:
+        list: Form fields for /submit.
+    """
+    queries = []
+    for number, case in enumerate(synthetic_cases.generate_queries(
+            count, seed)):
+        symptoms = [case['Symptoms'][0]] + [
+            f'unrecorded sign {number}-{n}' for n in range(6)]
+        queries.append({
+            'symptoms': ', '.join(symptoms),
+            'animal_age': str(case['Animal Age (Months)']),
+            'animal_sex': case['Animal Sex'],
+            'environmental_conditions': case['Environmental Conditions']
+        })
+    return queries
+
+
+def benchmark_size(cbr, size, requests):
+    """
+    Time /submit for unknown cases against a case base of the given size.
+
+    Returns:
+        list: The latency of each request in seconds.
+    """
+    from AppFactory import create_app
+
+    with tempfile.TemporaryDirectory() as directory:
+        case_path = os.path.join(directory, 'cases.csv')
+        cbr.save_case_database(synthetic_cases.generate_cases(size), case_path)
+        app = create_app(['cbr'], {'CASE_DATABASE': case_path})
+        app.extensions['subsystems'].preload(['case_base'])
+        client = app.test_client()
+
+        latencies = []
+        for form in unknown_queries(requests):
+            start = time.perf_counter()
+            client.post('/submit', data=form)
+            latencies.append(time.perf_counter() - start)
+
+        recorded = len(cbr.load_case_database(case_path)) - size
+        if recorded != requests:
+            raise RuntimeError(
+                f"{requests - recorded} queries matched a stored case")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 100000])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    cbr = import_case_based_system()
+    print(f"{'cases':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for size in args.sizes:
+        latencies = sorted(benchmark_size(cbr, size, args.requests))
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        print(f"{size:>10,}{statistics.median(latencies) * 1000:>10.1f}"
+              f"{p95 * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
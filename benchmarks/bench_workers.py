@@ -0,0 +1,120 @@
+"""
+Memory per worker with and without preloading before fork.
+
+Emulates the gunicorn setup in gunicorn.conf.py on a synthetic case base:
+a master builds the app, optionally preloads the shared subsystems with
+wsgi.preload, and forks N workers that each serve a few requests touching
+the whole case base. Reports each worker's resident (RSS), proportional
+(PSS) and private (USS) memory from /proc/<pid>/smaps_rollup, so Linux
+only.
+
+Usage (from the repository root):
+    python benchmarks/bench_workers.py --cases 100000 --workers 4
+"""
+
+import argparse
+import os
+import signal
+import sys
+import tempfile
+
+import fake_backends
+import synthetic_cases
+from bench_cbr import import_case_based_system
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+
+def memory_kb(pid):
+    """
+    Read the memory summary of a process.
+
+    Returns:
+        dict: 'rss', 'pss' and 'uss' in kB.
+    """
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields['Rss'],
+        'pss': fields['Pss'],
+        'uss': fields['Private_Clean'] + fields['Private_Dirty']
+    }
+
+
+def run_workers(case_path, workers, requests, preload):
+    """
+    Fork workers from a master app and measure each one after its requests.
+
+    Returns:
+        tuple: The master's memory and a list with each worker's.
+    """
+    import wsgi
+    app = wsgi.create_app(['cbr'], {'CASE_DATABASE': case_path})
+    if preload:
+        wsgi.preload(app, ['case_base'])
+
+    children = []
+    for _ in range(workers):
+        ready, done = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready)
+            client = app.test_client()
+            for _ in range(requests):
+                client.get('/unknown_cases')
+            os.write(done, b'1')
+            signal.pause()
+            os._exit(0)
+        os.close(done)
+        children.append((pid, ready))
+
+    results = []
+    for pid, ready in children:
+        os.read(ready, 1)
+        os.close(ready)
+        results.append(memory_kb(pid))
+    master = memory_kb(os.getpid())
+
+    for pid, _ in children:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    return master, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cases', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=5)
+    parser.add_argument('--no-preload', action='store_true')
+    args = parser.parse_args()
+
+    # Importing wsgi builds the default app, with every blueprint
+    fake_backends.install(0, 0, 0)
+    cbr = import_case_based_system()
+    with tempfile.TemporaryDirectory() as directory:
+        case_path = os.path.join(directory, 'cases.csv')
+        cbr.save_case_database(
+            synthetic_cases.generate_cases(args.cases), case_path)
+        master, results = run_workers(
+            case_path, args.workers, args.requests, not args.no_preload)
+
+    mode = 'without' if args.no_preload else 'with'
+    print(f"{args.cases:,} cases, {args.workers} workers, "
+          f"{mode} preload\n")
+    print(f"{'process':<10}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}")
+    rows = [('master', master)] + [
+        (f'worker {n}', result) for n, result in enumerate(results)]
+    for name, result in rows:
+        print(f"{name:<10}{result['rss'] / 1024:>10.1f}"
+              f"{result['pss'] / 1024:>10.1f}{result['uss'] / 1024:>10.1f}")
+    total = sum(result['pss'] for _, result in rows)
+    print(f"\nTotal PSS: {total / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Local stand-ins for the remote services used by the web apps.
+
+install() registers fake `google.cloud.vision`, `google.auth`,
+`ModelInference` and `RetreivalAugmentedGeneration` modules in sys.modules,
+so the apps can be imported and served without credentials or network
+access. Every fake call sleeps for a configurable latency (with jitter)
+and fails with a configurable probability.
+"""
+
+import random
+import sys
+import threading
+import time
+import types
+
+
+class FakeBackendError(RuntimeError):
+    """Raised by a fake backend to simulate an upstream failure."""
+
+
+class Backend:
+    """
+    Latency and failure behaviour of one fake service.
+
+    Args:
+        name (str): The service name, used in error messages.
+        latency (float): The mean latency of a call in seconds.
+        failure_rate (float): The probability that a call fails.
+        jitter (float): The relative spread of the latency, e.g. 0.2 for
+        +/-20%.
+    """
+
+    def __init__(self, name, latency=0.0, failure_rate=0.0, jitter=0.2):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+        self._random = random.Random(name)
+        self._lock = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            spread = self._random.uniform(-self.jitter, self.jitter)
+            failed = self._random.random() < self.failure_rate
+        if self.latency:
+            time.sleep(max(0.0, self.latency * (1 + spread)))
+        if failed:
+            raise FakeBackendError(f"simulated {self.name} failure")
+
+
+def _vision_module(backend):
+    vision = types.ModuleType('google.cloud.vision')
+
+    class Image:
+        def __init__(self, content=None):
+            self.content = content
+            self.source = types.SimpleNamespace(image_uri=None)
+
+    class ImageAnnotatorClient:
+        def __init__(self, credentials=None):
+            self.credentials = credentials
+
+        def web_detection(self, image):
+            backend.call()
+            page = types.SimpleNamespace(url='https://example.org/cattle')
+            entity = types.SimpleNamespace(
+                score=0.9, description='Lumpy skin disease')
+            detection = types.SimpleNamespace(
+                pages_with_matching_images=[page],
+                full_matching_images=[],
+                partial_matching_images=[],
+                web_entities=[entity])
+            return types.SimpleNamespace(web_detection=detection)
+
+    vision.Image = Image
+    vision.ImageAnnotatorClient = ImageAnnotatorClient
+    vision.WebDetection = types.SimpleNamespace
+    return vision
+
+
+def _auth_module():
+    auth = types.ModuleType('google.auth')
+
+    class Credentials:
+        def with_quota_project(self, quota_project_id):
+            return self
+
+    def load_credentials_from_file(path):
+        return Credentials(), 'fake-project'
+
+    auth.load_credentials_from_file = load_credentials_from_file
+    return auth
+
+
+def _model_inference_module(backend):
+    module = types.ModuleType('ModelInference')
+
+    class LLMChain:
+        def invoke(self, input):
+            backend.call()
+            return {'text': f"Fake answer to: {input}"}
+
+        def run(self, Instruction):
+            return self.invoke(Instruction)['text']
+
+    module.llm_chain = LLMChain()
+    return module
+
+
+def _rag_module(embedder, generator):
+    module = types.ModuleType('RetreivalAugmentedGeneration')
+
+    def LLM_Run(question):
+        embedder.call()
+        generator.call()
+        return f"Fake retrieval-augmented answer to: {question}"
+
+    module.LLM_Run = LLM_Run
+    return module
+
+
+def install(llm_latency=0.5, embed_latency=0.05, vision_latency=0.3,
+            failure_rate=0.0):
+    """
+    Register the fake modules in sys.modules.
+
+    Must be called before the app modules are imported.
+
+    Args:
+        llm_latency (float): Mean seconds per LLM generation.
+        embed_latency (float): Mean seconds per query embedding.
+        vision_latency (float): Mean seconds per Vision web detection.
+        failure_rate (float): The probability that any fake call fails.
+
+    Returns:
+        dict: The Backend of each fake service, keyed by name.
+    """
+    backends = {
+        'llm': Backend('llm', llm_latency, failure_rate),
+        'embedder': Backend('embedder', embed_latency, failure_rate),
+        'vision': Backend('vision', vision_latency, failure_rate)
+    }
+
+    google = sys.modules.setdefault('google', types.ModuleType('google'))
+    cloud = types.ModuleType('google.cloud')
+    cloud.vision = _vision_module(backends['vision'])
+    google.cloud = cloud
+    google.auth = _auth_module()
+
+    sys.modules['google.cloud'] = cloud
+    sys.modules['google.cloud.vision'] = cloud.vision
+    sys.modules['google.auth'] = google.auth
+    sys.modules['ModelInference'] = _model_inference_module(backends['llm'])
+    sys.modules['RetreivalAugmentedGeneration'] = _rag_module(
+        backends['embedder'], backends['llm'])
+
+    return backends
@@ -0,0 +1,235 @@
+"""
+Load test for App1 with local fake backends.
+
+Starts App1 in-process on a threaded WSGI server, with the LLM, embedder
+and Vision replaced by the fakes in fake_backends.py, and drives /submit,
+/query, /upload and /unknown_cases with a weighted mix of requests from
+concurrent clients. Reports throughput, p50/p95/p99 latency and the error
+rate per endpoint. Everything runs locally, without network access, in a
+scratch copy of the case base so `FMD cases.csv` is left untouched.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py --users 16 --duration 30
+    python benchmarks/load_test.py --llm-latency 1.0 --failure-rate 0.02 \\
+        --mix submit=5,query=3,upload=1,unknown_cases=1
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+import fake_backends
+import synthetic_cases
+
+sys.path.insert(0, synthetic_cases.REPO_ROOT)
+
+SAMPLE_IMAGE = os.path.join(
+    synthetic_cases.REPO_ROOT, 'uploads',
+    'cattle_Lumpyskindisease_AnetZaal.jpg')
+QUESTIONS = [
+    "Do bulls show signs of Trichomoniasis?",
+    "What are the risk factors for lameness in dairy cows?",
+    "How is foot-and-mouth disease spread?",
+    "How do I prevent mastitis in my herd?"
+]
+
+
+def start_server(workdir):
+    """
+    Import App1 inside the scratch directory and serve it on a free port.
+
+    Returns:
+        tuple: The base URL and the werkzeug server.
+    """
+    from werkzeug.serving import make_server
+
+    os.chdir(workdir)
+    import App1
+
+    # One access log line per request would swamp the report
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, App1.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def _multipart(field, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; '
+        f'filename="{filename}"\r\n'
+        f"Content-Type: image/jpeg\r\n\r\n").encode() + content + (
+        f"\r\n--{boundary}--\r\n").encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def build_request(operation, base_url, rng, queries, image):
+    """Build the urllib request for one operation of the mix."""
+    if operation == 'submit':
+        new_case = rng.choice(queries)
+        data = urllib.parse.urlencode({
+            'symptoms': ', '.join(new_case['Symptoms']),
+            'animal_age': new_case['Animal Age (Months)'],
+            'animal_sex': new_case['Animal Sex'],
+            'environmental_conditions':
+                new_case['Environmental Conditions']
+        }).encode()
+        return urllib.request.Request(f"{base_url}/submit", data=data)
+
+    if operation == 'query':
+        data = json.dumps({'query': rng.choice(QUESTIONS),
+                           'model_no': rng.choice([1, 2])}).encode()
+        return urllib.request.Request(
+            f"{base_url}/query", data=data,
+            headers={'Content-Type': 'application/json'})
+
+    if operation == 'upload':
+        # Vary the bytes so some uploads are new and some are duplicates
+        content = image + bytes([rng.randrange(8)])
+        body, content_type = _multipart('file', 'cow.jpg', content)
+        return urllib.request.Request(
+            f"{base_url}/upload", data=body,
+            headers={'Content-Type': content_type})
+
+    return urllib.request.Request(f"{base_url}/unknown_cases")
+
+
+def run_client(base_url, mix, deadline, seed, queries, image, results):
+    rng = random.Random(seed)
+    operations = list(mix)
+    weights = [mix[operation] for operation in operations]
+
+    while time.monotonic() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        request = build_request(operation, base_url, rng, queries, image)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+            ok = True
+        except (urllib.error.URLError, OSError):
+            ok = False
+        results.append((operation, time.perf_counter() - start, ok))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(results, elapsed):
+    """
+    Summarise the raw (operation, seconds, ok) results.
+
+    Returns:
+        dict: Per endpoint and in total, the request count, throughput,
+        error rate and p50/p95/p99 latency in milliseconds.
+    """
+    groups = {'total': results}
+    for result in results:
+        groups.setdefault(result[0], []).append(result)
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = sorted(seconds for _, seconds, _ in group)
+        errors = sum(1 for _, _, ok in group if not ok)
+        summary[name] = {
+            'requests': len(group),
+            'throughput_rps': len(group) / elapsed,
+            'error_rate': errors / len(group) if group else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000
+        }
+    return summary
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=8,
+                        help='number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=20.0,
+                        help='seconds to run the load for')
+    parser.add_argument('--mix',
+                        default='submit=4,query=3,upload=2,unknown_cases=1')
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--embed-latency', type=float, default=0.05)
+    parser.add_argument('--vision-latency', type=float, default=0.3)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--output', default=None,
+                        help='write the summary to this JSON file')
+    args = parser.parse_args()
+
+    fake_backends.install(args.llm_latency, args.embed_latency,
+                          args.vision_latency, args.failure_rate)
+
+    workdir = tempfile.mkdtemp(prefix='cbr-load-')
+    cwd = os.getcwd()
+    try:
+        shutil.copy(synthetic_cases.DEFAULT_CSV, workdir)
+        base_url, server = start_server(workdir)
+
+        queries = synthetic_cases.generate_queries(200, seed=7)
+        with open(SAMPLE_IMAGE, 'rb') as file:
+            image = file.read()
+        mix = parse_mix(args.mix)
+
+        results = []
+        deadline = time.monotonic() + args.duration
+        start = time.perf_counter()
+        clients = [
+            threading.Thread(target=run_client, args=(
+                base_url, mix, deadline, seed, queries, image, results))
+            for seed in range(args.users)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(results, elapsed)
+    print(f"{args.users} users for {elapsed:.1f}s "
+          f"(LLM {args.llm_latency}s, embedder {args.embed_latency}s, "
+          f"Vision {args.vision_latency}s, "
+          f"failure rate {args.failure_rate:.1%})\n")
+    print(f"{'endpoint':<15}{'requests':>9}{'req/s':>9}{'errors':>9}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in sorted(summary, key=lambda name: (name == 'total', name)):
+        stats = summary[name]
+        print(f"{name:<15}{stats['requests']:>9}"
+              f"{stats['throughput_rps']:>9.1f}{stats['error_rate']:>9.1%}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+              f"{stats['p99_ms']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
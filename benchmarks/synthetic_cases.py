@@ -0,0 +1,111 @@
+"""
+Synthetic FMD-style case generator for the CBR benchmarks.
+
+Per-diagnosis profiles (symptoms, ages, sexes, environments, treatments and
+outcomes) are learnt from `FMD cases.csv`, and cases are sampled from them
+with a seeded random generator, so the same size and seed always produce
+the same case base.
+"""
+
+import csv
+import os
+import random
+from collections import defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CSV = os.path.join(REPO_ROOT, 'FMD cases.csv')
+
+
+def load_profiles(file_path=DEFAULT_CSV):
+    """
+    Build a sampling profile per diagnosis from the real case base.
+
+    Args:
+        file_path (str): The path to the CSV file containing the dataset.
+
+    Returns:
+        dict: Per diagnosis, the observed symptoms, symptom counts, ages,
+        sexes, environments, treatments and outcomes, plus the number of
+        cases ('weight') used to pick diagnoses.
+    """
+    profiles = defaultdict(lambda: defaultdict(list))
+
+    with open(file_path, 'r') as file:
+        for row in csv.DictReader(file):
+            profile = profiles[row['Diagnosis']]
+            symptoms = row['Symptoms'].split(', ')
+            profile['symptoms'].extend(symptoms)
+            profile['symptom_counts'].append(len(symptoms))
+            profile['ages'].append(int(row['Animal Age (Months)']))
+            profile['sexes'].append(row['Animal Sex'])
+            profile['environments'].append(row['Environmental Conditions'])
+            profile['treatments'].append(row['Treatment'].split(', '))
+            profile['outcomes'].append(row['Outcome'])
+
+    for profile in profiles.values():
+        profile['symptoms'] = sorted(set(profile['symptoms']))
+        profile['weight'] = len(profile['ages'])
+
+    return {diagnosis: dict(profile)
+            for diagnosis, profile in profiles.items()}
+
+
+def _sample_case(rng, diagnosis, profile):
+    count = min(rng.choice(profile['symptom_counts']),
+                len(profile['symptoms']))
+    age = max(1, rng.choice(profile['ages']) + rng.randint(-6, 6))
+    return {
+        'Symptoms': rng.sample(profile['symptoms'], count),
+        'Animal Age (Months)': age,
+        'Animal Sex': rng.choice(profile['sexes']),
+        'Environmental Conditions': rng.choice(profile['environments']),
+        'Diagnosis': diagnosis,
+        'Treatment': list(rng.choice(profile['treatments'])),
+        'Outcome': rng.choice(profile['outcomes'])
+    }
+
+
+def generate_cases(size, seed=0, profiles=None):
+    """
+    Generate a synthetic case database.
+
+    Args:
+        size (int): The number of cases.
+        seed (int): The random seed.
+        profiles (dict): Profiles from load_profiles; loaded from the
+        default CSV when omitted.
+
+    Returns:
+        dict: A case database keyed by case ID, in the same format as
+        load_case_database.
+    """
+    profiles = profiles or load_profiles()
+    rng = random.Random(seed)
+    diagnoses = sorted(profiles)
+    weights = [profiles[diagnosis]['weight'] for diagnosis in diagnoses]
+
+    case_database = {}
+    for number, diagnosis in enumerate(
+            rng.choices(diagnoses, weights, k=size), start=1):
+        case_database[f"CASE{number:03d}"] = _sample_case(
+            rng, diagnosis, profiles[diagnosis])
+    return case_database
+
+
+def generate_queries(count, seed=1, profiles=None):
+    """
+    Generate new cases to query the case base with.
+
+    Args:
+        count (int): The number of queries.
+        seed (int): The random seed; use a different one from the case
+        base so queries are not copies of stored cases.
+        profiles (dict): Profiles from load_profiles.
+
+    Returns:
+        list: New case dictionaries without diagnosis, treatment or outcome.
+    """
+    queries = generate_cases(count, seed, profiles).values()
+    return [{key: case[key] for key in (
+        'Symptoms', 'Animal Age (Months)', 'Animal Sex',
+        'Environmental Conditions')} for case in queries]
@@ -11,16 +11,15 @@ Original file is located at
 **Installing dependencies**
 """
 
-import json
 import requests
 import os
 from gradientai import Gradient
 from langchain.chains import LLMChain
 from langchain.llms import GradientLLM
 from langchain.prompts import PromptTemplate
-import re
-from nltk.translate.bleu_score import corpus_bleu
-from rouge import Rouge
+import DatasetLoader
+import DatasetPreparation
+import EvaluationHarness
 from gradient_haystack.embedders \
     .gradient_document_embedder import GradientDocumentEmbedder
 
@@ -51,23 +50,17 @@ from haystack.components.builders.answer_builder import AnswerBuilder
 """## **1.Loading the Dataset**"""
 
 
-# URL of the online repository where the dataset is hosted
-dataset_url = "https://raw.githubusercontent.com/swafey-karanja/"
-"Model-training/main/NewData.json"
+# Download NewData.json once into a local cache; later runs work offline
+dataset_path = DatasetLoader.fetch(DatasetLoader.DATASET_URL, 'NewData.json')
 
-# Make an HTTP GET request to fetch the dataset
-response = requests.get(dataset_url)
+# Stream the samples into the columnar cache that batching and evaluation
+# read from, without loading the whole dataset into memory
+prepared_dataset = DatasetPreparation.load_or_prepare(
+    'dataset_cache', DatasetPreparation.file_source(dataset_path),
+    lambda: DatasetLoader.iter_samples(dataset_path))
 
-# Check if the request was successful (status code 200)
-if response.status_code == 200:
-    # Load the dataset from the response content
-    train_dataset = json.loads(response.text)
-
-    # Print the size of the dataset
-    print("Dataset Size:", len(train_dataset))
-else:
-    # Print an error message if the request failed
-    print("Failed to fetch dataset. Status code:", response.status_code)
+# Print the size of the dataset
+print("Dataset Size:", len(prepared_dataset))
 
 """**Break the data into batches**"""
 
@@ -86,7 +79,7 @@ def divide_into_Batches(number, chunk_size):
     return Batches
 
 
-Batches = divide_into_Batches(len(train_dataset), 100)
+Batches = divide_into_Batches(len(prepared_dataset), 100)
 # Divide the dataset into chunks of 100 samples each
 print("Batches size")
 print(Batches)
@@ -216,21 +209,22 @@ captured in the original model.
 #     print(f"Fine-tuning the model, iteration {count + 1}")
 #     s = 0
 #     n = 1
-#     for Batch in Batches:
-#         print(f"Batch {n} range: {s} : {(s + Batch)}")
+#     # Stream shuffled batches of 100 samples straight from the cached file
+#     for Batch in DatasetLoader.iter_batches(
+#             dataset_path, batch_size=100, shuffle=True, seed=count):
+#         print(f"Batch {n} range: {s} : {(s + len(Batch))}")
 
 #         # Try to fine-tune the model with the chunk of samples,
 #         while True:
 #             try:
-#                 metric = Fine_Tune__adapter.fine_tune(
-#                           samples=train_dataset[s: s + Batch])
+#                 metric = Fine_Tune__adapter.fine_tune(samples=Batch)
 #                 print(f"\t Batch {n} Evaluation :", metric)
 #                 break
 #             except:
 #                 pass
 
 
-#         s += Batch
+#         s += len(Batch)
 #         n += 1
 #     count = count + 1
 
@@ -323,96 +317,29 @@ the target response.
 """
 
 
-def compute_rouge_scores(hypotheses, references):
-    rouge = Rouge()
-    scores = rouge.get_scores(hypotheses, references, avg=True)
-    return scores
-
-
-def compute_bleu_score(target_response, llm_responses):
-    bleu_score = corpus_bleu([target_response.split()],
-                             [llm_responses.split()])  # Calculate BLEU score
-    return bleu_score
-
-
-def Find_Instruction(input_pattern, input_string):
-    matches = re.findall(input_pattern, input_string, re.DOTALL)
-
-    # If there are matches, extract the first one
-    extracted_string = None
-    if matches:
-        extracted_string = matches[0]
-
-    return extracted_string
-
-
-def Evaluate(Sample=None, count=0):
+def Evaluate(Sample=None, count=0, checkpoint_path=None, max_workers=4):
     print("\n =================================== "
           "Evaluation =================================== ")
-    input_pattern = r'<s>### Instruction:\n(.*?) \n'
-    response_pattern = r'Response:\n(.*?)</s>'
-    bleu_scoreS = []
-    rouge_scoreS = []
-
-    if count != 0:
-        iteration = count - 1
-    else:
-        iteration = count
-
-    while iteration >= 0:
-
-        input_query = Find_Instruction(
-            input_pattern, Sample[iteration]["inputs"])
-        target_response = Find_Instruction(
-            response_pattern, Sample[iteration]["inputs"])
-
-        if input_query and target_response is not None:
-            print("\n --------------------------------"
-                  "-------------------------------")
-            print("INPUT QUERY:\n", input_query)
-            print("\nTARGET RESPONSE:\n", target_response)
-
-            llm_responses = llm_chain.run(Instruction=f"{input_query}")
-            print("\nLLM RESPONSE:\n", llm_responses)
-
-            rouge_scores = compute_rouge_scores(llm_responses, target_response)
-
-            bleu_score = compute_bleu_score(target_response, llm_responses)
-            print("\nBLEU Score:", bleu_score)
-            print("ROUGE Scores:")
-            print("\tROUGE-1 F1 Score:", rouge_scores["rouge-1"]["f"])
-            print("\tROUGE-2 F1 Score:", rouge_scores["rouge-2"]["f"])
-            print("\tROUGE-L F1 Score:", rouge_scores["rouge-l"]["f"])
-            rouge_scoreS.append((rouge_scores["rouge-1"]["f"],
-                                 rouge_scores["rouge-2"]["f"],
-                                 rouge_scores["rouge-l"]["f"]))
-            bleu_scoreS.append(bleu_score)
-
-        iteration -= 1
-
-    if count > 0:
-        rouge_scores1 = 0
-        rouge_scores2 = 0
-        rouge_scores3 = 0
-        bleu_scoreA = 0
-
-        for i in bleu_scoreS:
-            bleu_scoreA += i
-        for i in rouge_scoreS:
-            rouge_scores1 += i[0]
-            rouge_scores2 += i[1]
-            rouge_scores3 += i[2]
-
-        print("\nAverageBLEU Score:", bleu_scoreA)
-        print(f"Average ROUGE Scores for {count} samples")
-        print("\tAverage ROUGE-1 F1 Score:", rouge_scores1 / count)
-        print("\tAverage ROUGE-2 F1 Score:", rouge_scores2 / count)
-        print("\tAverageROUGE-L F1 Score:", rouge_scores3 / count)
-
+    # Generations run concurrently and BLEU/ROUGE are computed once over
+    # the whole set, see EvaluationHarness.py
+    report, records = EvaluationHarness.evaluate(
+        Sample.pairs(stop=max(count, 1)),
+        lambda input_query: llm_chain.run(Instruction=f"{input_query}"),
+        checkpoint_path, max_workers)
+
+    for record in records:
+        print("\n --------------------------------"
+              "-------------------------------")
+        print("INPUT QUERY:\n", record['instruction'])
+        print("\nTARGET RESPONSE:\n", record['target'])
+        print("\nLLM RESPONSE:\n",
+              record.get('response', record.get('error')))
+
+    EvaluationHarness.print_report(report)
     print("\n ---------------------------------------------------------------")
 
 
-Evaluate(Sample=train_dataset, count=3)  # one sample evaluation
+Evaluate(Sample=prepared_dataset, count=3)  # one sample evaluation
 
 """ ## **7. Intergrating  Retreival-Augmented Generation**
 
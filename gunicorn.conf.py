@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for wsgi:app.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is preloaded in the master and the workers are forked from it (see
+wsgi.py). When `FMD cases.csv` changes, the master re-reads it and sends
+itself SIGHUP: gunicorn then forks fresh workers from the updated master
+and lets the old ones finish their in-flight requests before exiting.
+Workers notice the change on their own as well, but each would then parse
+a private copy of the case base instead of sharing the master's.
+"""
+
+import os
+import signal
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+# LLM and Vision calls can take tens of seconds
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+
+
+def when_ready(server):
+    import wsgi
+
+    wsgi.preload(wsgi.app)
+    if 'cbr' in wsgi.app.blueprints:
+        wsgi.watch_file(
+            wsgi.app.config['CASE_DATABASE'],
+            lambda: os.kill(os.getpid(), signal.SIGHUP),
+            float(os.environ.get('CASE_RELOAD_INTERVAL', 10)))
+
+
+def on_reload(server):
+    import wsgi
+
+    # Runs in the master's main thread before the new workers are forked
+    wsgi.reload_case_base(wsgi.app)
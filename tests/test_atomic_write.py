@@ -0,0 +1,51 @@
+import os
+import stat
+
+import pytest
+
+import AtomicWrite
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_a_new_file_gets_the_umask_default_mode(tmp_path):
+    path = str(tmp_path / 'config.json')
+    umask = os.umask(0o022)
+    try:
+        with AtomicWrite.replacing(path) as temp_path:
+            with open(temp_path, 'w') as file:
+                file.write('{}')
+    finally:
+        os.umask(umask)
+
+    assert mode(path) == 0o644
+    assert os.listdir(tmp_path) == ['config.json']
+
+
+def test_a_replaced_file_keeps_its_mode(tmp_path):
+    path = tmp_path / 'cases.csv'
+    path.write_text('old')
+    os.chmod(path, 0o640)
+
+    with AtomicWrite.replacing(str(path)) as temp_path:
+        with open(temp_path, 'w') as file:
+            file.write('new')
+
+    assert path.read_text() == 'new'
+    assert mode(path) == 0o640
+
+
+def test_a_failed_write_leaves_the_file_alone(tmp_path):
+    path = tmp_path / 'cases.csv'
+    path.write_text('old')
+
+    with pytest.raises(RuntimeError):
+        with AtomicWrite.replacing(str(path)) as temp_path:
+            with open(temp_path, 'w') as file:
+                file.write('partial')
+            raise RuntimeError
+
+    assert path.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['cases.csv']
@@ -0,0 +1,47 @@
+import collections
+import os
+
+import CaseBaseMaintenance
+import CaseBasedSystem
+from conftest import REPO_ROOT
+
+CASE_DATABASE = os.path.join(REPO_ROOT, 'FMD cases.csv')
+
+
+def weighted_counts(case_database, field):
+    counts = collections.Counter()
+    for case in case_database.values():
+        values = case[field] if isinstance(case[field], list) else \
+            [case[field]]
+        for value in values:
+            counts[case['Diagnosis'], value] += \
+                CaseBasedSystem.case_weight(case)
+    return counts
+
+
+def test_merging_keeps_the_outcome_and_treatment_counts():
+    case_database = CaseBasedSystem.load_case_database(CASE_DATABASE)
+
+    condensed, report = CaseBaseMaintenance.condense(
+        case_database, CaseBasedSystem.weights)
+
+    assert report['kept'] < len(case_database)
+    for field in ('Outcome', 'Treatment'):
+        assert weighted_counts(condensed, field) == \
+            weighted_counts(case_database, field)
+
+
+def test_cases_with_different_outcomes_are_not_merged():
+    case = {'Symptoms': ['fever', 'lameness'], 'Animal Age (Months)': 24,
+            'Environmental Conditions': 'Wet pasture',
+            'Diagnosis': 'Foot-and-Mouth Disease',
+            'Treatment': ['Antibiotics'], 'Outcome': 'Recovered'}
+    case_database = {'CASE1': case, 'CASE2': dict(case),
+                     'CASE3': dict(case, Outcome='Died')}
+
+    prototypes = CaseBaseMaintenance.merge_redundant(
+        case_database, CaseBasedSystem.weights)
+
+    assert sorted(prototypes) == ['CASE1', 'CASE3']
+    assert CaseBasedSystem.case_weight(prototypes['CASE1']) == 2
+    assert CaseBasedSystem.case_weight(prototypes['CASE3']) == 1
@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import shutil
+
+import pytest
+
+import AppFactory
+import CaseBasedSystem
+import CaseIndex
+import CBRRoutes
+from conftest import REPO_ROOT
+
+CASE_DATABASE = os.path.join(REPO_ROOT, 'FMD cases.csv')
+
+
+@pytest.fixture
+def client(tmp_path):
+    case_database = str(tmp_path / 'cases.csv')
+    shutil.copyfile(CASE_DATABASE, case_database)
+    app = AppFactory.create_app('cbr', {
+        'CASE_DATABASE': case_database,
+        'CBR_CONFIG': str(tmp_path / 'cbr_config.json')})
+    return app.test_client()
+
+
+def test_stats_lists_the_treatments_and_outcomes_most_frequent_first(client):
+    response = client.get('/api/stats',
+                          query_string={'diagnosis': 'Foot-and-Mouth Disease'})
+
+    assert response.status_code == 200
+    summary = response.get_json()
+    for field in ('treatments', 'outcomes'):
+        counts = [count for _, count in summary[field]]
+        assert counts == sorted(counts, reverse=True)
+    # Not alphabetical, as a JSON object with sorted keys would be
+    assert summary['outcomes'][0][0] == 'Recovered'
+
+
+def test_stats_of_an_unknown_diagnosis_is_not_found(client):
+    response = client.get('/api/stats', query_string={'diagnosis': 'Rabies'})
+
+    assert response.status_code == 404
+
+
+def test_a_view_keeps_the_stats_of_its_version():
+    case_database = CaseBasedSystem.load_case_database(CASE_DATABASE)
+    index = CaseIndex.CaseIndex.from_case_database(case_database)
+    index.add_index('stats', CaseIndex.DiagnosisStats)
+    old = index.view()
+    stats = old.derived('stats')
+    case_id, case = next(
+        (case_id, case) for case_id, case in case_database.items()
+        if case['Diagnosis'] == 'Foot-and-Mouth Disease')
+    before = stats.summary(old, 'Foot-and-Mouth Disease')
+
+    new = index.update(case_id, dict(case, Outcome='Died'))
+
+    assert stats.summary(old, 'Foot-and-Mouth Disease') == before
+    outcomes = dict(stats.summary(new, 'Foot-and-Mouth Disease')['outcomes'])
+    assert outcomes['Died'] == CaseBasedSystem.case_weight(case)
+
+
+def _allocate(path, count, queue):
+    allocator = CBRRoutes.CaseIdAllocator(path)
+    queue.put([allocator.allocate() for _ in range(count)])
+
+
+def test_processes_never_allocate_the_same_case_id(tmp_path):
+    path = str(tmp_path / 'cases.ids.json')
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    workers = [context.Process(target=_allocate, args=(path, 50, queue))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    case_ids = [case_id for _ in workers for case_id in queue.get()]
+    for worker in workers:
+        worker.join()
+
+    assert len(set(case_ids)) == 200
+    assert sorted(os.listdir(tmp_path)) == ['cases.ids.json',
+                                            'cases.ids.json.lock']
@@ -0,0 +1,39 @@
+import io
+
+import pytest
+from PIL import Image
+
+import AppFactory
+import LocalImageSearch
+
+
+@pytest.fixture
+def client(tmp_path):
+    gallery = tmp_path / 'gallery' / 'healthy'
+    gallery.mkdir(parents=True)
+    Image.new('RGB', (32, 32), (40, 128, 75)).save(gallery / 'cow.png')
+    index_path = str(tmp_path / 'gallery_index.npz')
+    LocalImageSearch.build_index(str(tmp_path / 'gallery'), index_path)
+
+    app = AppFactory.create_app('images', {
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'GALLERY_INDEX': index_path})
+    return app.test_client()
+
+
+def test_upload_rejects_a_file_that_is_not_an_image(client):
+    response = client.post('/upload', data={
+        'file': (io.BytesIO(b'not an image'), 'notes.jpg')})
+
+    assert response.status_code == 400
+    assert b'could not be read as an image' in response.data
+
+
+def test_upload_matches_a_gallery_image(client):
+    image = io.BytesIO()
+    Image.new('RGB', (32, 32), (40, 128, 75)).save(image, 'PNG')
+    image.seek(0)
+    response = client.post('/upload', data={'file': (image, 'cow.png')})
+
+    assert response.status_code == 200
+    assert b'Gallery Diagnosis: healthy' in response.data